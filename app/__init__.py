@@ -4,7 +4,7 @@ Expense Receipt Manager — Flask application factory.
 import logging
 import os
 
-from flask import Flask, render_template
+from flask import Flask, render_template, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 from werkzeug.exceptions import RequestEntityTooLarge
@@ -36,21 +36,43 @@ def create_app(config_name: str | None = None) -> Flask:
     db.init_app(app)
     csrf.init_app(app)
 
+    from app.services.cache import receipt_card
+    from app.services.pagination import page_url
+
+    app.add_template_global(page_url)
+    app.add_template_global(receipt_card)
+
     @app.errorhandler(RequestEntityTooLarge)
     def request_entity_too_large(e):
         app.logger.warning("Upload rejected: body too large")
-        return render_template("errors/413.html"), 413
+        limit_mb = (request.max_content_length or 0) // (1024 * 1024)
+        return render_template("errors/413.html", limit_mb=limit_mb), 413
 
     with app.app_context():
-        from app import models  # noqa: F401 — register models before create_all
-        from app.routes import export, home, receipts, reports, search, tags
+        from app import models  # noqa: F401 — register models before the schema check
+        from app.routes import export, home, metrics, receipts, reports, search, tags, uploads
 
         app.register_blueprint(home.bp)
         app.register_blueprint(receipts.bp)
+        app.register_blueprint(uploads.bp)
         app.register_blueprint(search.bp)
         app.register_blueprint(export.bp)
         app.register_blueprint(reports.bp)
         app.register_blueprint(tags.bp)
-        db.create_all()
+        app.register_blueprint(metrics.bp)
+
+        from app.services.migrations import init_schema
+        from app.services.sqlite_tuning import configure_sqlite
+
+        configure_sqlite(app)
+        init_schema(app)
+
+        from app.services.instrumentation import init_instrumentation
+
+        init_instrumentation(app)
+
+    from app.cli import register_cli
+
+    register_cli(app)
 
     return app
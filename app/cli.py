@@ -0,0 +1,189 @@
+"""
+Flask CLI commands. Run with `flask --app wsgi <command>` from the app directory.
+"""
+import click
+from flask import Flask, current_app
+
+
+def register_cli(app: Flask) -> None:
+    @app.cli.group("db")
+    def db_cli():
+        """Schema migrations and data backfills."""
+
+    @db_cli.command("upgrade")
+    @click.option("--no-backfill", is_flag=True, help="Only migrate the schema; leave backfills to the OCR worker.")
+    def db_upgrade(no_backfill):
+        """Apply pending migrations, then run unfinished backfills."""
+        from app.services.backfill import pending_backfills, run_backfill
+        from app.services.migrations import upgrade
+
+        applied = upgrade()
+        click.echo(f"Applied {len(applied)} migration(s)." if applied else "Schema is up to date.")
+        if no_backfill:
+            return
+        for name in pending_backfills():
+            click.echo(f"Backfill {name}…")
+            run_backfill(name, current_app.config["BACKFILL_BATCH_SIZE"])
+        click.echo("Backfills done.")
+
+    @db_cli.command("status")
+    def db_status():
+        """Show schema version, pending migrations, backfill progress and missing indexes."""
+        from app.services.backfill import progress
+        from app.services.migrations import status
+        from app.services.sqlite_tuning import missing_indexes
+
+        s = status()
+        click.echo(f"schema version {s['version']} of {s['latest']}")
+        for name in s["pending"]:
+            click.echo(f"  pending: {name}")
+        for name, p in progress().items():
+            state = "done" if p["finished_at"] else f"at id {p['last_id']}"
+            click.echo(f"backfill {name}: {state}, {p['rows_done']} row(s) updated")
+        for name in missing_indexes():
+            click.echo(f"missing index: {name}")
+
+    @db_cli.command("backfill")
+    @click.option("--batch-size", type=int, default=None, help="Rows per transaction (default: BACKFILL_BATCH_SIZE).")
+    @click.option("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+    def db_backfill(batch_size, pause):
+        """Run unfinished backfills in resumable batches."""
+        from app.services.backfill import pending_backfills, run_backfill
+
+        names = pending_backfills()
+        for name in names:
+            click.echo(f"Backfill {name}…")
+            run_backfill(name, batch_size or current_app.config["BACKFILL_BATCH_SIZE"], pause)
+        click.echo(f"{len(names)} backfill(s) run.")
+
+    @app.cli.command("ocr-worker")
+    @click.option("--workers", type=int, default=None, help="Process pool size (default: OCR_WORKERS).")
+    @click.option("--once", is_flag=True, help="Drain the queue, then exit.")
+    def ocr_worker(workers, once):
+        """Run the background OCR worker."""
+        from app.services.jobs import run_worker
+
+        run_worker(current_app._get_current_object(), workers=workers, once=once)
+
+    @app.cli.command("ocr-requeue")
+    @click.option("--all", "requeue_all", is_flag=True, help="Re-run OCR for every receipt, not just failed ones.")
+    def ocr_requeue(requeue_all):
+        """Queue failed (or all) receipts for OCR again."""
+        from app.services.jobs import requeue_ocr
+
+        count = requeue_ocr(failed_only=not requeue_all, batch_size=current_app.config["BACKFILL_BATCH_SIZE"])
+        click.echo(f"Queued {count} receipt(s) for OCR.")
+
+    @app.cli.command("receipts-reparse")
+    @click.option("--batch-size", type=int, default=None, help="Rows per transaction (default: BACKFILL_BATCH_SIZE).")
+    @click.option("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+    def receipts_reparse(batch_size, pause):
+        """Re-extract total, tax and currency from the stored OCR text of every receipt."""
+        from app.services.backfill import progress, reset, run_backfill
+
+        reset("receipts_amounts")
+        run_backfill("receipts_amounts", batch_size or current_app.config["BACKFILL_BATCH_SIZE"], pause)
+        click.echo(f"Updated {progress()['receipts_amounts']['rows_done']} receipt(s).")
+
+    @app.cli.command("ocr-cache-stats")
+    @click.option("--clear", is_flag=True, help="Empty the cache and reset counters.")
+    def ocr_cache_stats(clear):
+        """Show OCR cache hit/miss counters and size."""
+        from app.services import ocr_cache
+
+        path = current_app.config["OCR_CACHE_PATH"]
+        if not path:
+            raise click.ClickException("OCR cache is disabled (OCR_CACHE_PATH is empty).")
+        if clear:
+            ocr_cache.clear(path)
+        s = ocr_cache.stats(path)
+        lookups = s["hits"] + s["misses"]
+        rate = f"{100 * s['hits'] / lookups:.1f}%" if lookups else "n/a"
+        click.echo(
+            f"entries={s['entries']} bytes={s['bytes']} hits={s['hits']} misses={s['misses']} "
+            f"evictions={s['evictions']} hit_rate={rate}"
+        )
+
+    @app.cli.command("search-reindex")
+    def search_reindex():
+        """Rebuild the full-text search index from all receipts."""
+        from app.services.search_index import fts_enabled, rebuild_search_index
+
+        if not fts_enabled():
+            raise click.ClickException("Full-text search is disabled or SQLite FTS5 is unavailable.")
+        count = rebuild_search_index()
+        click.echo(f"Indexed {count} receipt(s).")
+
+    @app.cli.command("rollup-rebuild")
+    @click.option("--check", is_flag=True, help="Only report drift; do not rebuild.")
+    def rollup_rebuild(check):
+        """Check the report rollups against receipts and rebuild them."""
+        from app.services.rollup import check_rollups, rebuild_rollups
+
+        drift = check_rollups()
+        for table, n in drift.items():
+            click.echo(f"{table}: {n} drifted bucket(s)")
+        if check:
+            if any(drift.values()):
+                raise SystemExit(1)
+            return
+        rebuild_rollups()
+        click.echo("Rollups rebuilt.")
+
+    @app.cli.command("merchants-build")
+    @click.option("--rebuild", is_flag=True, help="Forget all merchants and aliases and learn them again.")
+    @click.option("--threshold", type=float, default=None,
+                  help="Similarity needed to merge spellings, 0..1 (default: MERCHANT_MATCH_THRESHOLD).")
+    def merchants_build(rebuild, threshold):
+        """Learn the merchant dictionary from existing receipts and set their merchant_id."""
+        from app.services.merchants import build_dictionary
+
+        stats = build_dictionary(rebuild=rebuild, threshold=threshold)
+        click.echo(
+            f"{stats['spellings']} spelling(s) -> {stats['merchants']} merchant(s), "
+            f"{stats['aliases']} alias(es); {stats['receipts_updated']} receipt(s) updated."
+        )
+
+    @app.cli.command("storage-dedupe")
+    @click.option("--dry-run", is_flag=True, help="Only report what would change.")
+    def storage_dedupe(dry_run):
+        """Rehash UPLOAD_FOLDER into content-addressed storage and merge duplicate receipts."""
+        from app.services.dedupe import rehash_and_dedupe
+
+        stats = rehash_and_dedupe(current_app.config["UPLOAD_FOLDER"], dry_run=dry_run)
+        prefix = "Would have: " if dry_run else ""
+        click.echo(
+            f"{prefix}moved {stats['moved']}, merged {stats['merged']} duplicate(s); "
+            f"{stats['unchanged']} unchanged, {stats['missing']} missing file(s)."
+        )
+
+    @app.cli.command("uploads-cleanup")
+    @click.option("--max-age", type=int, default=None, help="Idle seconds before a session is removed (default: UPLOAD_SESSION_TTL).")
+    def uploads_cleanup(max_age):
+        """Delete abandoned chunked upload sessions and their staging files."""
+        from app.services.chunked_upload import cleanup_sessions
+
+        cfg = current_app.config
+        removed = cleanup_sessions(cfg["UPLOAD_FOLDER"], cfg["UPLOAD_SESSION_TTL"] if max_age is None else max_age)
+        click.echo(f"Removed {removed} upload session(s).")
+
+    @app.cli.command("cache-stats")
+    @click.option("--clear", is_flag=True, help="Invalidate all entries (every process) and empty the shared file.")
+    def cache_stats(clear):
+        """Show the shared application cache size; hit rates per process are on /metrics."""
+        from app.services import cache
+        from app.services.sqlite_tuning import immediate_transaction
+
+        path = current_app.config["CACHE_PATH"]
+        if clear:
+            # New versions make every process's entries unreachable
+            with immediate_transaction() as conn:
+                conn.exec_driver_sql("UPDATE cache_versions SET version = version + 1")
+            if path:
+                cache.clear_shared(path)
+            click.echo("Cache invalidated.")
+        if not path:
+            click.echo("No shared cache file (CACHE_PATH is empty); entries live in each process only.")
+            return
+        shared = cache.stats(path)["shared"]
+        click.echo(f"entries={shared['entries']} bytes={shared['bytes']}")
@@ -19,11 +19,112 @@ class Config:
         "DATABASE_URI"
     ) or f"sqlite:///{INSTANCE_PATH / 'receipts.db'}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Apply pending schema migrations at startup; set AUTO_MIGRATE=0 to require `flask db upgrade`
+    AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "1") != "0"
+    BACKFILL_BATCH_SIZE = 500  # rows per backfill transaction
+    BACKFILL_RECHECK_SECONDS = 30  # how often a web process re-reads which backfills are unfinished
+    # Applied to every new SQLite connection (services/sqlite_tuning.py); None skips a pragma
+    SQLITE_PRAGMAS = {
+        "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE") or "WAL",
+        "synchronous": "NORMAL",  # durable in WAL mode except for the last commits on power loss
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT") or 5000),  # ms to wait for a lock
+        "cache_size": -16000,  # KiB (negative) per connection
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    }
 
     # Uploads (Phase 2): store outside web root
     UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER") or str(INSTANCE_PATH / "uploads")
     MAX_CONTENT_LENGTH = 20 * 1024 * 1024  # 20 MB
     ALLOWED_EXTENSIONS = {"pdf", "png", "jpg", "jpeg"}
+    # Batch upload (many files or ZIP archives): whole request / files per request.
+    # MAX_CONTENT_LENGTH still applies to each file.
+    BATCH_UPLOAD_MAX_BYTES = int(os.environ.get("BATCH_UPLOAD_MAX_BYTES") or 500 * 1024 * 1024)
+    BATCH_UPLOAD_MAX_FILES = int(os.environ.get("BATCH_UPLOAD_MAX_FILES") or 500)
+    # Resumable chunked uploads (services/chunked_upload.py) for files up to
+    # CHUNKED_UPLOAD_MAX_BYTES, sent in UPLOAD_CHUNK_SIZE pieces (each under MAX_CONTENT_LENGTH);
+    # sessions idle for UPLOAD_SESSION_TTL seconds are deleted by the OCR worker
+    CHUNKED_UPLOAD_MAX_BYTES = int(os.environ.get("CHUNKED_UPLOAD_MAX_BYTES") or 100 * 1024 * 1024)
+    UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+    UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL") or 24 * 3600)
+
+    # Original files: browser cache lifetime (revalidated by ETag after that). Set
+    # X_ACCEL_REDIRECT_PREFIX (e.g. /_receipt_files) to let Nginx send files; see deploy/README.md
+    FILE_MAX_AGE = 24 * 3600
+    X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX") or ""
+
+    # Thumbnails/previews (cached under UPLOAD_FOLDER/.renditions); the OCR worker
+    # pre-generates these sizes, others are made on first request
+    RENDITION_PREGENERATE = ("sm", "md")
+    RENDITION_MAX_AGE = 365 * 24 * 3600  # URLs are versioned by file hash
+
+    # Receipt list and search results per page (keyset pagination)
+    RECEIPTS_PAGE_SIZE = int(os.environ.get("RECEIPTS_PAGE_SIZE") or 50)
+    EXPORT_BATCH_SIZE = 500  # rows per cursor batch when streaming exports
+
+    # Answer whole-month reports from the trigger-maintained rollup tables
+    REPORTS_USE_ROLLUP = os.environ.get("REPORTS_USE_ROLLUP", "1") != "0"
+
+    # OCR job queue: run `flask ocr-worker` next to Gunicorn
+    OCR_WORKERS = int(os.environ.get("OCR_WORKERS") or 1)  # process pool size
+    OCR_MAX_ATTEMPTS = int(os.environ.get("OCR_MAX_ATTEMPTS") or 3)
+    OCR_RETRY_DELAY = 60  # seconds; doubled after each failed attempt
+    OCR_POLL_INTERVAL = 2.0  # seconds between queue polls when idle
+    OCR_LANG = os.environ.get("OCR_LANG") or "eng"
+    # "tesserocr" keeps Tesseract loaded in each worker process; "pytesseract" runs the
+    # tesseract binary per image; "auto" prefers tesserocr when installed
+    OCR_ENGINE = os.environ.get("OCR_ENGINE") or "auto"
+    OCR_PDF_DPI = 150
+    # Preprocessing (services/preprocess.py): crop to the receipt, scale text lines to
+    # OCR_LINE_HEIGHT pixels, deskew, binarize; scanned PDF pages with small text are
+    # re-rendered at up to OCR_PDF_MAX_DPI
+    OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "1") != "0"
+    OCR_LINE_HEIGHT = int(os.environ.get("OCR_LINE_HEIGHT") or 40)
+    OCR_BINARIZE = os.environ.get("OCR_BINARIZE", "1") != "0"
+    OCR_PDF_MAX_DPI = int(os.environ.get("OCR_PDF_MAX_DPI") or 300)
+    # Scanned PDFs: pages are OCRed in a pool of OCR_PAGE_WORKERS threads (tesserocr) or
+    # processes (pytesseract) per job, so peak memory is roughly OCR_WORKERS x OCR_PAGE_WORKERS
+    # rasterized pages (plus one Tesseract instance per thread)
+    OCR_PAGE_WORKERS = int(os.environ.get("OCR_PAGE_WORKERS") or 1)
+    OCR_PDF_MAX_PAGES = int(os.environ.get("OCR_PDF_MAX_PAGES") or 50)
+    OCR_PAGE_TIMEOUT = 120  # seconds per page
+    # Running jobs whose lease (renewed by their worker) is older than this are re-queued;
+    # the default outlasts the longest scanned PDF even if a renewal is missed
+    OCR_LEASE_SECONDS = int(os.environ.get("OCR_LEASE_SECONDS") or OCR_PDF_MAX_PAGES * OCR_PAGE_TIMEOUT + 5 * 60)
+    # OCR text cache keyed by file hash + settings; set OCR_CACHE_PATH="" to disable
+    OCR_CACHE_PATH = os.environ.get("OCR_CACHE_PATH", str(INSTANCE_PATH / "ocr_cache.db"))
+    OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES") or 256 * 1024 * 1024)
+    # Merchant dictionary: a new spelling joins an existing merchant when the trigram
+    # similarity (Dice coefficient, 0..1) of their normalized names reaches this threshold
+    MERCHANT_MATCH_THRESHOLD = float(os.environ.get("MERCHANT_MATCH_THRESHOLD") or 0.6)
+
+    # Full-text search (SQLite FTS5); falls back to substring matching when off/unavailable
+    SEARCH_FTS = os.environ.get("SEARCH_FTS", "1") != "0"
+    # Tag filters from the in-memory tag bitmap index (services/tag_index.py). Results with
+    # more ids than TAG_INDEX_MAX_IDS (and a longer complement) use SQL subqueries instead;
+    # the OCR worker prunes the index change log down to TAG_INDEX_LOG_KEEP entries
+    TAG_INDEX = os.environ.get("TAG_INDEX", "1") != "0"
+    TAG_INDEX_MAX_IDS = int(os.environ.get("TAG_INDEX_MAX_IDS") or 20000)
+    TAG_INDEX_LOG_KEEP = 10000
+    # Application cache (services/cache.py) for the tag list, per-tag counts and rendered
+    # receipt cards: an in-process LRU of CACHE_MAX_ENTRIES; set CACHE_PATH to also share
+    # entries between Gunicorn workers through an SQLite file of up to CACHE_MAX_BYTES
+    CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") != "0"
+    CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES") or 4096)
+    CACHE_PATH = os.environ.get("CACHE_PATH", "")
+    CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES") or 64 * 1024 * 1024)
+
+    # Metrics (services/metrics.py): Prometheus text on /metrics — restrict it at the proxy,
+    # see deploy/README.md. The OCR worker writes its metrics to METRICS_TEXTFILE_DIR.
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+    METRICS_TEXTFILE_DIR = os.environ.get("METRICS_TEXTFILE_DIR") or str(INSTANCE_PATH / "metrics")
+    METRICS_WRITE_INTERVAL = 15  # seconds between worker textfile updates
+    # One JSON log line per request (logger "app.requests")
+    REQUEST_LOG = os.environ.get("REQUEST_LOG", "0") == "1"
+    # Per-request profiler, triggered by `X-Profile: 1` or `?_profile=1`; never enable in
+    # production. PROFILER is "pyinstrument" (if installed) or "cprofile"
+    PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+    PROFILER = os.environ.get("PROFILER") or "pyinstrument"
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,6 @@
+"""
+Schema migrations, applied in order by services/migrations.py (`flask db upgrade`).
+Add a module vNNNN_<name>.py with a docstring and upgrade(conn); conn is a SQLAlchemy
+connection inside the migration's transaction. Keep the DDL in the module (do not import
+it from models or services), so old migrations keep producing the same schema.
+"""
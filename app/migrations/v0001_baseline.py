@@ -0,0 +1,32 @@
+"""Baseline schema: receipts, tags and the receipt_tags association table."""
+from app.services.migrations import execute_all
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS receipts (
+        id INTEGER NOT NULL,
+        file_path VARCHAR(512) NOT NULL,
+        original_filename VARCHAR(256) NOT NULL,
+        created_at DATETIME,
+        receipt_date DATE,
+        merchant VARCHAR(256),
+        extracted_text TEXT,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS tags (
+        id INTEGER NOT NULL,
+        name VARCHAR(64) NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS receipt_tags (
+        receipt_id INTEGER NOT NULL,
+        tag_id INTEGER NOT NULL,
+        PRIMARY KEY (receipt_id, tag_id),
+        FOREIGN KEY(receipt_id) REFERENCES receipts (id),
+        FOREIGN KEY(tag_id) REFERENCES tags (id)
+    )""",
+]
+
+
+def upgrade(conn):
+    execute_all(conn, STATEMENTS)
@@ -0,0 +1,27 @@
+"""OCR job queue table and receipts.ocr_status."""
+from app.services.migrations import add_column, execute_all
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS ocr_jobs (
+        id INTEGER NOT NULL,
+        receipt_id INTEGER NOT NULL,
+        status VARCHAR(16) NOT NULL,
+        attempts INTEGER NOT NULL,
+        last_error VARCHAR(512),
+        run_after DATETIME NOT NULL,
+        locked_at DATETIME,
+        locked_by VARCHAR(64),
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        UNIQUE (receipt_id),
+        FOREIGN KEY(receipt_id) REFERENCES receipts (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_jobs_status ON ocr_jobs (status)",
+]
+
+
+def upgrade(conn):
+    # NULL for existing receipts: treated as done (backfilled by receipts_ocr_status)
+    add_column(conn, "receipts", "ocr_status", "VARCHAR(16)")
+    execute_all(conn, STATEMENTS)
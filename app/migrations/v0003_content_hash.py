@@ -0,0 +1,8 @@
+"""receipts.content_hash (SHA-256 of the stored file), unique."""
+from app.services.migrations import add_column
+
+
+def upgrade(conn):
+    # ADD COLUMN cannot carry UNIQUE; databases made by create_all already have the constraint
+    if add_column(conn, "receipts", "content_hash", "VARCHAR(64)"):
+        conn.exec_driver_sql("CREATE UNIQUE INDEX ix_receipts_content_hash ON receipts (content_hash)")
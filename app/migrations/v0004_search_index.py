@@ -0,0 +1,43 @@
+"""FTS5 index over merchant and OCR text (external content, synced by triggers)."""
+import logging
+
+from sqlalchemy.exc import OperationalError
+
+from app.services.migrations import execute_all, schema_objects
+
+logger = logging.getLogger(__name__)
+
+STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS receipts_fts USING fts5(
+        merchant, extracted_text,
+        content='receipts', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO receipts_fts(rowid, merchant, extracted_text)
+        VALUES (new.id, new.merchant, new.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_ad AFTER DELETE ON receipts BEGIN
+        INSERT INTO receipts_fts(receipts_fts, rowid, merchant, extracted_text)
+        VALUES ('delete', old.id, old.merchant, old.extracted_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_au AFTER UPDATE OF merchant, extracted_text ON receipts BEGIN
+        INSERT INTO receipts_fts(receipts_fts, rowid, merchant, extracted_text)
+        VALUES ('delete', old.id, old.merchant, old.extracted_text);
+        INSERT INTO receipts_fts(rowid, merchant, extracted_text)
+        VALUES (new.id, new.merchant, new.extracted_text);
+    END""",
+]
+
+
+def upgrade(conn):
+    existed = "receipts_fts" in schema_objects(conn, "table")
+    try:
+        execute_all(conn, STATEMENTS[:1])
+    except OperationalError:
+        # SQLite built without FTS5: search falls back to substring matching
+        logger.warning("SQLite FTS5 unavailable; skipping the search index")
+        return
+    execute_all(conn, STATEMENTS[1:])
+    if not existed:
+        conn.exec_driver_sql("INSERT INTO receipts_fts(receipts_fts) VALUES ('rebuild')")
@@ -0,0 +1,90 @@
+"""Monthly report rollups (per tag, per merchant) maintained by triggers."""
+from app.services.migrations import execute_all, schema_objects
+
+_MONTH = "strftime('%Y-%m', coalesce({r}.receipt_date, {r}.created_at))"
+_MERCHANT = "coalesce({r}.merchant, '')"
+
+
+def _m(r):
+    return _MONTH.format(r=r)
+
+
+def _mer(r):
+    return _MERCHANT.format(r=r)
+
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS rollup_month_tag (
+        month VARCHAR(7) NOT NULL,
+        tag_id INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (month, tag_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS rollup_month_merchant (
+        month VARCHAR(7) NOT NULL,
+        merchant VARCHAR(256) NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (month, merchant)
+    )""",
+]
+
+TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_receipts_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO rollup_month_merchant(month, merchant, count) VALUES ({_m('new')}, {_mer('new')}, 1)
+        ON CONFLICT(month, merchant) DO UPDATE SET count = count + 1;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_receipts_ad AFTER DELETE ON receipts BEGIN
+        UPDATE rollup_month_merchant SET count = count - 1
+        WHERE month = {_m('old')} AND merchant = {_mer('old')};
+        UPDATE rollup_month_tag SET count = count - 1
+        WHERE month = {_m('old')} AND tag_id IN (SELECT tag_id FROM receipt_tags WHERE receipt_id = old.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_receipts_au AFTER UPDATE OF receipt_date, created_at, merchant ON receipts
+    WHEN {_m('old')} IS NOT {_m('new')} OR {_mer('old')} <> {_mer('new')} BEGIN
+        UPDATE rollup_month_merchant SET count = count - 1
+        WHERE month = {_m('old')} AND merchant = {_mer('old')};
+        INSERT INTO rollup_month_merchant(month, merchant, count) VALUES ({_m('new')}, {_mer('new')}, 1)
+        ON CONFLICT(month, merchant) DO UPDATE SET count = count + 1;
+        UPDATE rollup_month_tag SET count = count - 1
+        WHERE {_m('old')} IS NOT {_m('new')} AND month = {_m('old')}
+          AND tag_id IN (SELECT tag_id FROM receipt_tags WHERE receipt_id = new.id);
+        INSERT INTO rollup_month_tag(month, tag_id, count)
+        SELECT {_m('new')}, tag_id, 1 FROM receipt_tags
+        WHERE receipt_id = new.id AND {_m('old')} IS NOT {_m('new')}
+        ON CONFLICT(month, tag_id) DO UPDATE SET count = count + 1;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_receipt_tags_ai AFTER INSERT ON receipt_tags BEGIN
+        INSERT INTO rollup_month_tag(month, tag_id, count)
+        SELECT {_m('r')}, new.tag_id, 1 FROM receipts r WHERE r.id = new.receipt_id
+        ON CONFLICT(month, tag_id) DO UPDATE SET count = count + 1;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS rollup_receipt_tags_ad AFTER DELETE ON receipt_tags BEGIN
+        UPDATE rollup_month_tag SET count = count - 1
+        WHERE tag_id = old.tag_id
+          AND month = (SELECT {_m('r')} FROM receipts r WHERE r.id = old.receipt_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rollup_tags_ad AFTER DELETE ON tags BEGIN
+        DELETE FROM rollup_month_tag WHERE tag_id = old.id;
+    END""",
+]
+
+POPULATE = [
+    "DELETE FROM rollup_month_tag",
+    f"""INSERT INTO rollup_month_tag (month, tag_id, count)
+        SELECT {_m('r')}, rt.tag_id, count(*)
+        FROM receipt_tags rt JOIN receipts r ON r.id = rt.receipt_id
+        GROUP BY 1, 2""",
+    "DELETE FROM rollup_month_merchant",
+    f"""INSERT INTO rollup_month_merchant (month, merchant, count)
+        SELECT {_m('r')}, {_mer('r')}, count(*)
+        FROM receipts r
+        GROUP BY 1, 2""",
+]
+
+
+def upgrade(conn):
+    installed = "rollup_receipts_ai" in schema_objects(conn, "trigger")
+    execute_all(conn, TABLES)
+    execute_all(conn, TRIGGERS)
+    if not installed:
+        execute_all(conn, POPULATE)
@@ -0,0 +1,15 @@
+"""Indexes for list ordering, date-range filters, merchant lookups and tag filters."""
+from app.services.migrations import execute_all
+
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_receipts_created_at ON receipts (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_receipts_receipt_date ON receipts (receipt_date)",
+    "CREATE INDEX IF NOT EXISTS ix_receipts_merchant ON receipts (merchant)",
+    "CREATE INDEX IF NOT EXISTS ix_receipts_effective_date_expr ON receipts (coalesce(receipt_date, date(created_at)))",
+    "CREATE INDEX IF NOT EXISTS ix_receipt_tags_tag_id ON receipt_tags (tag_id, receipt_id)",
+    "ANALYZE",
+]
+
+
+def upgrade(conn):
+    execute_all(conn, STATEMENTS)
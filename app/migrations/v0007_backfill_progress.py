@@ -0,0 +1,14 @@
+"""Progress table for resumable batched backfills (services/backfill.py)."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        """CREATE TABLE IF NOT EXISTS backfill_progress (
+            name VARCHAR(64) NOT NULL,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            finished_at DATETIME,
+            updated_at DATETIME,
+            PRIMARY KEY (name)
+        )"""
+    )
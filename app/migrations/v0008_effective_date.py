@@ -0,0 +1,21 @@
+"""receipts.effective_date (receipt_date, else the upload day) and its index."""
+from app.services.migrations import add_column
+
+EXPRESSION_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_receipts_effective_date_expr ON receipts (coalesce(receipt_date, date(created_at)))"
+)
+
+
+def upgrade(conn):
+    # Existing rows are filled by the receipts_effective_date backfill; until it finishes, date
+    # filters use the expression index from v0006, which the backfill drops when done
+    add_column(conn, "receipts", "effective_date", "DATE")
+    row = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'ix_receipts_effective_date'"
+    ).first()
+    if row and "coalesce" in (row[0] or "").lower():
+        # Expression index created by v0006 under the column index's name: keep it under its own
+        if conn.exec_driver_sql("SELECT 1 FROM receipts LIMIT 1").first():
+            conn.exec_driver_sql(EXPRESSION_INDEX)
+        conn.exec_driver_sql("DROP INDEX ix_receipts_effective_date")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_receipts_effective_date ON receipts (effective_date)")
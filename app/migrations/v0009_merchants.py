@@ -0,0 +1,87 @@
+"""Merchant dictionary, receipts.merchant_id, and the merchant rollup keyed by merchant id."""
+from app.services.migrations import add_column, execute_all
+
+_MONTH = "strftime('%Y-%m', coalesce({r}.receipt_date, {r}.created_at))"
+_MERCHANT = "coalesce({r}.merchant_id, 0)"
+
+
+def _m(r):
+    return _MONTH.format(r=r)
+
+
+def _mer(r):
+    return _MERCHANT.format(r=r)
+
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS merchants (
+        id INTEGER NOT NULL,
+        name VARCHAR(256) NOT NULL,
+        "key" VARCHAR(256) NOT NULL,
+        trigram_count INTEGER NOT NULL,
+        created_at DATETIME,
+        PRIMARY KEY (id),
+        UNIQUE ("key")
+    )""",
+    """CREATE TABLE IF NOT EXISTS merchant_aliases (
+        alias_key VARCHAR(256) NOT NULL,
+        merchant_id INTEGER NOT NULL,
+        PRIMARY KEY (alias_key),
+        FOREIGN KEY(merchant_id) REFERENCES merchants (id)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS merchant_trigrams (
+        trigram VARCHAR(3) NOT NULL,
+        merchant_id INTEGER NOT NULL,
+        PRIMARY KEY (trigram, merchant_id),
+        FOREIGN KEY(merchant_id) REFERENCES merchants (id)
+    ) WITHOUT ROWID""",
+]
+
+ROLLUP = [
+    "DROP TRIGGER IF EXISTS rollup_receipts_ai",
+    "DROP TRIGGER IF EXISTS rollup_receipts_ad",
+    "DROP TRIGGER IF EXISTS rollup_receipts_au",
+    "DROP TABLE IF EXISTS rollup_month_merchant",
+    """CREATE TABLE rollup_month_merchant (
+        month VARCHAR(7) NOT NULL,
+        merchant_id INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (month, merchant_id)
+    )""",
+    f"""CREATE TRIGGER rollup_receipts_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO rollup_month_merchant(month, merchant_id, count) VALUES ({_m('new')}, {_mer('new')}, 1)
+        ON CONFLICT(month, merchant_id) DO UPDATE SET count = count + 1;
+    END""",
+    f"""CREATE TRIGGER rollup_receipts_ad AFTER DELETE ON receipts BEGIN
+        UPDATE rollup_month_merchant SET count = count - 1
+        WHERE month = {_m('old')} AND merchant_id = {_mer('old')};
+        UPDATE rollup_month_tag SET count = count - 1
+        WHERE month = {_m('old')} AND tag_id IN (SELECT tag_id FROM receipt_tags WHERE receipt_id = old.id);
+    END""",
+    f"""CREATE TRIGGER rollup_receipts_au AFTER UPDATE OF receipt_date, created_at, merchant_id ON receipts
+    WHEN {_m('old')} IS NOT {_m('new')} OR {_mer('old')} <> {_mer('new')} BEGIN
+        UPDATE rollup_month_merchant SET count = count - 1
+        WHERE month = {_m('old')} AND merchant_id = {_mer('old')};
+        INSERT INTO rollup_month_merchant(month, merchant_id, count) VALUES ({_m('new')}, {_mer('new')}, 1)
+        ON CONFLICT(month, merchant_id) DO UPDATE SET count = count + 1;
+        UPDATE rollup_month_tag SET count = count - 1
+        WHERE {_m('old')} IS NOT {_m('new')} AND month = {_m('old')}
+          AND tag_id IN (SELECT tag_id FROM receipt_tags WHERE receipt_id = new.id);
+        INSERT INTO rollup_month_tag(month, tag_id, count)
+        SELECT {_m('new')}, tag_id, 1 FROM receipt_tags
+        WHERE receipt_id = new.id AND {_m('old')} IS NOT {_m('new')}
+        ON CONFLICT(month, tag_id) DO UPDATE SET count = count + 1;
+    END""",
+    f"""INSERT INTO rollup_month_merchant (month, merchant_id, count)
+        SELECT {_m('r')}, {_mer('r')}, count(*)
+        FROM receipts r
+        GROUP BY 1, 2""",
+]
+
+
+def upgrade(conn):
+    execute_all(conn, TABLES)
+    # Existing rows are resolved by the receipts_merchant_id backfill (or `flask merchants-build`)
+    add_column(conn, "receipts", "merchant_id", "INTEGER REFERENCES merchants (id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_receipts_merchant_id ON receipts (merchant_id)")
+    execute_all(conn, ROLLUP)
@@ -0,0 +1,15 @@
+"""receipts.total_cents / tax_cents / currency parsed from OCR text, with spend indexes."""
+from app.services.migrations import add_column, execute_all
+
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_receipts_total_cents ON receipts (total_cents)",
+    "CREATE INDEX IF NOT EXISTS ix_receipts_spend ON receipts (effective_date, currency, total_cents)",
+]
+
+
+def upgrade(conn):
+    # Existing rows are parsed by the receipts_amounts backfill
+    add_column(conn, "receipts", "total_cents", "INTEGER")
+    add_column(conn, "receipts", "tax_cents", "INTEGER")
+    add_column(conn, "receipts", "currency", "VARCHAR(3)")
+    execute_all(conn, STATEMENTS)
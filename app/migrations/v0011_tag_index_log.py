@@ -0,0 +1,32 @@
+"""Change log of receipts and receipt_tags rows, read by the in-memory tag bitmap index."""
+from app.services.migrations import execute_all
+
+STATEMENTS = [
+    # tag_id 0: the receipt row itself (the set of all receipts, for NOT filters)
+    """CREATE TABLE IF NOT EXISTS tag_index_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        receipt_id INTEGER NOT NULL,
+        tag_id INTEGER NOT NULL,
+        added INTEGER NOT NULL
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tag_index_receipt_tags_ai AFTER INSERT ON receipt_tags BEGIN
+        INSERT INTO tag_index_log(receipt_id, tag_id, added) VALUES (new.receipt_id, new.tag_id, 1);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_index_receipt_tags_ad AFTER DELETE ON receipt_tags BEGIN
+        INSERT INTO tag_index_log(receipt_id, tag_id, added) VALUES (old.receipt_id, old.tag_id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_index_receipt_tags_au AFTER UPDATE ON receipt_tags BEGIN
+        INSERT INTO tag_index_log(receipt_id, tag_id, added) VALUES (old.receipt_id, old.tag_id, 0);
+        INSERT INTO tag_index_log(receipt_id, tag_id, added) VALUES (new.receipt_id, new.tag_id, 1);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_index_receipts_ai AFTER INSERT ON receipts BEGIN
+        INSERT INTO tag_index_log(receipt_id, tag_id, added) VALUES (new.id, 0, 1);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_index_receipts_ad AFTER DELETE ON receipts BEGIN
+        INSERT INTO tag_index_log(receipt_id, tag_id, added) VALUES (old.id, 0, 0);
+    END""",
+]
+
+
+def upgrade(conn):
+    execute_all(conn, STATEMENTS)
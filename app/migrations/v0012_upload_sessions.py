@@ -0,0 +1,18 @@
+"""Sessions of resumable chunked uploads (services/chunked_upload.py)."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        """CREATE TABLE IF NOT EXISTS upload_sessions (
+            id VARCHAR(32) NOT NULL,
+            filename VARCHAR(256) NOT NULL,
+            total_size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            received_bytes INTEGER NOT NULL,
+            expected_sha256 VARCHAR(64),
+            created_at DATETIME,
+            updated_at DATETIME,
+            PRIMARY KEY (id)
+        )"""
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_upload_sessions_updated_at ON upload_sessions (updated_at)")
@@ -0,0 +1,25 @@
+"""Version counters for the application cache (services/cache.py), bumped by triggers."""
+from app.services.migrations import execute_all
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS cache_versions (
+        name VARCHAR(32) NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (name)
+    )""",
+    "INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('tags', 0)",
+    # Tag list and names: create, rename, delete
+    """CREATE TRIGGER IF NOT EXISTS cache_tags_ai AFTER INSERT ON tags BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'tags';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cache_tags_au AFTER UPDATE ON tags BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'tags';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cache_tags_ad AFTER DELETE ON tags BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'tags';
+    END""",
+]
+
+
+def upgrade(conn):
+    execute_all(conn, STATEMENTS)
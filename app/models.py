@@ -1,41 +1,144 @@
 """
-SQLite models: receipts, tags, and many-to-many receipt_tags.
+SQLite models: receipts, tags, many-to-many receipt_tags, merchants, the OCR job queue and
+chunked upload sessions.
 """
 from datetime import date, datetime
 
+from sqlalchemy import event
+
 from app import db
 
+# OCR status values shared by Receipt.ocr_status and OcrJob.status
+OCR_PENDING = "pending"
+OCR_RUNNING = "running"
+OCR_DONE = "done"
+OCR_FAILED = "failed"
+
 
 # Association table for receipt <-> tags (multiple tags per receipt)
 receipt_tags = db.Table(
     "receipt_tags",
     db.Column("receipt_id", db.Integer, db.ForeignKey("receipts.id"), primary_key=True),
     db.Column("tag_id", db.Integer, db.ForeignKey("tags.id"), primary_key=True),
+    # The primary key serves receipt -> tags; this covers tag -> receipts (tag filters, reports)
+    db.Index("ix_receipt_tags_tag_id", "tag_id", "receipt_id"),
+)
+
+# Report rollups (see services/rollup.py): receipt counts per bucket, kept current by triggers
+rollup_month_tag = db.Table(
+    "rollup_month_tag",
+    db.Column("month", db.String(7), primary_key=True),
+    db.Column("tag_id", db.Integer, primary_key=True),
+    db.Column("count", db.Integer, nullable=False, default=0),
+)
+
+rollup_month_merchant = db.Table(
+    "rollup_month_merchant",
+    db.Column("month", db.String(7), primary_key=True),
+    db.Column("merchant_id", db.Integer, primary_key=True),  # 0 when unknown
+    db.Column("count", db.Integer, nullable=False, default=0),
 )
 
+# Every receipts / receipt_tags insert and delete, appended by triggers; the in-memory tag
+# bitmap index (services/tag_index.py) replays it. tag_id 0 stands for the receipt row itself.
+tag_index_log = db.Table(
+    "tag_index_log",
+    db.Column("seq", db.Integer, primary_key=True),
+    db.Column("receipt_id", db.Integer, nullable=False),
+    db.Column("tag_id", db.Integer, nullable=False),
+    db.Column("added", db.Integer, nullable=False),
+    sqlite_autoincrement=True,
+)
+
+# Application cache invalidation (see services/cache.py): counters bumped by triggers on tag
+# and receipt writes; tag assignments are versioned by tag_index_log's sequence
+cache_versions = db.Table(
+    "cache_versions",
+    db.Column("name", db.String(32), primary_key=True),
+    db.Column("version", db.Integer, nullable=False),
+)
+
+# Merchant dictionary (see services/merchants.py): normalized spelling -> merchant, and the
+# trigram postings used for fuzzy matching of new spellings
+merchant_aliases = db.Table(
+    "merchant_aliases",
+    db.Column("alias_key", db.String(256), primary_key=True),
+    db.Column("merchant_id", db.Integer, db.ForeignKey("merchants.id"), nullable=False),
+    sqlite_with_rowid=False,
+)
+
+merchant_trigrams = db.Table(
+    "merchant_trigrams",
+    db.Column("trigram", db.String(3), primary_key=True),
+    db.Column("merchant_id", db.Integer, db.ForeignKey("merchants.id"), primary_key=True),
+    sqlite_with_rowid=False,
+)
+
+
+class Merchant(db.Model):
+    """Canonical merchant; name is the first (most common) spelling seen, key its normalized form."""
+    __tablename__ = "merchants"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(256), nullable=False)
+    key = db.Column(db.String(256), unique=True, nullable=False)
+    trigram_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<Merchant {self.name!r}>"
+
 
 class Receipt(db.Model):
     __tablename__ = "receipts"
 
     id = db.Column(db.Integer, primary_key=True)
     file_path = db.Column(db.String(512), nullable=False)
+    # SHA-256 of the file; NULL only for legacy rows not yet migrated (flask storage-dedupe)
+    content_hash = db.Column(db.String(64), unique=True, nullable=True)
     original_filename = db.Column(db.String(256), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    receipt_date = db.Column(db.Date, nullable=True)
-    merchant = db.Column(db.String(256), nullable=True)
-    extracted_text = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    receipt_date = db.Column(db.Date, nullable=True, index=True)
+    # receipt_date, else the upload day; set on every flush so date ranges are index range scans
+    effective_date = db.Column(db.Date, nullable=True, index=True)
+    merchant = db.Column(db.String(256), nullable=True, index=True)
+    # Normalized merchant (dictionary entry) for grouping and filtering; NULL if unknown
+    merchant_id = db.Column(db.Integer, db.ForeignKey("merchants.id"), nullable=True, index=True)
+    # Amounts parsed from the OCR text, in minor units (cents); NULL when not found
+    total_cents = db.Column(db.Integer, nullable=True, index=True)
+    tax_cents = db.Column(db.Integer, nullable=True)
+    currency = db.Column(db.String(3), nullable=True)  # ISO 4217 code
+    # Deferred: list views never need the OCR text, only search/detail do
+    extracted_text = db.deferred(db.Column(db.Text, nullable=True))
+    # NULL for receipts created before the job queue existed until the receipts_ocr_status
+    # backfill has run (treated as done)
+    ocr_status = db.Column(db.String(16), nullable=True, default=OCR_PENDING)
 
     tags = db.relationship(
         "Tag",
         secondary=receipt_tags,
         backref=db.backref("receipts", lazy="dynamic"),
-        lazy="joined",
+        # One IN query per page instead of a JOIN that breaks LIMIT
+        lazy="selectin",
     )
 
+    merchant_entry = db.relationship("Merchant")
+
+    # Spend reports by month read only this index (effective_date range, then the amounts)
+    __table_args__ = (db.Index("ix_receipts_spend", "effective_date", "currency", "total_cents"),)
+
     def __repr__(self) -> str:
         return f"<Receipt {self.original_filename!r}>"
 
 
+@event.listens_for(Receipt, "before_insert")
+@event.listens_for(Receipt, "before_update")
+def _set_effective_date(mapper, connection, target):
+    if target.created_at is None:
+        target.created_at = datetime.utcnow()
+    target.effective_date = target.receipt_date or target.created_at.date()
+
+
 class Tag(db.Model):
     __tablename__ = "tags"
 
@@ -44,3 +147,53 @@ class Tag(db.Model):
 
     def __repr__(self) -> str:
         return f"<Tag {self.name!r}>"
+
+
+class UploadSession(db.Model):
+    """
+    Resumable chunked upload (services/chunked_upload.py). Chunks are appended in order to
+    UPLOAD_FOLDER/.incoming/<id>.part; received_bytes is how much of it is confirmed.
+    """
+    __tablename__ = "upload_sessions"
+
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(256), nullable=False)
+    total_size = db.Column(db.Integer, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    received_bytes = db.Column(db.Integer, nullable=False, default=0)
+    # Optional SHA-256 announced by the client, checked on finalize
+    expected_sha256 = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def next_chunk(self) -> int:
+        return self.received_bytes // self.chunk_size
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.total_size // self.chunk_size)
+
+    def __repr__(self) -> str:
+        return f"<UploadSession {self.id} {self.received_bytes}/{self.total_size}>"
+
+
+class OcrJob(db.Model):
+    """Persistent OCR job; one row per receipt, claimed by the OCR worker."""
+    __tablename__ = "ocr_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    receipt_id = db.Column(db.Integer, db.ForeignKey("receipts.id"), unique=True, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=OCR_PENDING, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(512), nullable=True)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    receipt = db.relationship("Receipt", backref=db.backref("ocr_job", uselist=False))
+
+    def __repr__(self) -> str:
+        return f"<OcrJob receipt_id={self.receipt_id} {self.status}>"
@@ -1,50 +1,177 @@
 """
-Export receipts as CSV (all or with same filters as search).
+Export receipts (all or with same filters as search) as CSV, JSON Lines or XLSX.
+Rows are streamed from a yield_per cursor in batches, with tags fetched once per
+batch, so memory stays flat and the first bytes go out immediately.
 """
 import csv
 import io
-from datetime import date
+import json
+import tempfile
+import zlib
+from collections import defaultdict
+from decimal import Decimal
 
-from flask import Blueprint, request, Response
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from sqlalchemy import select
 
-from app.services.receipt_query import build_receipt_query
+from app import db
+from app.models import Receipt, Tag, receipt_tags
+from app.services.receipt_parser import format_amount
+from app.services.receipt_query import build_receipt_query, effective_date_expr, filters_from_args
+
+# Optional dep for XLSX
+try:
+    from openpyxl import Workbook
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
 
 bp = Blueprint("export", __name__, url_prefix="/export")
 
+COLUMNS = ["date", "merchant", "total", "tax", "currency", "tags", "filename", "created_at"]
 
-def _receipt_date(r):
-    return (r.receipt_date or r.created_at.date()) if r.created_at else None
+MIMETYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
 
 
 def _format_date(d):
     return d.strftime("%Y-%m-%d") if d else ""
 
 
-@bp.route("/receipts.csv", methods=["GET"])
-def receipts_csv():
-    """Export receipts as CSV. Query params: tag_id, date_from, date_to, merchant (same as search)."""
-    tag_ids = request.args.getlist("tag_id", type=int)
-    date_from_s = request.args.get("date_from", "").strip()
-    date_to_s = request.args.get("date_to", "").strip()
-    merchant_q = request.args.get("merchant", "").strip()
+def _format_datetime(dt):
+    return dt.strftime("%Y-%m-%d %H:%M") if dt else ""
+
+
+def _decimal(cents):
+    # XLSX cells get numbers, not strings, so spreadsheets can sum them
+    return Decimal(cents).scaleb(-2) if cents is not None else None
+
 
-    query = build_receipt_query(tag_ids, date_from_s, date_to_s, merchant_q)
-    receipts = query.all()
+def _iter_batches(query, batch_size: int):
+    """Yield lists of (row, tag_names) from a server-side cursor, batch_size rows at a time."""
+    stmt = query.with_entities(
+        Receipt.id,
+        effective_date_expr().label("effective_date"),
+        Receipt.created_at,
+        Receipt.merchant,
+        Receipt.total_cents,
+        Receipt.tax_cents,
+        Receipt.currency,
+        Receipt.original_filename,
+    ).statement.execution_options(yield_per=batch_size)
+    for batch in db.session.execute(stmt).partitions():
+        tags = defaultdict(list)
+        tag_rows = db.session.execute(
+            select(receipt_tags.c.receipt_id, Tag.name)
+            .join(Tag, Tag.id == receipt_tags.c.tag_id)
+            .where(receipt_tags.c.receipt_id.in_([r.id for r in batch]))
+            .order_by(Tag.name)
+        )
+        for receipt_id, name in tag_rows:
+            tags[receipt_id].append(name)
+        yield [(r, tags[r.id]) for r in batch]
 
+
+def _csv_chunks(batches):
     out = io.StringIO()
     writer = csv.writer(out)
-    writer.writerow(["date", "merchant", "tags", "filename", "created_at"])
-    for r in receipts:
-        writer.writerow([
-            _format_date(_receipt_date(r)),
-            (r.merchant or ""),
-            ",".join(t.name for t in r.tags),
-            r.original_filename or "",
-            r.created_at.strftime("%Y-%m-%d %H:%M") if r.created_at else "",
-        ])
-    filename = "receipts.csv"
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        for r, tags in batch:
+            writer.writerow([
+                _format_date(r.effective_date),
+                (r.merchant or ""),
+                format_amount(r.total_cents),
+                format_amount(r.tax_cents),
+                r.currency or "",
+                ",".join(tags),
+                r.original_filename or "",
+                _format_datetime(r.created_at),
+            ])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue()
+
+
+def _jsonl_chunks(batches):
+    for batch in batches:
+        yield "".join(
+            json.dumps({
+                "date": _format_date(r.effective_date),
+                "merchant": r.merchant,
+                "total": format_amount(r.total_cents) or None,
+                "tax": format_amount(r.tax_cents) or None,
+                "currency": r.currency,
+                "tags": tags,
+                "filename": r.original_filename,
+                "created_at": _format_datetime(r.created_at),
+            }, ensure_ascii=False) + "\n"
+            for r, tags in batch
+        )
+
+
+def _xlsx_chunks(batches, chunk_size: int = 64 * 1024):
+    # Write-only workbook spills rows to disk; the finished file is streamed back in chunks
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Receipts")
+    ws.append(COLUMNS)
+    for batch in batches:
+        for r, tags in batch:
+            ws.append([
+                r.effective_date,
+                r.merchant or "",
+                _decimal(r.total_cents),
+                _decimal(r.tax_cents),
+                r.currency or "",
+                ",".join(tags),
+                r.original_filename or "",
+                r.created_at,
+            ])
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while chunk := tmp.read(chunk_size):
+            yield chunk
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@bp.route("/receipts.<fmt>", methods=["GET"])
+def receipts_export(fmt):
+    """
+    Export receipts. fmt: csv, jsonl or xlsx. Query params: tag_id, tag_all, tag_none,
+    date_from, date_to, merchant, merchant_id (same as search); gzip=1 compresses csv/jsonl.
+    """
+    if fmt not in MIMETYPES:
+        abort(404)
+    if fmt == "xlsx" and not OPENPYXL_AVAILABLE:
+        abort(400, description="XLSX export requires openpyxl (pip install openpyxl).")
+    use_gzip = request.args.get("gzip") == "1" and fmt != "xlsx"
+
+    query = build_receipt_query(**filters_from_args(request.args))
+    batches = _iter_batches(query, current_app.config["EXPORT_BATCH_SIZE"])
+    writer = {"csv": _csv_chunks, "jsonl": _jsonl_chunks, "xlsx": _xlsx_chunks}[fmt]
+    chunks = writer(batches)
+    filename = f"receipts.{fmt}"
+    mimetype = MIMETYPES[fmt]
+    if use_gzip:
+        chunks = _gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
     return Response(
-        out.getvalue(),
-        mimetype="text/csv",
+        stream_with_context(chunks),
+        mimetype=mimetype,
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
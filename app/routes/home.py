@@ -3,9 +3,11 @@ Home and dashboard route.
 """
 from flask import Blueprint, render_template
 
+from app.services.report_engine import dashboard
+
 bp = Blueprint("home", __name__)
 
 
 @bp.route("/")
 def index():
-    return render_template("index.html")
+    return render_template("index.html", summary=dashboard())
@@ -0,0 +1,40 @@
+"""
+Prometheus metrics: this process's registry, OCR queue depth by status and the OCR worker's
+textfile (METRICS_TEXTFILE_DIR/*.prom). Not linked from the UI; restrict it at the proxy.
+"""
+from pathlib import Path
+
+from flask import Blueprint, Response, abort, current_app
+
+from app import db
+from app.models import OcrJob
+from app.services.metrics import render, render_gauge
+
+bp = Blueprint("metrics", __name__)
+
+
+def _queue_gauge() -> str:
+    counts = db.session.query(OcrJob.status, db.func.count(OcrJob.id)).group_by(OcrJob.status).all()
+    return render_gauge(
+        "ocr_queue_jobs", "OCR jobs by status.", {(("status", status),): n for status, n in counts}
+    )
+
+
+def _textfiles() -> str:
+    folder = Path(current_app.config["METRICS_TEXTFILE_DIR"])
+    parts = []
+    for path in sorted(folder.glob("*.prom")):
+        try:
+            parts.append(path.read_text())
+        except OSError:
+            continue
+    return "".join(parts)
+
+
+@bp.route("/metrics")
+def metrics():
+    if not current_app.config["METRICS_ENABLED"]:
+        abort(404)
+    # ocr_* families come from the worker process, via its textfile
+    body = render(exclude="ocr_") + _queue_gauge() + _textfiles()
+    return Response(body, mimetype="text/plain; version=0.0.4")
@@ -1,12 +1,23 @@
 """
 Receipts: list, upload, detail with tag assignment, secure file serve.
 """
+import mimetypes
+import unicodedata
+from pathlib import Path
+from urllib.parse import quote
+
 from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, send_file, url_for
+from sqlalchemy import select
+from werkzeug.http import is_resource_modified
 
-from app import db
+from app import csrf, db
 from app.models import Receipt, Tag
-from app.services.ocr import extract_text_and_meta
-from app.services.storage import path_for_receipt, safe_save_upload
+from app.services.cache import tag_list
+from app.services.ingest import ADDED, create_receipt, ingest_files, upload_notice
+from app.services.receipt_parser import format_amount
+from app.services.receipt_query import receipt_page
+from app.services.renditions import MIMETYPE, SIZES, etag, get_rendition, identity
+from app.services.storage import is_safe_relative_path, path_for_receipt, safe_save_upload
 
 bp = Blueprint("receipts", __name__, url_prefix="/receipts")
 
@@ -15,10 +26,39 @@ def _allowed():
     return current_app.config["ALLOWED_EXTENSIONS"]
 
 
+@bp.app_template_global()
+def rendition_url(receipt, size: str) -> str:
+    """Versioned rendition URL; the v parameter changes with the file, so it can be cached forever."""
+    tag = etag(identity(receipt.file_path, receipt.content_hash), size)
+    return url_for("receipts.rendition", receipt_id=receipt.id, size=size, v=tag)
+
+
+@bp.app_template_filter("money")
+def money(cents) -> str:
+    return format_amount(cents)
+
+
+def _not_modified(tag: str, max_age: int, last_modified=None, public: bool = True):
+    response = current_app.response_class(status=304)
+    response.set_etag(tag)
+    response.last_modified = last_modified
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+
 @bp.route("/")
 def index():
-    receipts = Receipt.query.order_by(Receipt.created_at.desc()).all()
-    return render_template("receipts/index.html", receipts=receipts)
+    page = receipt_page(
+        [], "", "", "",
+        current_app.config["RECEIPTS_PAGE_SIZE"],
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+    )
+    return render_template("receipts/index.html", receipts=page["items"], page=page)
 
 
 @bp.route("/upload", methods=["GET", "POST"])
@@ -34,41 +74,53 @@ def upload():
         return redirect(url_for("receipts.upload"))
     try:
         upload_folder = current_app.config["UPLOAD_FOLDER"]
-        file_path, original_filename = safe_save_upload(
+        file_path, original_filename, content_hash = safe_save_upload(
             file, upload_folder, _allowed()
         )
     except ValueError as e:
         flash(str(e), "error")
         return redirect(url_for("receipts.upload"))
-    receipt = Receipt(
-        file_path=file_path,
-        original_filename=original_filename,
-    )
-    db.session.add(receipt)
-    db.session.commit()
-    upload_folder = current_app.config["UPLOAD_FOLDER"]
-    try:
-        meta = extract_text_and_meta(upload_folder, file_path)
-        receipt.extracted_text = meta.get("extracted_text")
-        receipt.receipt_date = meta.get("receipt_date")
-        receipt.merchant = meta.get("merchant")
-        db.session.commit()
-    except Exception as e:
-        current_app.logger.warning("OCR failed for receipt_id=%s", receipt.id)
-        flash("Receipt saved; text extraction failed. You can still add tags and search by date.", "error")
-    else:
-        flash(f"Uploaded {original_filename}.", "success")
+    receipt, created = create_receipt(file_path, original_filename, content_hash, upload_folder)
+    flash(upload_notice(receipt, "created" if created else "duplicate"), "success")
     return redirect(url_for("receipts.detail", receipt_id=receipt.id))
 
 
+@bp.route("/upload/batch", methods=["GET", "POST"])
+@csrf.exempt  # checked below, after raising the body size limit for this request
+def upload_batch():
+    if request.method == "GET":
+        return render_template("receipts/upload_batch.html", results=None)
+    cfg = current_app.config
+    # Must be set before the body is parsed; the app-wide limit is per single file
+    request.max_content_length = cfg["BATCH_UPLOAD_MAX_BYTES"]
+    if cfg["WTF_CSRF_ENABLED"]:
+        csrf.protect()
+    files = request.files.getlist("files")
+    if not any(f.filename for f in files):
+        flash("No files selected.", "error")
+        return redirect(url_for("receipts.upload_batch"))
+    results = ingest_files(
+        files,
+        cfg["UPLOAD_FOLDER"],
+        _allowed(),
+        cfg["MAX_CONTENT_LENGTH"],
+        cfg["BATCH_UPLOAD_MAX_FILES"],
+    )
+    added = sum(1 for r in results if r["status"] == ADDED)
+    current_app.logger.info("Batch upload: %d file(s), %d added", len(results), added)
+    return render_template("receipts/upload_batch.html", results=results, added=added)
+
+
 @bp.route("/<int:receipt_id>")
 def detail(receipt_id):
     receipt = Receipt.query.get_or_404(receipt_id)
-    all_tags = Tag.query.order_by(Tag.name).all()
+    all_tags = tag_list()
     return render_template(
         "receipts/detail.html",
         receipt=receipt,
         all_tags=all_tags,
+        # Set by the chunked upload API, which answers in JSON and leaves the notice to this page
+        upload_notice=upload_notice(receipt, request.args.get("upload")),
     )
 
 
@@ -93,16 +145,82 @@ def assign_tag(receipt_id):
     return redirect(url_for("receipts.detail", receipt_id=receipt_id))
 
 
+def _accel_redirect(receipt: Receipt, prefix: str, tag: str, max_age: int):
+    """Empty response telling Nginx to send the file itself from an internal location."""
+    response = current_app.response_class(status=200)
+    response.headers["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(receipt.file_path)
+    response.mimetype = mimetypes.guess_type(receipt.file_path)[0] or "application/octet-stream"
+    name = receipt.original_filename or Path(receipt.file_path).name
+    try:
+        name.encode("ascii")
+        response.headers.set("Content-Disposition", "inline", filename=name)
+    except UnicodeEncodeError:
+        fallback = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        response.headers.set(
+            "Content-Disposition", "inline", filename=fallback, **{"filename*": "UTF-8''" + quote(name)}
+        )
+    response.set_etag(tag)
+    response.last_modified = receipt.created_at
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+
 @bp.route("/<int:receipt_id>/file")
 def serve_file(receipt_id):
     receipt = Receipt.query.get_or_404(receipt_id)
-    upload_folder = current_app.config["UPLOAD_FOLDER"]
-    path = path_for_receipt(upload_folder, receipt.file_path)
+    cfg = current_app.config
+    # Stored files never change for a receipt, so the hash (or path) is a strong validator
+    tag = identity(receipt.file_path, receipt.content_hash)
+    max_age = cfg["FILE_MAX_AGE"]
+    if not is_resource_modified(request.environ, etag=tag, last_modified=receipt.created_at):
+        return _not_modified(tag, max_age, last_modified=receipt.created_at, public=False)
+    if cfg["X_ACCEL_REDIRECT_PREFIX"]:
+        # Lexical check only: Nginx opens the file (and answers 404 / Range requests) itself
+        if not is_safe_relative_path(receipt.file_path):
+            abort(404)
+        return _accel_redirect(receipt, cfg["X_ACCEL_REDIRECT_PREFIX"], tag, max_age)
+    path = path_for_receipt(cfg["UPLOAD_FOLDER"], receipt.file_path)
     if path is None:
         abort(404)
-    return send_file(
+    # conditional=True adds Range / If-Range support, so PDF viewers can fetch pages incrementally
+    response = send_file(
         path,
         as_attachment=False,
         download_name=receipt.original_filename,
         mimetype=None,
+        conditional=True,
+        etag=tag,
+        last_modified=receipt.created_at,
+        max_age=max_age,
     )
+    response.cache_control.public = None
+    response.cache_control.private = True
+    return response
+
+
+@bp.route("/<int:receipt_id>/rendition/<size>")
+def rendition(receipt_id, size):
+    if size not in SIZES:
+        abort(404)
+    row = db.session.execute(
+        select(Receipt.file_path, Receipt.content_hash).where(Receipt.id == receipt_id)
+    ).first()
+    if row is None:
+        abort(404)
+    ident = identity(row.file_path, row.content_hash)
+    tag = etag(ident, size)
+    max_age = current_app.config["RENDITION_MAX_AGE"]
+    if request.if_none_match.contains(tag):
+        # Answer revalidation without touching the filesystem
+        return _not_modified(tag, max_age)
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    source = path_for_receipt(upload_folder, row.file_path)
+    if source is None:
+        abort(404)
+    path = get_rendition(upload_folder, source, ident, size)
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype=MIMETYPE, etag=tag, max_age=max_age, conditional=True)
+    response.cache_control.immutable = True
+    return response
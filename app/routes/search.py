@@ -1,30 +1,43 @@
 """
-Search receipts by tags (OR), date range, and merchant (substring in merchant or extracted_text).
+Search receipts by tags (any of / all of / none of), date range, merchant/text (full-text index over merchant and extracted_text)
+and dictionary merchant (merchant_id).
 """
-from flask import Blueprint, render_template, request
+from flask import Blueprint, current_app, render_template, request
 
-from app.models import Tag
-from app.services.receipt_query import build_receipt_query
+from app import db
+from app.models import Merchant
+from app.services.cache import tag_list
+from app.services.receipt_query import filters_from_args, receipt_page
+from app.services.search_index import snippets_for
 
 bp = Blueprint("search", __name__, url_prefix="/search")
 
 
 @bp.route("/", methods=["GET"])
 def index():
-    tag_ids = request.args.getlist("tag_id", type=int)
-    date_from_s = request.args.get("date_from", "").strip()
-    date_to_s = request.args.get("date_to", "").strip()
-    merchant_q = request.args.get("merchant", "").strip()
-
-    query = build_receipt_query(tag_ids, date_from_s, date_to_s, merchant_q)
-    receipts = query.all()
-    all_tags = Tag.query.order_by(Tag.name).all()
+    filters = filters_from_args(request.args)
+    page = receipt_page(
+        **filters,
+        page_size=current_app.config["RECEIPTS_PAGE_SIZE"],
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+    )
+    receipts = page["items"]
+    merchant_q = filters["merchant_q"]
+    merchant_id = filters["merchant_id"]
+    snippets = snippets_for([r.id for r in receipts], merchant_q) if merchant_q else {}
+    all_tags = tag_list()
     return render_template(
         "search/index.html",
         receipts=receipts,
+        snippets=snippets,
+        page=page,
         all_tags=all_tags,
-        selected_tag_ids=tag_ids,
-        date_from=date_from_s,
-        date_to=date_to_s,
+        selected_tag_ids=filters["tag_ids"],
+        selected_tag_all=filters["tag_all"],
+        selected_tag_none=filters["tag_none"],
+        date_from=filters["date_from_s"],
+        date_to=filters["date_to_s"],
         merchant=merchant_q,
+        merchant_entry=db.session.get(Merchant, merchant_id) if merchant_id else None,
     )
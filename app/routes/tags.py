@@ -1,18 +1,21 @@
 """
-Tags: list, create, rename, delete. Custom tags only.
+Tags: list, create, rename, delete, merge, and bulk add/remove on search results.
+Custom tags only.
 """
 from flask import Blueprint, flash, redirect, render_template, request, url_for
 
 from app import db
 from app.models import Tag
+from app.services.bulk_tags import add_tag, delete_tag, merge_tags, receipt_selection, remove_tag
+from app.services.cache import tag_counts, tag_list
+from app.services.receipt_query import filters_from_args
 
 bp = Blueprint("tags", __name__, url_prefix="/tags")
 
 
 @bp.route("/")
 def index():
-    tags = Tag.query.order_by(Tag.name).all()
-    return render_template("tags/index.html", tags=tags)
+    return render_template("tags/index.html", tags=tag_list(), counts=tag_counts())
 
 
 @bp.route("/create", methods=["POST"])
@@ -61,10 +64,56 @@ def edit(tag_id):
 def delete(tag_id):
     tag = Tag.query.get_or_404(tag_id)
     name = tag.name
-    # Remove from all receipts then delete tag
-    for r in list(tag.receipts):
-        r.tags.remove(tag)
-    db.session.delete(tag)
-    db.session.commit()
-    flash(f"Tag «{name}» deleted.", "success")
+    db.session.rollback()  # release the read transaction before taking the write lock
+    removed = delete_tag(tag_id)
+    flash(f"Tag «{name}» deleted ({removed} receipt(s) untagged).", "success")
+    return redirect(url_for("tags.index"))
+
+
+@bp.route("/merge", methods=["POST"])
+def merge():
+    target = db.session.get(Tag, request.form.get("into", type=int) or 0)
+    source_ids = [i for i in request.form.getlist("merge_id", type=int) if not target or i != target.id]
+    if not target or not source_ids:
+        flash("Choose the tags to merge and the tag to merge them into.", "error")
+        return redirect(url_for("tags.index"))
+    name = target.name
+    db.session.rollback()
+    result = merge_tags(source_ids, target.id)
+    flash(f"Merged {result['tags']} tag(s) into «{name}» ({result['moved']} receipt(s) newly tagged).", "success")
     return redirect(url_for("tags.index"))
+
+
+def _back_to_search() -> str:
+    # Only ever redirect to the search page the form was posted from
+    path = request.form.get("next") or ""
+    return path if path.startswith("/search") else url_for("search.index")
+
+
+@bp.route("/bulk", methods=["POST"])
+def bulk():
+    """
+    Add or remove a tag on the receipts ticked on the search page (receipt_id) or, with
+    scope=search, on every receipt matching the search filters posted along.
+    """
+    back = _back_to_search()
+    tag = db.session.get(Tag, request.form.get("bulk_tag_id", type=int) or 0)
+    action = request.form.get("action")
+    if not tag or action not in ("add", "remove"):
+        flash("Choose a tag and whether to add or remove it.", "error")
+        return redirect(back)
+    if request.form.get("scope") == "search":
+        selection = receipt_selection(filters=filters_from_args(request.form))
+    else:
+        receipt_ids = request.form.getlist("receipt_id", type=int)
+        if not receipt_ids:
+            flash("No receipts selected.", "error")
+            return redirect(back)
+        selection = receipt_selection(receipt_ids)
+    name = tag.name
+    db.session.rollback()
+    if action == "add":
+        flash(f"Tag «{name}» added to {add_tag(selection, tag.id)} receipt(s).", "success")
+    else:
+        flash(f"Tag «{name}» removed from {remove_tag(selection, tag.id)} receipt(s).", "success")
+    return redirect(back)
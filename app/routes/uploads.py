@@ -0,0 +1,83 @@
+"""
+Resumable chunked upload API (JSON), used by static/js/chunked-upload.js:
+POST /receipts/uploads {filename, size, sha256?} opens a session; PUT .../<id>/chunks/<n>
+sends chunk n as the raw body; GET .../<id> reports progress; POST .../<id>/finalize creates
+the receipt; DELETE .../<id> cancels. CSRF token in the X-CSRFToken header.
+"""
+from flask import Blueprint, current_app, jsonify, request, url_for
+
+from app import db
+from app.models import UploadSession
+from app.services.chunked_upload import (
+    UploadError,
+    create_session,
+    discard,
+    finalize,
+    session_state,
+    write_chunk,
+)
+from app.services.ingest import create_receipt, upload_notice
+
+bp = Blueprint("uploads", __name__, url_prefix="/receipts/uploads")
+
+
+@bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify(error=str(e)), e.status
+
+
+def _session(session_id: str) -> UploadSession:
+    session = db.session.get(UploadSession, session_id)
+    if session is None:
+        raise UploadError("Unknown or expired upload session", 404)
+    return session
+
+
+@bp.route("", methods=["POST"])
+def init():
+    cfg = current_app.config
+    data = request.get_json(silent=True) or {}
+    session = create_session(
+        data.get("filename"),
+        data.get("size"),
+        cfg["UPLOAD_FOLDER"],
+        cfg["ALLOWED_EXTENSIONS"],
+        cfg["CHUNKED_UPLOAD_MAX_BYTES"],
+        cfg["UPLOAD_CHUNK_SIZE"],
+        sha256=data.get("sha256"),
+    )
+    return jsonify(session_state(session)), 201
+
+
+@bp.route("/<session_id>", methods=["GET"])
+def status(session_id):
+    return jsonify(session_state(_session(session_id)))
+
+
+@bp.route("/<session_id>/chunks/<int:index>", methods=["PUT"])
+def put_chunk(session_id, index):
+    state = write_chunk(
+        _session(session_id), index, request.stream, request.content_length, current_app.config["UPLOAD_FOLDER"]
+    )
+    return jsonify(state)
+
+
+@bp.route("/<session_id>/finalize", methods=["POST"])
+def finalize_upload(session_id):
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    file_path, original_filename, content_hash = finalize(_session(session_id), upload_folder)
+    receipt, created = create_receipt(file_path, original_filename, content_hash, upload_folder)
+    message = upload_notice(receipt, "created" if created else "duplicate")
+    # Not flashed: the page the client opens next shows the same notice (receipts.detail)
+    return jsonify(
+        receipt_id=receipt.id,
+        created=created,
+        message=message,
+        url=url_for("receipts.detail", receipt_id=receipt.id, upload="created" if created else "duplicate"),
+    )
+
+
+@bp.route("/<session_id>", methods=["DELETE"])
+def cancel(session_id):
+    discard(_session(session_id), current_app.config["UPLOAD_FOLDER"])
+    return "", 204
@@ -0,0 +1,240 @@
+"""
+Resumable batched backfills: data changes over a whole table that run in small id-range
+chunks, each in its own short write transaction, so uploads and the OCR worker keep going
+in between. Progress (last id done) is stored in backfill_progress, so an interrupted run
+continues where it stopped. Run by `flask db upgrade`, `flask db backfill` and by the OCR
+worker while it is idle.
+"""
+import logging
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from app.services.sqlite_tuning import immediate_transaction
+
+logger = logging.getLogger(__name__)
+
+# name -> (table, fn(conn, after_id, last_id) -> rows changed); fn handles ids in (after_id, last_id]
+BACKFILLS = {}
+# name -> SQL statements run in the transaction that marks the backfill finished
+ON_FINISH = {}
+
+
+def backfill(name: str, table: str = "receipts", on_finish: tuple[str, ...] = ()):
+    """Register a backfill function under name."""
+    def register(fn):
+        BACKFILLS[name] = (table, fn)
+        ON_FINISH[name] = on_finish
+        return fn
+    return register
+
+
+def _finish(conn, name: str) -> None:
+    for stmt in ON_FINISH.get(name, ()):
+        conn.execute(text(stmt))
+
+
+def _progress_table_exists() -> bool:
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'backfill_progress'"
+        ).first() is not None
+
+
+def progress() -> dict[str, dict]:
+    """name -> {last_id, rows_done, finished_at} for every registered backfill."""
+    rows = {}
+    if _progress_table_exists():
+        with db.engine.connect() as conn:
+            for name, last_id, rows_done, finished_at in conn.execute(
+                text("SELECT name, last_id, rows_done, finished_at FROM backfill_progress")
+            ):
+                rows[name] = {"last_id": last_id, "rows_done": rows_done, "finished_at": finished_at}
+    empty = {"last_id": 0, "rows_done": 0, "finished_at": None}
+    return {name: rows.get(name, empty) for name in BACKFILLS}
+
+
+def pending_backfills() -> list[str]:
+    if not _progress_table_exists():
+        return []
+    return [name for name, p in progress().items() if not p["finished_at"]]
+
+
+def backfill_pending(name: str) -> bool:
+    """
+    Whether a backfill is unfinished, for queries that must use a fallback until then. The
+    progress table is re-read at most every BACKFILL_RECHECK_SECONDS, so a backfill finished
+    by `flask db upgrade` or the OCR worker is picked up without a restart.
+    """
+    ext = current_app.extensions
+    checked_at = ext.get("backfills_checked_at")
+    if checked_at is not None and time.monotonic() - checked_at >= current_app.config["BACKFILL_RECHECK_SECONDS"]:
+        ext["backfills_pending"] = set(pending_backfills())
+        ext["backfills_checked_at"] = time.monotonic()
+    return name in ext.get("backfills_pending", ())
+
+
+def finish_empty_backfills() -> list[str]:
+    """
+    Mark never-started backfills of empty tables as finished (fresh databases: the column
+    was added to a table without rows, so there is nothing to fill). Returns their names.
+    """
+    names = [name for name, p in progress().items() if not p["finished_at"] and not p["last_id"]]
+    finished = []
+    with immediate_transaction() as conn:
+        for name in names:
+            table, _ = BACKFILLS[name]
+            if conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is None:
+                _mark_finished(conn, name)
+                finished.append(name)
+    return finished
+
+
+def run_batch(name: str, batch_size: int) -> bool:
+    """Process the next id range of a backfill. Returns False once it has finished."""
+    table, fn = BACKFILLS[name]
+    now = datetime.utcnow()
+    with immediate_transaction() as conn:
+        row = conn.execute(
+            text("SELECT last_id, finished_at FROM backfill_progress WHERE name = :name"), {"name": name}
+        ).first()
+        if row and row.finished_at:
+            return False
+        after_id = row.last_id if row else 0
+        last_id = conn.execute(
+            text(f"SELECT max(id) FROM (SELECT id FROM {table} WHERE id > :after ORDER BY id LIMIT :n)"),
+            {"after": after_id, "n": batch_size},
+        ).scalar()
+        changed = fn(conn, after_id, last_id) if last_id is not None else 0
+        conn.execute(
+            text(
+                "INSERT INTO backfill_progress (name, last_id, rows_done, finished_at, updated_at) "
+                "VALUES (:name, :last_id, :changed, :finished, :now) "
+                "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id, "
+                "rows_done = rows_done + excluded.rows_done, finished_at = excluded.finished_at, "
+                "updated_at = excluded.updated_at"
+            ),
+            {
+                "name": name,
+                "last_id": last_id if last_id is not None else after_id,
+                "changed": changed,
+                "finished": now if last_id is None else None,
+                "now": now,
+            },
+        )
+        if last_id is None:
+            _finish(conn, name)
+    if last_id is None:
+        logger.info("Backfill %s finished", name)
+        return False
+    return True
+
+
+def _mark_finished(conn, name: str) -> None:
+    now = datetime.utcnow()
+    conn.execute(
+        text(
+            "INSERT INTO backfill_progress (name, last_id, rows_done, finished_at, updated_at) "
+            "VALUES (:name, 0, 0, :now, :now) "
+            "ON CONFLICT(name) DO UPDATE SET finished_at = excluded.finished_at, updated_at = excluded.updated_at"
+        ),
+        {"name": name, "now": now},
+    )
+    _finish(conn, name)
+
+
+def mark_finished(name: str) -> None:
+    """Record a backfill as done (its work was completed some other way, e.g. in bulk)."""
+    with immediate_transaction() as conn:
+        _mark_finished(conn, name)
+
+
+def reset(name: str) -> None:
+    """Forget a backfill's progress so it runs over the whole table again."""
+    with immediate_transaction() as conn:
+        conn.execute(text("DELETE FROM backfill_progress WHERE name = :name"), {"name": name})
+
+
+def run_backfill(name: str, batch_size: int = 500, pause: float = 0.0) -> None:
+    """Run a backfill to completion, sleeping `pause` seconds between batches."""
+    while run_batch(name, batch_size):
+        if pause:
+            time.sleep(pause)
+
+
+# Registered backfills
+
+
+@backfill("receipts_ocr_status")
+def _receipts_ocr_status(conn, after_id: int, last_id: int) -> int:
+    """Receipts from before the OCR queue have ocr_status NULL; they were OCRed at upload."""
+    return conn.execute(
+        text("UPDATE receipts SET ocr_status = 'done' WHERE id > :a AND id <= :b AND ocr_status IS NULL"),
+        {"a": after_id, "b": last_id},
+    ).rowcount
+
+
+# The expression index serves date filters until the column is complete (migrations v0006, v0008)
+@backfill("receipts_effective_date", on_finish=("DROP INDEX IF EXISTS ix_receipts_effective_date_expr",))
+def _receipts_effective_date(conn, after_id: int, last_id: int) -> int:
+    """Persist the effective date of receipts created before the column existed."""
+    return conn.execute(
+        text(
+            "UPDATE receipts SET effective_date = coalesce(receipt_date, date(created_at)) "
+            "WHERE id > :a AND id <= :b AND effective_date IS NULL"
+        ),
+        {"a": after_id, "b": last_id},
+    ).rowcount
+
+
+@backfill("receipts_merchant_id")
+def _receipts_merchant_id(conn, after_id: int, last_id: int) -> int:
+    """Resolve merchant_id for receipts OCRed before the merchant dictionary existed."""
+    from app.services.merchants import resolve_merchant
+
+    rows = conn.execute(
+        text(
+            "SELECT id, merchant FROM receipts "
+            "WHERE id > :a AND id <= :b AND merchant_id IS NULL AND merchant IS NOT NULL"
+        ),
+        {"a": after_id, "b": last_id},
+    ).all()
+    changed = 0
+    for receipt_id, merchant in rows:
+        merchant_id = resolve_merchant(conn, merchant)
+        if merchant_id is not None:
+            conn.execute(
+                text("UPDATE receipts SET merchant_id = :m WHERE id = :id"), {"m": merchant_id, "id": receipt_id}
+            )
+            changed += 1
+    return changed
+
+
+@backfill("receipts_amounts")
+def _receipts_amounts(conn, after_id: int, last_id: int) -> int:
+    """(Re)parse total, tax and currency from the stored OCR text; no OCR is run."""
+    from app.services.receipt_parser import parse_amounts
+
+    rows = conn.execute(
+        text(
+            "SELECT id, extracted_text, total_cents, tax_cents, currency FROM receipts "
+            "WHERE id > :a AND id <= :b AND extracted_text IS NOT NULL"
+        ),
+        {"a": after_id, "b": last_id},
+    ).all()
+    changed = 0
+    for receipt_id, extracted_text, *current in rows:
+        amounts = parse_amounts(extracted_text)
+        if [amounts["total_cents"], amounts["tax_cents"], amounts["currency"]] != current:
+            conn.execute(
+                text(
+                    "UPDATE receipts SET total_cents = :total_cents, tax_cents = :tax_cents, "
+                    "currency = :currency WHERE id = :id"
+                ),
+                {**amounts, "id": receipt_id},
+            )
+            changed += 1
+    return changed
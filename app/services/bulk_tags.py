@@ -0,0 +1,80 @@
+"""
+Bulk tag operations as set-based SQL: add or remove a tag on a set of receipts (explicit ids
+or everything a search matches, via receipt_query.filter_receipts), merge tags and delete a
+tag. Each runs as one INSERT ... SELECT / DELETE per change on receipt_tags inside a single
+BEGIN IMMEDIATE transaction; the rollup and tag index triggers still fire per row.
+"""
+from sqlalchemy import column, delete, func, insert, literal, select
+
+from app.models import Receipt, Tag, receipt_tags
+from app.services.receipt_query import filter_receipts
+from app.services.sqlite_tuning import immediate_transaction
+
+
+def _json_ids(ids) -> str:
+    return "[" + ",".join(str(int(i)) for i in ids) + "]"
+
+
+def receipt_selection(receipt_ids=None, filters: dict | None = None):
+    """
+    SELECT of receipt ids to act on: the given ids that exist, else the receipts matching
+    filters (keyword arguments of filter_receipts, see filters_from_args).
+    """
+    if receipt_ids is not None:
+        # One bound JSON array instead of an IN list with a parameter per id
+        id_list = select(column("value")).select_from(func.json_each(_json_ids(receipt_ids)))
+        return select(Receipt.id).where(Receipt.id.in_(id_list))
+    query, _, _ = filter_receipts(**filters)
+    return query.with_entities(Receipt.id).order_by(None).statement
+
+
+def add_tag(selection, tag_id: int) -> int:
+    """Tag every selected receipt; returns how many did not have the tag yet."""
+    stmt = (
+        insert(receipt_tags)
+        .prefix_with("OR IGNORE")
+        .from_select(["receipt_id", "tag_id"], select(selection.subquery().c.id, literal(tag_id)))
+    )
+    with immediate_transaction() as conn:
+        return conn.execute(stmt).rowcount
+
+
+def remove_tag(selection, tag_id: int) -> int:
+    """Untag every selected receipt; returns how many had the tag."""
+    stmt = delete(receipt_tags).where(
+        receipt_tags.c.tag_id == tag_id,
+        receipt_tags.c.receipt_id.in_(selection),
+    )
+    with immediate_transaction() as conn:
+        return conn.execute(stmt).rowcount
+
+
+def merge_tags(source_ids: list[int], target_id: int) -> dict:
+    """
+    Move the receipts of source_ids to target_id and delete the source tags. Returns
+    {"moved": receipts newly given the target tag, "tags": source tags deleted}.
+    """
+    source_ids = [i for i in source_ids if i != target_id]
+    if not source_ids:
+        return {"moved": 0, "tags": 0}
+    sources = receipt_tags.c.tag_id.in_(source_ids)
+    with immediate_transaction() as conn:
+        moved = conn.execute(
+            insert(receipt_tags)
+            .prefix_with("OR IGNORE")
+            .from_select(
+                ["receipt_id", "tag_id"],
+                select(receipt_tags.c.receipt_id, literal(target_id)).where(sources).distinct(),
+            )
+        ).rowcount
+        conn.execute(delete(receipt_tags).where(sources))
+        deleted = conn.execute(delete(Tag.__table__).where(Tag.id.in_(source_ids))).rowcount
+    return {"moved": moved, "tags": deleted}
+
+
+def delete_tag(tag_id: int) -> int:
+    """Remove the tag from all receipts and delete it; returns how many receipts had it."""
+    with immediate_transaction() as conn:
+        removed = conn.execute(delete(receipt_tags).where(receipt_tags.c.tag_id == tag_id)).rowcount
+        conn.execute(delete(Tag.__table__).where(Tag.id == tag_id))
+    return removed
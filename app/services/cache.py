@@ -0,0 +1,287 @@
+"""
+Application cache for data that many pages need and that rarely changes: the tag list,
+receipt counts per tag and rendered receipt cards. Entries are looked up in an in-process
+LRU, then (with CACHE_PATH set, for several Gunicorn workers) in a shared SQLite file; values
+are JSON. A write never has to find and delete entries, it only makes their keys unreachable:
+the tag list and counts are keyed by version counters read once per request, and a card by
+a digest of everything it shows, so only changes to that receipt (or its tags) replace it:
+- "tags": cache_versions row bumped by triggers on tag create, rename and delete
+- "tagging": last tag_index_log seq (tag assignments, receipt inserts and deletes)
+Writes made by another process (OCR worker, other workers) are seen on the next request.
+Hits and misses per cache go to the cache_requests_total metric and stats().
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app, g, render_template
+from markupsafe import Markup
+from sqlalchemy import func, select, text
+
+from app import db
+from app.models import Tag, receipt_tags
+from app.services import metrics
+
+# Run once per file and process. app_cache_meta keeps the running totals so a put never has
+# to sum the table; it is only written together with app_cache
+_SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS app_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_app_cache_last_access ON app_cache (last_access);
+CREATE TABLE IF NOT EXISTS app_cache_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO app_cache_meta (id, entries, bytes)
+    SELECT 1, count(*), coalesce(sum(size), 0) FROM app_cache;
+COMMIT;
+"""
+
+# A shared hit refreshes last_access only when it is older than this, so reads stay reads;
+# eviction order is least recently used to within this many seconds
+TOUCH_INTERVAL = 60
+
+_VERSIONS_SQL = text(
+    "SELECT (SELECT version FROM cache_versions WHERE name = 'tags'), "
+    "(SELECT seq FROM sqlite_sequence WHERE name = 'tag_index_log')"
+)
+
+_lock = threading.Lock()
+_local = threading.local()  # this thread's connections: path -> sqlite3.Connection
+_schema_ready = set()  # paths whose schema this process has created
+_entries = OrderedDict()  # key -> value, least recently used first
+_stats = {}  # cache name -> {"hit": n, "shared_hit": n, "miss": n}
+
+
+def _count(name: str, result: str) -> None:
+    with _lock:
+        counts = _stats.setdefault(name, {"hit": 0, "shared_hit": 0, "miss": 0})
+        counts[result] += 1
+    metrics.inc("cache_requests_total", cache=name, result=result)
+
+
+def versions() -> dict:
+    """Current version counters, read once per request."""
+    if "cache_versions" not in g:
+        tags, tagging = db.session.execute(_VERSIONS_SQL).one()
+        g.cache_versions = {"tags": tags or 0, "tagging": tagging or 0}
+    return g.cache_versions
+
+
+def _connection(path: str) -> sqlite3.Connection:
+    """This thread's connection to the shared file (connections are not shared across forks)."""
+    if getattr(_local, "pid", None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.conns = {}
+    conn = _local.conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        with _lock:
+            ready = path in _schema_ready
+        if not ready:
+            conn.execute("PRAGMA journal_mode=WAL")  # readers in other workers don't wait on a put
+            conn.executescript(_SCHEMA)
+            with _lock:
+                _schema_ready.add(path)
+        _local.conns[path] = conn
+    return conn
+
+
+@contextmanager
+def _write(path: str):
+    conn = _connection(path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _shared_get(path: str, key: str):
+    conn = _connection(path)
+    row = conn.execute("SELECT value, last_access FROM app_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    now = time.time()
+    if row[1] < now - TOUCH_INTERVAL:
+        conn.execute("UPDATE app_cache SET last_access = ? WHERE key = ?", (now, key))
+    return row[0]
+
+
+def _shared_put(path: str, key: str, value: str, max_bytes: int) -> None:
+    with _write(path) as conn:
+        old = conn.execute("SELECT size FROM app_cache WHERE key = ?", (key,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO app_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time()),
+        )
+        conn.execute(
+            "UPDATE app_cache_meta SET entries = entries + ?, bytes = bytes + ? WHERE id = 1",
+            (0 if old else 1, len(value) - (old[0] if old else 0)),
+        )
+        entries, total = conn.execute("SELECT entries, bytes FROM app_cache_meta WHERE id = 1").fetchone()
+        if total > max_bytes:
+            # Drop the least recently used quarter (read off the last_access index); entries
+            # keyed by superseded versions are never read again, so they are the first to go
+            evicted = conn.execute(
+                "SELECT key, size FROM app_cache WHERE key <> ? ORDER BY last_access LIMIT ?",
+                (key, entries // 4 + 1),
+            ).fetchall()
+            conn.executemany("DELETE FROM app_cache WHERE key = ?", [(k,) for k, _ in evicted])
+            conn.execute(
+                "UPDATE app_cache_meta SET entries = entries - ?, bytes = bytes - ? WHERE id = 1",
+                (len(evicted), sum(size for _, size in evicted)),
+            )
+
+
+def get_or_compute(name: str, key: str, compute):
+    """Value for key from the cache, else compute() (JSON-serializable), stored for next time."""
+    cfg = current_app.config
+    if not cfg["CACHE_ENABLED"]:
+        return compute()
+    key = f"{name}:{key}"
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            value = _entries[key]
+            found = True
+        else:
+            found = False
+    if found:
+        _count(name, "hit")
+        return value
+    path = cfg["CACHE_PATH"]
+    raw = None
+    if path:
+        try:
+            raw = _shared_get(path, key)
+        except sqlite3.Error:
+            raw = None
+    if raw is not None:
+        value = json.loads(raw)
+        _count(name, "shared_hit")
+    else:
+        value = compute()
+        _count(name, "miss")
+        if path:
+            try:
+                _shared_put(path, key, json.dumps(value, separators=(",", ":")), cfg["CACHE_MAX_BYTES"])
+            except sqlite3.Error:
+                pass
+    with _lock:
+        _entries[key] = value
+        _entries.move_to_end(key)
+        while len(_entries) > cfg["CACHE_MAX_ENTRIES"]:
+            _entries.popitem(last=False)
+    return value
+
+
+def clear() -> None:
+    """Empty this process's cache (e.g. after bulk loads that bypassed the triggers)."""
+    with _lock:
+        _entries.clear()
+
+
+def clear_shared(path: str) -> None:
+    with _write(path) as conn:
+        conn.execute("DELETE FROM app_cache")
+        conn.execute("UPDATE app_cache_meta SET entries = 0, bytes = 0 WHERE id = 1")
+
+
+def stats(path: str | None = None) -> dict:
+    """Lookups per cache in this process with hit rates; entries and bytes of the shared file."""
+    with _lock:
+        out = {"entries": len(_entries), "caches": {}}
+        for name, counts in sorted(_stats.items()):
+            lookups = sum(counts.values())
+            hits = counts["hit"] + counts["shared_hit"]
+            out["caches"][name] = {**counts, "hit_rate": round(hits / lookups, 4) if lookups else None}
+    if path:
+        conn = _connection(path)
+        entries, size = conn.execute("SELECT entries, bytes FROM app_cache_meta WHERE id = 1").fetchone()
+        out["shared"] = {"entries": entries, "bytes": size}
+    return out
+
+
+class CachedTag:
+    """Tag as read from the cache: what templates use (id, name), comparable by id."""
+
+    __slots__ = ("id", "name")
+
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def tag_list() -> list[CachedTag]:
+    """All tags ordered by name."""
+    rows = get_or_compute(
+        "tags",
+        str(versions()["tags"]),
+        lambda: [[t.id, t.name] for t in db.session.execute(select(Tag.id, Tag.name).order_by(Tag.name))],
+    )
+    return [CachedTag(tag_id, name) for tag_id, name in rows]
+
+
+def tag_counts() -> dict[int, int]:
+    """Receipts per tag id (tags without receipts are absent)."""
+    v = versions()
+    rows = get_or_compute(
+        "tag_counts",
+        f"{v['tags']}:{v['tagging']}",
+        lambda: [
+            list(row)
+            for row in db.session.execute(
+                select(receipt_tags.c.tag_id, func.count()).group_by(receipt_tags.c.tag_id)
+            )
+        ],
+    )
+    return {tag_id: count for tag_id, count in rows}
+
+
+def _card_key(receipt, bulk_form: str | None) -> str:
+    # Every field receipts/_card.html renders (file_path and content_hash via the rendition
+    # URL); the tags are loaded with the page anyway (selectin)
+    state = (
+        receipt.file_path,
+        receipt.content_hash,
+        receipt.original_filename,
+        receipt.created_at,
+        receipt.receipt_date,
+        receipt.effective_date,
+        receipt.merchant,
+        receipt.total_cents,
+        receipt.currency,
+        [t.name for t in receipt.tags],
+        bulk_form or "",
+    )
+    return f"{receipt.id}:{hashlib.blake2b(repr(state).encode(), digest_size=16).hexdigest()}"
+
+
+def receipt_card(receipt, bulk_form: str | None = None) -> Markup:
+    """Rendered receipts/_card.html for a receipt without a search snippet."""
+    html = get_or_compute(
+        "receipt_card",
+        _card_key(receipt, bulk_form),
+        lambda: str(render_template("receipts/_card.html", r=receipt, snippets=None, bulk_form=bulk_form)),
+    )
+    return Markup(html)
@@ -0,0 +1,238 @@
+"""
+Resumable chunked uploads. The client opens a session (filename, size, optional SHA-256),
+PUTs numbered chunks of the session's chunk size in order, then finalizes. Each chunk is
+read from the request stream straight into the staging file UPLOAD_FOLDER/.incoming/<id>.part
+and hashed on the way; the running SHA-256 is kept in memory per session (rebuilt from the
+staging file after a restart or when another worker process wrote the last chunk). Requests
+on one session are serialized by an exclusive flock on its staging file, which holds across
+threads and Gunicorn worker processes and leaves other sessions alone. Finalize moves the file into the content-addressed store
+(storage.store_file), after which it becomes a receipt like any other upload. A chunk that
+arrives twice (lost response) is acknowledged without rewriting, so clients can simply retry;
+GET on the session tells a client where to resume. Sessions idle for UPLOAD_SESSION_TTL are
+removed by cleanup_sessions (OCR worker, `flask uploads-cleanup`).
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO
+
+from sqlalchemy.exc import InvalidRequestError
+
+from app import db
+from app.models import UploadSession
+from app.services.storage import CHUNK_SIZE, allowed_extension, incoming_dir, store_file
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = ".part"
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# session id -> (bytes hashed, sha256 object); only advanced while holding the session's lock
+_hashers = {}
+
+
+class UploadError(ValueError):
+    """Rejected upload request; status is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload_folder: str, session_id: str) -> Path:
+    return incoming_dir(upload_folder) / f"{session_id}{PART_SUFFIX}"
+
+
+@contextmanager
+def _locked(session: UploadSession, path: Path):
+    """
+    Hold the session's staging file open under an exclusive lock and reload the session,
+    which a request in another thread or process may have advanced (or finalized) meanwhile.
+    """
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        raise UploadError("Unknown or expired upload session", 404) from None
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            db.session.refresh(session)
+        except InvalidRequestError:
+            raise UploadError("Unknown or expired upload session", 404) from None
+        yield f
+
+
+def session_state(session: UploadSession) -> dict:
+    """JSON-ready progress of a session."""
+    return {
+        "id": session.id,
+        "filename": session.filename,
+        "size": session.total_size,
+        "chunk_size": session.chunk_size,
+        "chunks": session.chunk_count,
+        "received": session.received_bytes,
+        "next_chunk": session.next_chunk,
+    }
+
+
+def create_session(
+    filename: str,
+    size: int,
+    upload_folder: str,
+    allowed_extensions: set[str],
+    max_bytes: int,
+    chunk_size: int,
+    sha256: str | None = None,
+) -> UploadSession:
+    """Validate the announced file and open a session with an empty staging file. Commits."""
+    filename = (filename or "").strip()
+    if not filename or len(filename) > 256:
+        raise UploadError("No file or filename")
+    if not allowed_extension(filename, allowed_extensions):
+        raise UploadError("File type not allowed")
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError("File is empty")
+    if size > max_bytes:
+        raise UploadError(f"File too large (limit {max_bytes // (1024 * 1024)} MB)", 413)
+    sha256 = (sha256 or "").lower() or None
+    if sha256 and not _SHA256_RE.match(sha256):
+        raise UploadError("sha256 must be 64 hex digits")
+    session = UploadSession(
+        id=secrets.token_hex(16),
+        filename=filename,
+        total_size=size,
+        chunk_size=chunk_size,
+        received_bytes=0,
+        expected_sha256=sha256,
+    )
+    part_path(upload_folder, session.id).touch()
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def _hasher(session: UploadSession, path: Path):
+    """Running SHA-256 of the received bytes; rehashes the staging file if not in memory."""
+    hashed, h = _hashers.get(session.id, (0, None))
+    if h is None or hashed != session.received_bytes:
+        h = hashlib.sha256()
+        remaining = session.received_bytes
+        with open(path, "rb") as f:
+            while remaining and (chunk := f.read(min(CHUNK_SIZE, remaining))):
+                h.update(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            raise UploadError("Staging file is incomplete; start the upload again", 409)
+        _hashers[session.id] = (session.received_bytes, h)
+    return h
+
+
+def write_chunk(session: UploadSession, index: int, stream: BinaryIO, length: int | None, upload_folder: str) -> dict:
+    """
+    Append chunk index from stream (length bytes, the request's Content-Length). Chunks
+    already received are acknowledged without reading them again. Commits; returns the
+    session state.
+    """
+    offset = index * session.chunk_size
+    if index < 0 or offset >= session.total_size:
+        raise UploadError("Chunk index out of range")
+    expected = min(session.chunk_size, session.total_size - offset)
+    if offset + expected <= session.received_bytes:
+        return session_state(session)
+    if length is None:
+        raise UploadError("Content-Length required", 411)
+    if length != expected:
+        raise UploadError(f"Chunk {index} must be {expected} bytes")
+    path = part_path(upload_folder, session.id)
+    with _locked(session, path) as out:
+        if offset + expected <= session.received_bytes:
+            return session_state(session)  # a retry got here first
+        if offset != session.received_bytes:
+            raise UploadError(f"Expected chunk {session.next_chunk}", 409)
+        h = _hasher(session, path).copy()
+        # Drop bytes of an earlier attempt at this chunk that was cut off
+        out.truncate(offset)
+        out.seek(offset)
+        written = 0
+        while written < expected and (chunk := stream.read(min(CHUNK_SIZE, expected - written))):
+            h.update(chunk)
+            out.write(chunk)
+            written += len(chunk)
+        if written != expected:
+            out.truncate(offset)
+            raise UploadError(f"Chunk {index} incomplete: {written} of {expected} bytes")
+        out.flush()
+        updated = UploadSession.query.filter(
+            UploadSession.id == session.id, UploadSession.received_bytes == offset
+        ).update(
+            {UploadSession.received_bytes: offset + expected, UploadSession.updated_at: datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if not updated:
+            raise UploadError("Session changed concurrently; fetch its state and resume", 409)
+        _hashers[session.id] = (offset + expected, h)
+    db.session.refresh(session)
+    return session_state(session)
+
+
+def finalize(session: UploadSession, upload_folder: str) -> tuple[str, str, str]:
+    """
+    Move the completed staging file into storage and close the session (commits).
+    Returns (stored_path, original_filename, sha256) like storage.save_stream.
+    """
+    if session.received_bytes != session.total_size:
+        raise UploadError(
+            f"Upload incomplete: {session.received_bytes} of {session.total_size} bytes", 409
+        )
+    path = part_path(upload_folder, session.id)
+    with _locked(session, path):
+        if os.stat(path).st_size != session.total_size:
+            raise UploadError("Staging file is incomplete; start the upload again", 409)
+        content_hash = _hasher(session, path).hexdigest()
+        _hashers.pop(session.id, None)
+        if session.expected_sha256 and session.expected_sha256 != content_hash:
+            discard(session, upload_folder)
+            raise UploadError("Checksum mismatch; the upload was discarded", 422)
+        ext = session.filename.rsplit(".", 1)[-1].lower()
+        file_path = store_file(path, content_hash, ext, upload_folder)
+        filename = session.filename
+        db.session.delete(session)
+        db.session.commit()
+    return file_path, filename, content_hash
+
+
+def discard(session: UploadSession, upload_folder: str) -> None:
+    """Delete a session and its staging file. Commits."""
+    _hashers.pop(session.id, None)
+    part_path(upload_folder, session.id).unlink(missing_ok=True)
+    db.session.delete(session)
+    db.session.commit()
+
+
+def cleanup_sessions(upload_folder: str, max_age_seconds: float) -> int:
+    """
+    Remove sessions idle for longer than max_age_seconds and staging files without a
+    session (e.g. left by a crash). Returns the number of sessions removed.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for session in stale:
+        discard(session, upload_folder)
+    live = {sid for (sid,) in db.session.query(UploadSession.id)}
+    for path in incoming_dir(upload_folder).glob(f"*{PART_SUFFIX}"):
+        try:
+            if path.stem not in live and path.stat().st_mtime < time.time() - max_age_seconds:
+                path.unlink()
+        except OSError:
+            continue
+    if stale:
+        logger.info("Removed %d abandoned upload session(s)", len(stale))
+    return len(stale)
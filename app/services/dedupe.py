@@ -0,0 +1,81 @@
+"""
+One-off migration of UPLOAD_FOLDER to content-addressed storage: hash every receipt file,
+move it to ab/cd/<sha256>.<ext>, and merge receipts whose files are byte-identical
+(the oldest receipt is kept; tags of the duplicates are moved onto it).
+"""
+import logging
+from pathlib import Path
+
+from sqlalchemy import delete, insert, literal, select
+
+from app import db
+from app.models import OcrJob, Receipt, receipt_tags
+from app.services.storage import content_path, hash_file, path_for_receipt, remove_stored_file
+
+logger = logging.getLogger(__name__)
+
+
+def _merge_into(keeper_id: int, dup_id: int) -> None:
+    """Move dup's tags onto keeper, then delete dup (rollups/FTS follow via triggers)."""
+    db.session.execute(
+        insert(receipt_tags)
+        .prefix_with("OR IGNORE")
+        .from_select(
+            ["receipt_id", "tag_id"],
+            select(literal(keeper_id), receipt_tags.c.tag_id).where(receipt_tags.c.receipt_id == dup_id),
+        )
+    )
+    db.session.execute(delete(receipt_tags).where(receipt_tags.c.receipt_id == dup_id))
+    db.session.execute(delete(OcrJob).where(OcrJob.receipt_id == dup_id))
+    db.session.execute(delete(Receipt).where(Receipt.id == dup_id))
+
+
+def rehash_and_dedupe(upload_folder: str, dry_run: bool = False) -> dict:
+    """
+    Migrate every receipt to content-addressed storage. Commits per receipt so the
+    database is never locked for long. Returns counts: moved, merged, missing, unchanged.
+    """
+    stats = {"moved": 0, "merged": 0, "missing": 0, "unchanged": 0}
+    # Hash every file before merging anything, so each group of identical files keeps its
+    # lowest id whether or not that receipt was already hashed (legacy rows are the older ones)
+    groups = {}  # content hash -> receipt ids, ascending
+    for rid, file_path in db.session.execute(select(Receipt.id, Receipt.file_path).order_by(Receipt.id)):
+        full = path_for_receipt(upload_folder, file_path)
+        if full is None:
+            stats["missing"] += 1
+            logger.warning("Stored file missing for receipt_id=%s", rid)
+            continue
+        groups.setdefault(hash_file(full), []).append(rid)
+    for content_hash, (keeper_id, *dup_ids) in sorted(groups.items(), key=lambda item: item[1][0]):
+        keeper = db.session.get(Receipt, keeper_id)
+        full = path_for_receipt(upload_folder, keeper.file_path)
+        new_path = content_path(content_hash, full.suffix.lstrip(".").lower())
+        for dup_id in dup_ids:
+            stats["merged"] += 1
+            if dry_run:
+                continue
+            dup = db.session.get(Receipt, dup_id)
+            old_path = dup.file_path
+            db.session.expunge(dup)
+            _merge_into(keeper_id, dup_id)
+            db.session.commit()
+            # A duplicate already at the content path holds the keeper's file from now on
+            if old_path not in (keeper.file_path, new_path):
+                remove_stored_file(upload_folder, old_path)
+        if keeper.file_path == new_path and keeper.content_hash == content_hash:
+            stats["unchanged"] += 1
+            continue
+        stats["moved"] += 1
+        if dry_run:
+            continue
+        dest = Path(upload_folder) / new_path
+        if not dest.is_file():
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            full.replace(dest)
+        old_path = keeper.file_path
+        keeper.file_path = new_path
+        keeper.content_hash = content_hash
+        db.session.commit()
+        if old_path != new_path:
+            remove_stored_file(upload_folder, old_path)
+    return stats
@@ -0,0 +1,199 @@
+"""
+Bulk ingest: many uploaded files and/or ZIP archives in one request. Archive members are
+streamed straight into content-addressed storage (nothing is extracted to a temp dir first),
+new receipts are inserted in one transaction and OCR is queued for all of them.
+"""
+import zipfile
+import zlib
+from contextlib import nullcontext
+from functools import partial
+from pathlib import PurePosixPath
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.models import Receipt
+from app.services.jobs import enqueue_ocr
+from app.services.storage import remove_stored_file, save_stream
+
+ADDED = "added"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+
+def _stream_size(stream) -> int | None:
+    try:
+        pos = stream.tell()
+        size = stream.seek(0, 2)
+        stream.seek(pos)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def _iter_members(files: list[FileStorage], max_file_bytes: int):
+    """
+    Yield (label, filename, opener, error) for every uploaded file and every ZIP member.
+    opener() returns a context manager for the member's byte stream; it is only valid until
+    the next item is requested.
+    """
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if not file.filename.lower().endswith(".zip"):
+            size = _stream_size(file.stream)
+            if size is not None and size > max_file_bytes:
+                yield file.filename, file.filename, None, "File too large"
+            else:
+                yield file.filename, file.filename, partial(nullcontext, file.stream), None
+            continue
+        try:
+            archive = zipfile.ZipFile(file.stream)
+        except (zipfile.BadZipFile, OSError):
+            yield file.filename, None, None, "Not a valid ZIP archive"
+            continue
+        with archive:
+            for info in archive.infolist():
+                name = PurePosixPath(info.filename).name
+                # Skip folders and macOS/hidden metadata entries
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                label = f"{file.filename}: {info.filename}"
+                if info.flag_bits & 0x1:
+                    yield label, name, None, "Encrypted archive members are not supported"
+                elif info.file_size > max_file_bytes:
+                    # Declared size bounds what zipfile will decompress, so this also stops zip bombs
+                    yield label, name, None, "File too large"
+                else:
+                    yield label, name, partial(archive.open, info), None
+
+
+def _discard_copy(upload_folder: str, file_path: str, kept_path: str) -> None:
+    """
+    Remove a just-stored file whose bytes a receipt already has under another name (uploaded
+    with a different extension); nothing else can refer to it, paths are per hash and extension.
+    """
+    if file_path != kept_path:
+        remove_stored_file(upload_folder, file_path)
+
+
+def create_receipt(file_path: str, original_filename: str, content_hash: str, upload_folder: str) -> tuple[Receipt, bool]:
+    """
+    Receipt for a stored file, with OCR queued; commits. Returns (receipt, created): the
+    existing receipt and False when the same bytes were uploaded before (or concurrently).
+    """
+    existing = Receipt.query.filter_by(content_hash=content_hash).first()
+    if existing:
+        _discard_copy(upload_folder, file_path, existing.file_path)
+        return existing, False
+    receipt = Receipt(file_path=file_path, original_filename=original_filename, content_hash=content_hash)
+    db.session.add(receipt)
+    enqueue_ocr(receipt)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Same file uploaded concurrently; the other request created the receipt
+        db.session.rollback()
+        existing = Receipt.query.filter_by(content_hash=content_hash).one()
+        _discard_copy(upload_folder, file_path, existing.file_path)
+        return existing, False
+    return receipt, True
+
+
+def upload_notice(receipt: Receipt, outcome: str) -> str | None:
+    """Message shown after a single upload: outcome is "created" or "duplicate"."""
+    if outcome == "created":
+        return f"Uploaded {receipt.original_filename}. Text extraction runs in the background."
+    if outcome == "duplicate":
+        return f"This file was already uploaded as {receipt.original_filename}."
+    return None
+
+
+def _insert_receipts(stored: dict[str, tuple[str, str]], upload_folder: str) -> tuple[dict[str, int], set[str]]:
+    """
+    Create receipts (and OCR jobs) for content hashes not yet in the database, in one
+    transaction. Returns (content_hash -> receipt id for all hashes, hashes that were added).
+    """
+    for attempt in range(2):
+        ids, existing_paths = {}, {}
+        for content_hash, receipt_id, file_path in db.session.execute(
+            select(Receipt.content_hash, Receipt.id, Receipt.file_path).where(Receipt.content_hash.in_(list(stored)))
+        ):
+            ids[content_hash] = receipt_id
+            existing_paths[content_hash] = file_path
+        new = {}
+        for content_hash, (file_path, original_filename) in stored.items():
+            if content_hash in ids:
+                _discard_copy(upload_folder, file_path, existing_paths[content_hash])
+                continue
+            receipt = Receipt(file_path=file_path, original_filename=original_filename, content_hash=content_hash)
+            db.session.add(receipt)
+            enqueue_ocr(receipt)
+            new[content_hash] = receipt
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent upload stored one of the same files; look the hashes up again
+            db.session.rollback()
+            if attempt:
+                raise
+            continue
+        ids.update({h: r.id for h, r in new.items()})
+        return ids, set(new)
+    return {}, set()
+
+
+def ingest_files(
+    files: list[FileStorage],
+    upload_folder: str,
+    allowed_extensions: set[str],
+    max_file_bytes: int,
+    max_files: int,
+) -> list[dict]:
+    """
+    Store every file (ZIP archives are expanded member by member) and create receipts.
+    Returns one result per file: filename, status (added/duplicate/rejected), receipt_id, message.
+    """
+    results = []
+    hashes = []  # content hash per result, None for rejected files
+    stored = {}  # content_hash -> (file_path, original_filename), first occurrence wins
+    count = 0
+    for label, name, opener, error in _iter_members(files, max_file_bytes):
+        if count >= max_files:
+            results.append({"filename": label, "status": REJECTED, "receipt_id": None,
+                            "message": f"Batch limit of {max_files} files reached"})
+            hashes.append(None)
+            continue
+        count += 1
+        content_hash = None
+        if error is None:
+            try:
+                with opener() as stream:
+                    file_path, _, content_hash = save_stream(stream, name, upload_folder, allowed_extensions)
+            except ValueError as e:
+                error = str(e)
+            except (zipfile.BadZipFile, zlib.error, EOFError, OSError):
+                error = "Could not read file from archive"
+        if content_hash:
+            if content_hash in stored:
+                _discard_copy(upload_folder, file_path, stored[content_hash][0])
+            else:
+                stored[content_hash] = (file_path, name)
+        results.append({"filename": label, "status": REJECTED, "receipt_id": None, "message": error})
+        hashes.append(content_hash)
+
+    ids, added = _insert_receipts(stored, upload_folder) if stored else ({}, set())
+    first_seen = set()
+    for result, content_hash in zip(results, hashes):
+        if content_hash is None:
+            continue
+        result["receipt_id"] = ids.get(content_hash)
+        if content_hash in added and content_hash not in first_seen:
+            result["status"] = ADDED
+        else:
+            result["status"] = DUPLICATE
+            result["message"] = "Already uploaded"
+        first_seen.add(content_hash)
+    return results
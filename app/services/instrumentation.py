@@ -0,0 +1,125 @@
+"""
+Request instrumentation: per-endpoint latency histograms, request body (upload) bytes, SQL
+statement counts and time (SQLAlchemy cursor events), one structured JSON log line per
+request, and an opt-in profiler (PROFILING_ENABLED, then `X-Profile: 1` or `?_profile=1`)
+that returns a pyinstrument or cProfile report instead of the page. Latency of streamed
+responses (exports) covers the view only, not sending the body.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import time
+
+from flask import Flask, current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from app import db
+from app.services import metrics
+
+try:
+    from pyinstrument import Profiler
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:
+    PYINSTRUMENT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger("app.requests")
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "WITH"}
+
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in _OPERATIONS else "OTHER"
+
+
+def _instrument_sql(engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        metrics.observe("db_query_duration_seconds", elapsed, operation=_operation(statement))
+        if has_request_context() and "sql" in g:
+            g.sql[0] += 1
+            g.sql[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+
+def _profile_requested() -> bool:
+    return current_app.config["PROFILING_ENABLED"] and (
+        request.headers.get("X-Profile") == "1" or request.args.get("_profile") == "1"
+    )
+
+
+def _start_profiler():
+    if PYINSTRUMENT_AVAILABLE and current_app.config["PROFILER"] != "cprofile":
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _profile_response(profiler):
+    if PYINSTRUMENT_AVAILABLE and isinstance(profiler, Profiler):
+        profiler.stop()
+        return current_app.response_class(profiler.output_html(), mimetype="text/html")
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+    return current_app.response_class(out.getvalue(), mimetype="text/plain")
+
+
+def init_instrumentation(app: Flask) -> None:
+    """Register the request hooks and SQL event listeners (call inside the app context)."""
+    _instrument_sql(db.engine)
+
+    @app.before_request
+    def _start():
+        g.request_start = time.perf_counter()
+        g.sql = [0, 0.0]
+        g.profiler = _start_profiler() if _profile_requested() else None
+
+    @app.after_request
+    def _finish(response):
+        if "request_start" not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or "unmatched"
+        metrics.observe(
+            "http_request_duration_seconds", elapsed,
+            endpoint=endpoint, method=request.method, status=response.status_code,
+        )
+        body_bytes = request.content_length or 0
+        if body_bytes:
+            metrics.inc("http_request_body_bytes_total", body_bytes, endpoint=endpoint)
+            metrics.observe("http_request_body_bytes", body_bytes, endpoint=endpoint)
+        queries, sql_seconds = g.sql
+        if queries:
+            metrics.inc("db_queries_total", queries, endpoint=endpoint)
+        if app.config["REQUEST_LOG"]:
+            request_logger.info(json.dumps({
+                "event": "request",
+                "method": request.method,
+                "path": request.path,
+                "endpoint": endpoint,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 2),
+                "sql_queries": queries,
+                "sql_ms": round(sql_seconds * 1000, 2),
+                "body_bytes": body_bytes,
+            }))
+        if g.profiler is not None:
+            logger.info("Profiled %s %s", request.method, request.path)
+            return _profile_response(g.profiler)
+        return response
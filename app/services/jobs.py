@@ -0,0 +1,395 @@
+"""
+SQLite-backed OCR job queue. Upload enqueues a job; `flask ocr-worker` claims jobs
+and runs extract_text_and_meta in a process pool, writing results back to the DB.
+Jobs survive restarts: running jobs whose lease expired return to the queue, and
+failures are retried with exponential backoff up to OCR_MAX_ATTEMPTS. While the queue
+is empty the worker also advances unfinished schema backfills (services/backfill.py), trims
+the tag index change log (services/tag_index.py) and removes abandoned chunked uploads.
+Job latency and per-stage OCR timings are recorded in the worker's metrics registry and
+written to METRICS_TEXTFILE_DIR/ocr-worker.prom, which the web app's /metrics serves.
+"""
+import logging
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import Flask
+from sqlalchemy import text
+
+from app import db
+from app.models import OCR_DONE, OCR_FAILED, OCR_PENDING, OCR_RUNNING, OcrJob, Receipt
+from app.services import metrics, tag_index
+from app.services.backfill import pending_backfills, run_batch
+from app.services.chunked_upload import cleanup_sessions
+from app.services.merchants import resolve_merchant
+from app.services.ocr import extract_text_and_meta, ocr_options, warm_engine
+from app.services.renditions import ensure_renditions
+from app.services.sqlite_tuning import immediate_transaction
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_ocr(receipt: Receipt) -> OcrJob:
+    """Queue (or re-queue) OCR for a receipt. Caller commits."""
+    job = receipt.ocr_job
+    if job is None:
+        job = OcrJob(receipt=receipt)
+        db.session.add(job)
+    job.status = OCR_PENDING
+    job.attempts = 0
+    job.last_error = None
+    job.run_after = datetime.utcnow()
+    job.locked_at = None
+    job.locked_by = None
+    receipt.ocr_status = OCR_PENDING
+    return job
+
+
+def requeue_ocr(failed_only: bool = True, batch_size: int = 500) -> int:
+    """
+    Queue OCR again for receipts whose job failed (or for every receipt), with set-based
+    statements over id ranges of batch_size, one short write transaction each. Returns the
+    number of receipts queued.
+    """
+    ids = "SELECT receipt_id AS id FROM ocr_jobs WHERE status = :failed" if failed_only else "SELECT id FROM receipts"
+    only_failed = " AND status = :failed" if failed_only else ""
+    total, after_id = 0, 0
+    while True:
+        now = datetime.utcnow()
+        with immediate_transaction() as conn:
+            last_id = conn.execute(
+                text(f"SELECT max(id) FROM (SELECT id FROM ({ids}) WHERE id > :after ORDER BY id LIMIT :n)"),
+                {"after": after_id, "n": batch_size, "failed": OCR_FAILED},
+            ).scalar()
+            if last_id is None:
+                return total
+            params = {"a": after_id, "b": last_id, "now": now, "pending": OCR_PENDING, "failed": OCR_FAILED}
+            conn.execute(
+                text(
+                    "UPDATE receipts SET ocr_status = :pending WHERE id > :a AND id <= :b AND id IN "
+                    f"(SELECT receipt_id FROM ocr_jobs WHERE receipt_id > :a AND receipt_id <= :b{only_failed})"
+                    if failed_only
+                    else "UPDATE receipts SET ocr_status = :pending WHERE id > :a AND id <= :b"
+                ),
+                params,
+            )
+            if not failed_only:
+                conn.execute(
+                    text(
+                        "INSERT OR IGNORE INTO ocr_jobs (receipt_id, status, attempts, run_after, created_at, updated_at) "
+                        "SELECT id, :pending, 0, :now, :now, :now FROM receipts WHERE id > :a AND id <= :b"
+                    ),
+                    params,
+                )
+            total += conn.execute(
+                text(
+                    "UPDATE ocr_jobs SET status = :pending, attempts = 0, last_error = NULL, run_after = :now, "
+                    "locked_at = NULL, locked_by = NULL, updated_at = :now "
+                    f"WHERE receipt_id > :a AND receipt_id <= :b{only_failed}"
+                ),
+                params,
+            ).rowcount
+        after_id = last_id
+
+
+def _set_receipt_status(receipt_ids, status: str) -> None:
+    if receipt_ids:
+        Receipt.query.filter(Receipt.id.in_(receipt_ids)).update(
+            {Receipt.ocr_status: status}, synchronize_session=False
+        )
+
+
+def requeue_stale(lease_seconds: float) -> int:
+    """Return running jobs whose lease expired (crashed/killed worker) to the queue."""
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    stale = OcrJob.query.filter(OcrJob.status == OCR_RUNNING, OcrJob.locked_at < cutoff).all()
+    for job in stale:
+        job.status = OCR_PENDING
+        job.locked_at = None
+        job.locked_by = None
+    _set_receipt_status([j.receipt_id for j in stale], OCR_PENDING)
+    db.session.commit()
+    if stale:
+        logger.warning("Re-queued %d stale OCR job(s)", len(stale))
+    return len(stale)
+
+
+def renew_leases(worker_id: str, job_ids) -> None:
+    """Move locked_at forward for jobs this worker is still running, so requeue_stale skips them."""
+    if not job_ids:
+        return
+    OcrJob.query.filter(
+        OcrJob.id.in_(job_ids), OcrJob.status == OCR_RUNNING, OcrJob.locked_by == worker_id
+    ).update({OcrJob.locked_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+
+
+def _claimed(job_id: int, worker_id: str) -> OcrJob | None:
+    """The job if it is still running under worker_id's claim (not requeued and claimed again)."""
+    job = db.session.get(OcrJob, job_id)
+    if job is None or job.status != OCR_RUNNING or job.locked_by != worker_id:
+        logger.warning("Discarding OCR outcome of job_id=%s: no longer claimed by %s", job_id, worker_id)
+        return None
+    return job
+
+
+def claim_next(worker_id: str) -> OcrJob | None:
+    """Atomically claim the oldest runnable job; None if the queue is empty."""
+    now = datetime.utcnow()
+    candidates = (
+        db.session.query(OcrJob.id)
+        .filter(OcrJob.status == OCR_PENDING, OcrJob.run_after <= now)
+        .order_by(OcrJob.run_after, OcrJob.id)
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        # Conditional update: only one worker can move a job out of pending
+        claimed = OcrJob.query.filter(OcrJob.id == job_id, OcrJob.status == OCR_PENDING).update(
+            {
+                OcrJob.status: OCR_RUNNING,
+                OcrJob.attempts: OcrJob.attempts + 1,
+                OcrJob.locked_at: now,
+                OcrJob.locked_by: worker_id,
+            },
+            synchronize_session=False,
+        )
+        if claimed:
+            job = db.session.get(OcrJob, job_id)
+            db.session.refresh(job)
+            _set_receipt_status([job.receipt_id], OCR_RUNNING)
+            db.session.commit()
+            return job
+    db.session.commit()
+    return None
+
+
+def complete_job(job_id: int, meta: dict, worker_id: str) -> None:
+    """Store OCR results on the receipt and mark the job done, if worker_id still holds it."""
+    job = _claimed(job_id, worker_id)
+    if job is None:
+        return
+    receipt = job.receipt
+    receipt.extracted_text = meta.get("extracted_text")
+    receipt.receipt_date = meta.get("receipt_date")
+    receipt.merchant = meta.get("merchant")
+    receipt.merchant_id = resolve_merchant(db.session.connection(), receipt.merchant)
+    receipt.total_cents = meta.get("total_cents")
+    receipt.tax_cents = meta.get("tax_cents")
+    receipt.currency = meta.get("currency")
+    receipt.ocr_status = OCR_DONE
+    job.status = OCR_DONE
+    job.last_error = None
+    job.locked_at = None
+    job.locked_by = None
+    db.session.commit()
+
+
+def fail_job(job_id: int, worker_id: str, error: str, max_attempts: int, retry_delay: float) -> None:
+    """Schedule a retry with backoff, or mark the job failed after max_attempts (if worker_id holds it)."""
+    job = _claimed(job_id, worker_id)
+    if job is None:
+        return
+    job.last_error = (error or "")[:512]
+    job.locked_at = None
+    job.locked_by = None
+    if job.attempts >= max_attempts:
+        job.status = OCR_FAILED
+        job.receipt.ocr_status = OCR_FAILED
+        logger.warning("OCR failed for receipt_id=%s (giving up after %d attempts)", job.receipt_id, job.attempts)
+    else:
+        job.status = OCR_PENDING
+        job.run_after = datetime.utcnow() + timedelta(seconds=retry_delay * 2 ** (job.attempts - 1))
+        job.receipt.ocr_status = OCR_PENDING
+        logger.warning("OCR failed for receipt_id=%s (attempt %d, will retry)", job.receipt_id, job.attempts)
+    db.session.commit()
+
+
+def release_jobs(job_ids, worker_id: str) -> None:
+    """Put claimed jobs back in the queue without counting the attempt (worker shutdown)."""
+    jobs = OcrJob.query.filter(
+        OcrJob.id.in_(job_ids), OcrJob.status == OCR_RUNNING, OcrJob.locked_by == worker_id
+    ).all()
+    for job in jobs:
+        job.status = OCR_PENDING
+        job.attempts = max(job.attempts - 1, 0)
+        job.locked_at = None
+        job.locked_by = None
+    _set_receipt_status([j.receipt_id for j in jobs], OCR_PENDING)
+    db.session.commit()
+
+
+def _store_outcome(job_id: int, worker_id: str, cfg, meta: dict | None = None, error: str | None = None) -> None:
+    """
+    complete_job (meta) or fail_job (error) for a finished job. A database error while storing
+    (e.g. still locked after busy_timeout) is logged and the job is failed with a retry, or left
+    to its lease expiry if even that fails, so the worker loop keeps running.
+    """
+    try:
+        if meta is not None:
+            complete_job(job_id, meta, worker_id)
+        else:
+            fail_job(job_id, worker_id, error, cfg["OCR_MAX_ATTEMPTS"], cfg["OCR_RETRY_DELAY"])
+        return
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Could not store the OCR outcome of job_id=%s", job_id)
+        error = f"Storing result failed: {type(e).__name__}"
+    try:
+        fail_job(job_id, worker_id, error, cfg["OCR_MAX_ATTEMPTS"], cfg["OCR_RETRY_DELAY"])
+    except Exception:
+        db.session.rollback()
+        logger.exception("Could not fail job_id=%s; it returns to the queue when its lease expires", job_id)
+
+
+def _attempt(step: str, fn, *args) -> bool:
+    """
+    Run a maintenance step of the worker loop. A database error (e.g. still locked after
+    busy_timeout) or file error is logged and rolled back instead of stopping the worker.
+    """
+    try:
+        fn(*args)
+        return True
+    except Exception:
+        db.session.rollback()
+        logger.exception("OCR worker: %s failed; will retry", step)
+        return False
+
+
+def _prune_tag_index_log(keep: int) -> None:
+    with immediate_transaction() as conn:
+        tag_index.prune_log(conn, keep)
+
+
+def _advance_backfill(backfills: list[str], batch_size: int) -> None:
+    if not run_batch(backfills[0], batch_size):
+        backfills.pop(0)
+
+
+def _process_receipt(upload_folder, file_path, content_hash, options, rendition_sizes) -> dict:
+    """Child-process task: OCR the file, then pre-generate its thumbnails."""
+    meta = extract_text_and_meta(upload_folder, file_path, content_hash, options)
+    start = time.perf_counter()
+    ensure_renditions(upload_folder, file_path, content_hash, rendition_sizes)
+    meta["timings"]["renditions"] = time.perf_counter() - start
+    return meta
+
+
+def _record_job(outcome: str, seconds: float, timings: dict | None = None) -> None:
+    metrics.inc("ocr_jobs_total", outcome=outcome)
+    metrics.observe("ocr_job_duration_seconds", seconds, outcome=outcome)
+    for stage, stage_seconds in (timings or {}).items():
+        metrics.observe("ocr_stage_duration_seconds", stage_seconds, stage=stage)
+
+
+def _write_metrics(textfile: Path | None) -> None:
+    if textfile is None:
+        return
+    try:
+        metrics.write_textfile(textfile, prefix="ocr_")
+    except OSError as e:
+        logger.warning("Could not write worker metrics to %s: %s", textfile, e)
+
+
+def _raise_exit(signum, frame):
+    raise SystemExit(0)
+
+
+def run_worker(app: Flask, workers: int | None = None, once: bool = False) -> None:
+    """
+    Worker loop: claim jobs up to the pool size, run OCR in child processes, store results.
+    With once=True, return when the queue is drained. Must run inside an app context.
+    """
+    cfg = app.config
+    workers = workers or cfg["OCR_WORKERS"]
+    poll = cfg["OCR_POLL_INTERVAL"]
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    upload_folder = cfg["UPLOAD_FOLDER"]
+    options = ocr_options(cfg)
+    # systemd stops with SIGTERM; turn it into SystemExit so claimed jobs are released
+    signal.signal(signal.SIGTERM, _raise_exit)
+    textfile = Path(cfg["METRICS_TEXTFILE_DIR"]) / "ocr-worker.prom" if cfg["METRICS_ENABLED"] else None
+    metrics_written = 0.0
+    housekeeping_done = 0.0
+    leases_renewed = 0.0
+    backfill_retry_at = 0.0
+    logger.info("OCR worker %s started with %d process(es)", worker_id, workers)
+
+    backfills = pending_backfills()
+    in_flight = {}  # future -> (job id, submit time)
+    # Each child loads its OCR engine once and keeps it for all the jobs it runs
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_engine, initargs=(options,))
+    try:
+        while True:
+            # Jobs in flight keep their lease however long they run (e.g. many-page scans)
+            if in_flight and time.monotonic() - leases_renewed >= cfg["OCR_LEASE_SECONDS"] / 4:
+                if _attempt("lease renewal", renew_leases, worker_id, [job_id for job_id, _ in in_flight.values()]):
+                    leases_renewed = time.monotonic()
+            _attempt("requeueing stale jobs", requeue_stale, cfg["OCR_LEASE_SECONDS"])
+            while len(in_flight) < workers:
+                job = claim_next(worker_id)
+                if job is None:
+                    break
+                receipt = job.receipt
+                future = pool.submit(
+                    _process_receipt,
+                    upload_folder,
+                    receipt.file_path,
+                    receipt.content_hash,
+                    options,
+                    cfg["RENDITION_PREGENERATE"],
+                )
+                in_flight[future] = (job.id, time.perf_counter())
+            if textfile and time.monotonic() - metrics_written >= cfg["METRICS_WRITE_INTERVAL"]:
+                _write_metrics(textfile)
+                metrics_written = time.monotonic()
+            if not in_flight:
+                if backfills and time.monotonic() >= backfill_retry_at:
+                    # Idle: advance schema backfills one short transaction at a time
+                    if _attempt(f"backfill {backfills[0]}", _advance_backfill, backfills, cfg["BACKFILL_BATCH_SIZE"]):
+                        continue
+                    backfill_retry_at = time.monotonic() + 60
+                if time.monotonic() - housekeeping_done >= 60:
+                    # Attempted once a minute whether or not they succeed, so failures don't spin
+                    _attempt("tag index log pruning", _prune_tag_index_log, cfg["TAG_INDEX_LOG_KEEP"])
+                    _attempt("upload session cleanup", cleanup_sessions, upload_folder, cfg["UPLOAD_SESSION_TTL"])
+                    housekeeping_done = time.monotonic()
+                if once:
+                    return
+                time.sleep(poll)
+                continue
+            done, _ = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                job_id, submitted = in_flight.pop(future)
+                try:
+                    meta = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    _record_job("crashed", time.perf_counter() - submitted)
+                    _store_outcome(job_id, worker_id, cfg, error="OCR process crashed")
+                except Exception as e:
+                    _record_job("error", time.perf_counter() - submitted)
+                    _store_outcome(job_id, worker_id, cfg, error=type(e).__name__)
+                else:
+                    _record_job("done", time.perf_counter() - submitted, meta.pop("timings", None))
+                    _store_outcome(job_id, worker_id, cfg, meta=meta)
+            if broken:
+                # A child died (e.g. OOM kill); every pending future is lost with it
+                for job_id, submitted in in_flight.values():
+                    _record_job("crashed", time.perf_counter() - submitted)
+                    _store_outcome(job_id, worker_id, cfg, error="OCR process crashed")
+                in_flight.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_engine, initargs=(options,))
+    finally:
+        if in_flight:
+            release_jobs([job_id for job_id, _ in in_flight.values()], worker_id)
+        pool.shutdown(wait=False, cancel_futures=True)
+        _write_metrics(textfile)
+        logger.info("OCR worker %s stopped", worker_id)
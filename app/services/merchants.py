@@ -0,0 +1,125 @@
+"""
+Merchant dictionary: maps the free-text merchant line from OCR to a canonical merchant id.
+A spelling is normalized (services/receipt_parser.py) and looked up in merchant_aliases;
+unseen spellings are matched against existing merchants by trigram similarity (postings in
+merchant_trigrams, Dice coefficient) and either become an alias of the best match or a new
+merchant. Works on a Core connection so the OCR worker, backfills and the CLI share it.
+"""
+import logging
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, text
+
+from app import db
+from app.services.backfill import mark_finished
+from app.services.receipt_parser import display_name, normalize_merchant, trigrams
+from app.services.sqlite_tuning import immediate_transaction
+
+logger = logging.getLogger(__name__)
+
+_CANDIDATES = 20  # merchants sharing the most trigrams that are scored exactly
+
+_CANDIDATES_SQL = text(
+    "SELECT t.merchant_id, count(*) AS shared, m.trigram_count "
+    "FROM merchant_trigrams t JOIN merchants m ON m.id = t.merchant_id "
+    "WHERE t.trigram IN :grams "
+    "GROUP BY t.merchant_id ORDER BY shared DESC, t.merchant_id LIMIT :n"
+).bindparams(bindparam("grams", expanding=True))
+
+
+def _threshold() -> float:
+    return current_app.config.get("MERCHANT_MATCH_THRESHOLD", 0.6)
+
+
+def best_match(conn, key: str, threshold: float) -> tuple[int, float] | None:
+    """(merchant_id, similarity) of the closest existing merchant, if at least threshold."""
+    grams = trigrams(key)
+    if not grams:
+        return None
+    best = None
+    for merchant_id, shared, count in conn.execute(_CANDIDATES_SQL, {"grams": sorted(grams), "n": _CANDIDATES}):
+        score = 2 * shared / (len(grams) + count)
+        if score >= threshold and (best is None or score > best[1]):
+            best = (merchant_id, score)
+    return best
+
+
+def _create_merchant(conn, name: str, key: str) -> int:
+    grams = sorted(trigrams(key))
+    result = conn.execute(
+        text(
+            'INSERT INTO merchants (name, "key", trigram_count, created_at) VALUES (:name, :key, :n, :now) '
+            'ON CONFLICT("key") DO NOTHING'
+        ),
+        {"name": display_name(name) or key, "key": key, "n": len(grams), "now": datetime.utcnow()},
+    )
+    merchant_id = conn.execute(text('SELECT id FROM merchants WHERE "key" = :key'), {"key": key}).scalar()
+    if result.rowcount:
+        conn.execute(
+            text("INSERT INTO merchant_trigrams (trigram, merchant_id) VALUES (:g, :id)"),
+            [{"g": g, "id": merchant_id} for g in grams],
+        )
+    return merchant_id
+
+
+def resolve_merchant(conn, name: str | None, threshold: float | None = None) -> int | None:
+    """
+    Merchant id for a merchant spelling, learning it if unseen: becomes an alias of the most
+    similar merchant, or a new merchant. None if nothing identifying is left after normalizing.
+    """
+    key = normalize_merchant(name or "")
+    if not key:
+        return None
+    merchant_id = conn.execute(
+        text("SELECT merchant_id FROM merchant_aliases WHERE alias_key = :key"), {"key": key}
+    ).scalar()
+    if merchant_id is not None:
+        return merchant_id
+    match = best_match(conn, key, _threshold() if threshold is None else threshold)
+    merchant_id = match[0] if match else _create_merchant(conn, name, key)
+    conn.execute(
+        text("INSERT INTO merchant_aliases (alias_key, merchant_id) VALUES (:key, :id) ON CONFLICT DO NOTHING"),
+        {"key": key, "id": merchant_id},
+    )
+    return merchant_id
+
+
+def build_dictionary(rebuild: bool = False, batch_size: int = 200, threshold: float | None = None) -> dict:
+    """
+    Learn the dictionary from existing receipts and set receipts.merchant_id. Spellings are
+    processed most frequent first, so the common spelling becomes the merchant's name and
+    OCR variants attach to it. Updates go through ix_receipts_merchant, one short write
+    transaction per batch of spellings; this also completes the receipts_merchant_id
+    backfill. rebuild=True forgets all merchants first.
+    """
+    with immediate_transaction() as conn:
+        if rebuild:
+            conn.execute(text("UPDATE receipts SET merchant_id = NULL WHERE merchant_id IS NOT NULL"))
+            conn.execute(text("DELETE FROM merchant_aliases"))
+            conn.execute(text("DELETE FROM merchant_trigrams"))
+            conn.execute(text("DELETE FROM merchants"))
+        spellings = [
+            name
+            for (name,) in conn.execute(
+                text(
+                    "SELECT merchant FROM receipts WHERE merchant IS NOT NULL AND merchant <> '' "
+                    "GROUP BY merchant ORDER BY count(*) DESC, merchant"
+                )
+            )
+        ]
+    updated = 0
+    for start in range(0, len(spellings), batch_size):
+        with immediate_transaction() as conn:
+            for name in spellings[start:start + batch_size]:
+                merchant_id = resolve_merchant(conn, name, threshold)
+                updated += conn.execute(
+                    text("UPDATE receipts SET merchant_id = :id WHERE merchant = :name AND merchant_id IS NOT :id"),
+                    {"id": merchant_id, "name": name},
+                ).rowcount
+    mark_finished("receipts_merchant_id")
+    with db.engine.connect() as conn:
+        merchants = conn.execute(text("SELECT count(*) FROM merchants")).scalar()
+        aliases = conn.execute(text("SELECT count(*) FROM merchant_aliases")).scalar()
+    logger.info("Merchant dictionary: %d spellings, %d merchants, %d receipts updated", len(spellings), merchants, updated)
+    return {"spellings": len(spellings), "merchants": merchants, "aliases": aliases, "receipts_updated": updated}
@@ -0,0 +1,141 @@
+"""
+In-process metrics registry (counters and histograms) rendered in the Prometheus text format.
+No Flask and no dependencies, so the OCR worker uses it too. Each process keeps its own
+values: the web app serves them on /metrics (services/instrumentation.py), the OCR worker
+writes its ocr_* families to a textfile that /metrics appends (same idea as the node
+exporter's textfile collector).
+"""
+import bisect
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+
+_lock = threading.Lock()
+# name -> {"type", "help", "buckets", "samples": {label items: value | [bucket counts, sum, count]}}
+_families = {}
+
+
+def _define(name: str, type_: str, help_: str, buckets=None) -> None:
+    with _lock:
+        _families.setdefault(name, {"type": type_, "help": help_, "buckets": buckets, "samples": {}})
+
+
+def counter(name: str, help_: str) -> None:
+    _define(name, "counter", help_)
+
+
+def histogram(name: str, help_: str, buckets=DEFAULT_BUCKETS) -> None:
+    _define(name, "histogram", help_, tuple(buckets))
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        samples = _families[name]["samples"]
+        samples[key] = samples.get(key, 0.0) + amount
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        family = _families[name]
+        sample = family["samples"].get(key)
+        if sample is None:
+            sample = family["samples"][key] = [[0] * len(family["buckets"]), 0.0, 0]
+        i = bisect.bisect_left(family["buckets"], value)
+        if i < len(family["buckets"]):
+            sample[0][i] += 1  # cumulated when rendering
+        sample[1] += value
+        sample[2] += 1
+
+
+def reset() -> None:
+    """Drop all recorded values (definitions stay)."""
+    with _lock:
+        for family in _families.values():
+            family["samples"].clear()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(items, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in items]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render(prefix: str = "", exclude: str | None = None) -> str:
+    """
+    Text exposition format (version 0.0.4) of every family whose name starts with prefix
+    and not with exclude. Families without samples are left out.
+    """
+    lines = []
+    with _lock:
+        for name, family in sorted(_families.items()):
+            if not name.startswith(prefix) or (exclude and name.startswith(exclude)) or not family["samples"]:
+                continue
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for key, sample in sorted(family["samples"].items()):
+                if family["type"] == "counter":
+                    lines.append(f"{name}{_labels(key)} {_number(sample)}")
+                    continue
+                counts, total, count = sample
+                cumulative = 0
+                for bound, n in zip(family["buckets"], counts):
+                    cumulative += n
+                    le = _labels(key, 'le="%s"' % _number(bound))
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                le = _labels(key, 'le="+Inf"')
+                lines.append(f"{name}_bucket{le} {count}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(key)} {count}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def render_gauge(name: str, help_: str, samples: dict) -> str:
+    """A gauge computed at scrape time; samples maps label dicts (as item tuples) to values."""
+    lines = [f"# HELP {name} {help_}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_labels(key)} {_number(value)}" for key, value in sorted(samples.items())]
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str | Path, prefix: str = "") -> None:
+    """Atomically write render(prefix) to path, for another process to serve."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as out:
+            out.write(render(prefix))
+        os.replace(tmp_name, path)
+    finally:
+        Path(tmp_name).unlink(missing_ok=True)
+
+
+# Metric families used across the app
+
+
+histogram("http_request_duration_seconds", "Request latency by endpoint, method and status.")
+counter("http_request_body_bytes_total", "Request body bytes received (uploads) by endpoint.")
+histogram("http_request_body_bytes", "Request body size by endpoint.", SIZE_BUCKETS)
+histogram("db_query_duration_seconds", "SQL statement latency by operation.")
+counter("db_queries_total", "SQL statements executed per endpoint.")
+histogram("ocr_stage_duration_seconds", "Time per OCR job spent in each pipeline stage (cache, pdf_text, rasterize, "
+          "tesseract, parse, renditions).")
+histogram("ocr_job_duration_seconds", "OCR job latency from submission to result, by outcome.",
+          DEFAULT_BUCKETS + (120.0, 300.0))
+counter("ocr_jobs_total", "OCR jobs finished by outcome.")
+counter("cache_requests_total", "Application cache lookups by cache and result (hit, shared_hit, miss).")
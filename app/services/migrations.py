@@ -0,0 +1,144 @@
+"""
+Versioned schema migrations for the SQLite database. Each module app/migrations/vNNNN_<name>.py
+defines upgrade(conn); the applied version is kept in PRAGMA user_version, so the startup
+check is a single header read instead of create_all() reflection. Every migration runs in
+its own BEGIN IMMEDIATE transaction (SQLite DDL is transactional): a failed migration leaves
+the schema at the previous version, and concurrent processes apply each migration once.
+Data backfills that must not hold the write lock run separately (services/backfill.py).
+"""
+import importlib
+import logging
+import pkgutil
+import re
+import time
+from functools import cache
+
+from flask import Flask
+
+from app import db
+from app.services.sqlite_tuning import immediate_transaction
+
+logger = logging.getLogger(__name__)
+
+_MODULE_RE = re.compile(r"^v(\d{4})_\w+$")
+
+
+@cache
+def available_migrations() -> list[tuple[int, str, object]]:
+    """(version, name, module) for every migration module, in version order."""
+    import app.migrations as package
+
+    found = []
+    for info in pkgutil.iter_modules(package.__path__):
+        m = _MODULE_RE.match(info.name)
+        if m:
+            found.append((int(m.group(1)), info.name, importlib.import_module(f"{package.__name__}.{info.name}")))
+    found.sort()
+    versions = [v for v, _, _ in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError("Duplicate migration version numbers in app/migrations")
+    return found
+
+
+def latest_version() -> int:
+    migrations = available_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def schema_version(conn) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+# Helpers for migration modules (SQLite ALTER TABLE has no IF NOT EXISTS)
+
+
+def schema_objects(conn, type_: str | None = None) -> set[str]:
+    """Names of tables/indexes/triggers in the database (optionally of one type)."""
+    if type_:
+        rows = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = ?", (type_,))
+    else:
+        rows = conn.exec_driver_sql("SELECT name FROM sqlite_master")
+    return {name for (name,) in rows}
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.exec_driver_sql(f"PRAGMA table_info({table})"))
+
+
+def add_column(conn, table: str, column: str, ddl: str) -> bool:
+    """ALTER TABLE ADD COLUMN unless the column exists (databases made by create_all). Returns if added."""
+    if column_exists(conn, table, column):
+        return False
+    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+
+def execute_all(conn, statements) -> None:
+    for stmt in statements:
+        conn.exec_driver_sql(stmt)
+
+
+def upgrade(target: int | None = None) -> list[str]:
+    """Apply pending migrations up to target (default: latest). Returns the names applied."""
+    applied = []
+    for version, name, module in available_migrations():
+        if target is not None and version > target:
+            break
+        try:
+            with immediate_transaction() as conn:
+                if version <= schema_version(conn):  # already applied, maybe by another process
+                    continue
+                module.upgrade(conn)
+                conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+        except Exception:
+            logger.exception("Migration %s failed; schema left at version %d", name, version - 1)
+            raise
+        logger.info("Applied migration %s", name)
+        applied.append(name)
+    return applied
+
+
+def status() -> dict:
+    """Current and latest schema version plus the names of pending migrations."""
+    with db.engine.connect() as conn:
+        current = schema_version(conn)
+    return {
+        "version": current,
+        "latest": latest_version(),
+        "pending": [name for version, name, _ in available_migrations() if version > current],
+    }
+
+
+def init_schema(app: Flask) -> None:
+    """
+    Startup check: migrate if AUTO_MIGRATE is on (otherwise only warn), then record which
+    optional structures (FTS index, rollup triggers) exist and which backfills are still
+    unfinished (re-checked later by backfill.backfill_pending), for this process.
+    """
+    from app.services.backfill import finish_empty_backfills, pending_backfills
+    from app.services.search_index import FTS_TABLE
+
+    if db.engine.dialect.name != "sqlite":
+        db.create_all()
+        app.extensions["receipts_fts"] = False
+        app.extensions["rollups"] = False
+        app.extensions["backfills_pending"] = set()
+        return
+    with db.engine.connect() as conn:
+        current = schema_version(conn)
+    latest = latest_version()
+    if current < latest:
+        if app.config["AUTO_MIGRATE"]:
+            upgrade()
+        else:
+            logger.warning("Database schema is at version %d of %d; run `flask db upgrade`", current, latest)
+    with db.engine.connect() as conn:
+        names = schema_objects(conn)
+        current = schema_version(conn)
+    app.extensions["receipts_fts"] = bool(app.config.get("SEARCH_FTS", True)) and FTS_TABLE in names
+    app.extensions["rollups"] = "rollup_receipts_ai" in names
+    pending = set(pending_backfills())
+    if pending and current >= latest:
+        pending -= set(finish_empty_backfills())
+    app.extensions["backfills_pending"] = pending
+    app.extensions["backfills_checked_at"] = time.monotonic()
@@ -1,19 +1,52 @@
 """
-OCR for receipts: Tesseract on images; PDF via PyMuPDF (text) or pdf2image + Tesseract (scanned).
-Optional heuristics to infer receipt_date and merchant from extracted text.
+OCR for receipts: Tesseract on images; PDFs page by page, using the embedded text layer where a
+page has one and rasterizing (PyMuPDF or pdf2image) + Tesseract only the scanned pages.
+Images and rasterized pages are cropped, scaled, deskewed and binarized first when
+OCR_PREPROCESS is on (services/preprocess.py).
+receipt_date, merchant and total/tax/currency are inferred from the text by services/receipt_parser.py.
+Extracted text is cached by file hash + OCR settings (services/ocr_cache.py), so re-running
+the pipeline on unchanged files only re-runs the parsing heuristics.
+Each call reports seconds spent per stage (cache, pdf_text, rasterize, tesseract, parse) in
+meta["timings"]; the OCR worker turns them into metrics (services/metrics.py).
+
+Recognition goes through an OCR engine (OCR_ENGINE): "tesserocr" keeps libtesseract handles
+loaded in the process and hands them PIL images in memory; "pytesseract" runs the tesseract
+binary per image (temp files, model load each call). "auto" prefers tesserocr when installed.
+Idle handles are kept per process for reuse, so worker processes load the language model once.
 """
-import re
-from datetime import date
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
+from app.services import ocr_cache
+from app.services.preprocess import load_image, preprocess
+from app.services.receipt_parser import parse_amounts, parse_date, parse_merchant
+
+logger = logging.getLogger(__name__)
+
 # Optional deps: fail gracefully if not installed
 try:
-    import pytesseract
     from PIL import Image
-    PYTESSERACT_AVAILABLE = True
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = PIL_AVAILABLE
 except ImportError:
     PYTESSERACT_AVAILABLE = False
 
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = PIL_AVAILABLE
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
 try:
     import pymupdf
     PYMUPDF_AVAILABLE = True
@@ -21,123 +54,371 @@ except ImportError:
     PYMUPDF_AVAILABLE = False
 
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     PDF2IMAGE_AVAILABLE = True
 except ImportError:
     PDF2IMAGE_AVAILABLE = False
 
 
+DEFAULT_OPTIONS = {
+    "engine": "auto",  # "auto", "tesserocr" or "pytesseract"
+    "dpi": 150,  # rasterization DPI for scanned PDFs
+    "max_dpi": 300,  # pages with small text are re-rendered at up to this DPI (preprocessing)
+    "preprocess": True,  # crop, scale, deskew and binarize images before OCR (services/preprocess.py)
+    "line_height": 40,  # target text line height in pixels for preprocessing
+    "binarize": True,
+    "lang": "eng",  # Tesseract language(s), e.g. "eng+deu"
+    "page_workers": 1,  # processes per PDF for page OCR; 1 = OCR pages in-process
+    "max_pages": 50,  # pages beyond this are ignored
+    "page_timeout": 120,  # seconds per Tesseract call; the page is skipped on timeout
+    "min_page_text": 20,  # pages with less embedded text than this are OCRed
+    "cache_path": None,  # OCR cache SQLite file; None disables the cache
+    "cache_max_bytes": 256 * 1024 * 1024,
+}
+
+
+def ocr_options(config) -> dict:
+    """OCR options from the app config (plain dict, safe to pass to worker processes)."""
+    return {
+        "engine": config["OCR_ENGINE"],
+        "dpi": config["OCR_PDF_DPI"],
+        "max_dpi": config["OCR_PDF_MAX_DPI"],
+        "preprocess": config["OCR_PREPROCESS"],
+        "line_height": config["OCR_LINE_HEIGHT"],
+        "binarize": config["OCR_BINARIZE"],
+        "lang": config["OCR_LANG"],
+        "page_workers": config["OCR_PAGE_WORKERS"],
+        "max_pages": config["OCR_PDF_MAX_PAGES"],
+        "page_timeout": config["OCR_PAGE_TIMEOUT"],
+        "cache_path": config["OCR_CACHE_PATH"] or None,
+        "cache_max_bytes": config["OCR_CACHE_MAX_BYTES"],
+    }
+
+
+def _engine_settings(options: dict) -> dict:
+    """Settings that change OCR output; part of the cache key."""
+    # Both engines run the same libtesseract with default settings, so the choice of
+    # engine does not change the text and cached results stay valid when it is switched
+    settings = {
+        "engine": "tesseract",
+        "dpi": options["dpi"],
+        "lang": options["lang"],
+        "max_pages": options["max_pages"],
+        "min_page_text": options["min_page_text"],
+    }
+    if options["preprocess"]:
+        # Only when enabled, so text cached without preprocessing keeps its keys
+        settings["preprocess"] = {
+            "line_height": options["line_height"],
+            "binarize": options["binarize"],
+            "max_dpi": options["max_dpi"],
+        }
+    return settings
+
+
 def _full_path(upload_folder: str, file_path: str) -> Path:
     return Path(upload_folder) / file_path
 
 
-def _extract_text_image(path: Path) -> str:
-    if not PYTESSERACT_AVAILABLE:
+@contextmanager
+def _timed(timings: dict, stage: str):
+    """Add the seconds spent in the block to timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _merge_timings(timings: dict, other: dict) -> None:
+    for stage, seconds in other.items():
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class PytesseractEngine:
+    """Runs the tesseract binary per image via pytesseract (writes the image to a temp file)."""
+
+    name = "pytesseract"
+
+    def __init__(self, lang: str):
+        self.lang = lang
+
+    def recognize(self, img, timeout: float) -> str:
+        return pytesseract.image_to_string(img, lang=self.lang, timeout=timeout) or ""
+
+    def close(self) -> None:
+        pass
+
+
+class TesserocrEngine:
+    """A libtesseract handle (tesserocr) with the language model loaded once; not thread-safe."""
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str):
+        self.lang = lang
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def recognize(self, img, timeout: float) -> str:
+        try:
+            self.api.SetImage(img)
+            if not self.api.Recognize(timeout=int(timeout * 1000)):
+                raise RuntimeError(f"Tesseract gave up after {timeout:g}s")
+            return self.api.GetUTF8Text() or ""
+        finally:
+            self.api.Clear()
+
+    def close(self) -> None:
+        self.api.End()
+
+
+ENGINES = {"tesserocr": TesserocrEngine, "pytesseract": PytesseractEngine}
+_ENGINE_AVAILABLE = {"tesserocr": TESSEROCR_AVAILABLE, "pytesseract": PYTESSERACT_AVAILABLE}
+
+_engines_lock = threading.Lock()
+_idle_engines = {}  # (engine name, lang) -> engines not currently in use in this process
+_warned_engines = set()
+# PyMuPDF is not thread-safe; page threads rasterize one at a time and overlap only in Tesseract
+_render_lock = threading.Lock()
+
+
+def engine_name(options: dict) -> str | None:
+    """The engine that options["engine"] resolves to here, or None if OCR is unavailable."""
+    wanted = options.get("engine") or "auto"
+    if wanted != "auto":
+        if _ENGINE_AVAILABLE.get(wanted):
+            return wanted
+        if wanted not in _warned_engines:
+            _warned_engines.add(wanted)
+            logger.warning("OCR engine %r is not available; falling back to auto", wanted)
+    for name in ("tesserocr", "pytesseract"):
+        if _ENGINE_AVAILABLE[name]:
+            return name
+    return None
+
+
+@contextmanager
+def ocr_engine(options: dict):
+    """
+    Borrow an engine for options (lang) and return it to this process's idle set afterwards,
+    so the next image reuses the loaded model. One engine per concurrent caller.
+    """
+    key = (engine_name(options), options["lang"])
+    if key[0] is None:
+        raise RuntimeError("No OCR engine available")
+    with _engines_lock:
+        idle = _idle_engines.setdefault(key, [])
+        engine = idle.pop() if idle else None
+    if engine is None:
+        engine = ENGINES[key[0]](key[1])
+    try:
+        yield engine
+    finally:
+        with _engines_lock:
+            _idle_engines[key].append(engine)
+
+
+def warm_engine(options: dict) -> None:
+    """Load an engine up front (process pool initializer), so the first job doesn't pay for it."""
+    try:
+        with ocr_engine(options):
+            pass
+    except Exception as e:
+        logger.warning("Could not load OCR engine: %s", e)
+
+
+@atexit.register
+def close_engines() -> None:
+    with _engines_lock:
+        engines = [e for idle in _idle_engines.values() for e in idle]
+        _idle_engines.clear()
+    for engine in engines:
+        try:
+            engine.close()
+        except Exception:
+            pass
+
+
+def _extract_text_image(path: Path, options: dict, timings: dict) -> str:
+    if engine_name(options) is None:
         return ""
     try:
-        img = Image.open(path)
-        if img.mode not in ("L", "RGB", "RGBA"):
-            img = img.convert("RGB")
-        return pytesseract.image_to_string(img) or ""
+        if options["preprocess"]:
+            with _timed(timings, "preprocess_load"):
+                img = load_image(path)
+                img.load()
+            img, _ = preprocess(img, options, timings)
+        else:
+            img = Image.open(path)
+            if img.mode not in ("L", "RGB", "RGBA"):
+                img = img.convert("RGB")
+        with ocr_engine(options) as engine, _timed(timings, "tesseract"):
+            return engine.recognize(img, options["page_timeout"])
     except Exception:
         return ""
 
 
-def _extract_text_pdf(path: Path, upload_folder: str) -> str:
-    text_from_pymupdf = ""
+def _render_pdf_page(path: Path, page_index: int, dpi: int):
+    """Rasterize a single page to a grayscale PIL image (never the whole document)."""
+    if PYMUPDF_AVAILABLE:
+        with _render_lock, pymupdf.open(path) as doc:
+            pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY, alpha=False)
+            return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    pages = convert_from_path(path, dpi=dpi, first_page=page_index + 1, last_page=page_index + 1, grayscale=True)
+    return pages[0] if pages else None
+
+
+def _ocr_pdf_page(path: Path, page_index: int, options: dict) -> tuple[str, dict]:
+    """
+    OCR one PDF page; returns the text and its stage timings. Runs in a page-pool thread
+    (tesserocr) or child process (pytesseract) when OCR_PAGE_WORKERS > 1.
+    """
+    timings = {}
+    with _timed(timings, "rasterize"):
+        img = _render_pdf_page(path, page_index, options["dpi"])
+    if img is None:
+        return "", timings
+    if options["preprocess"]:
+        img, info = preprocess(img, options, timings)
+        dpi = min(options["max_dpi"], round(options["dpi"] * info["scale"]))
+        if info["scale"] > 1.25 and dpi > options["dpi"]:
+            # Text too small for Tesseract at the default DPI: render this page sharper
+            with _timed(timings, "rasterize"):
+                hires = _render_pdf_page(path, page_index, dpi)
+            if hires is not None:
+                img.close()
+                img, _ = preprocess(hires, options, timings)
+    try:
+        with ocr_engine(options) as engine, _timed(timings, "tesseract"):
+            text = engine.recognize(img, options["page_timeout"])
+        return text, timings
+    finally:
+        img.close()
+
+
+def _pdf_page_layers(path: Path, max_pages: int, min_chars: int) -> tuple[list[str], list[int]]:
+    """
+    Per-page text layers of the first max_pages pages, and the indexes of pages that have
+    too little embedded text and need OCR.
+    """
     if PYMUPDF_AVAILABLE:
         try:
-            doc = pymupdf.open(path)
-            parts = []
-            for page in doc:
-                parts.append(page.get_text())
-            doc.close()
-            text_from_pymupdf = "\n".join(parts).strip()
+            texts, scanned = [], []
+            with pymupdf.open(path) as doc:
+                for i in range(min(doc.page_count, max_pages)):
+                    text = doc[i].get_text().strip()
+                    texts.append(text)
+                    if len(text) < min_chars:
+                        scanned.append(i)
+            return texts, scanned
         except Exception:
-            pass
-    if len(text_from_pymupdf) >= 30:
-        return text_from_pymupdf
-    if PDF2IMAGE_AVAILABLE and PYTESSERACT_AVAILABLE:
+            return [], []
+    if PDF2IMAGE_AVAILABLE:
         try:
-            images = convert_from_path(path, dpi=150)
-            parts = []
-            for img in images:
-                parts.append(pytesseract.image_to_string(img))
-            return "\n".join(parts).strip()
+            count = min(int(pdfinfo_from_path(path)["Pages"]), max_pages)
         except Exception:
-            pass
-    return text_from_pymupdf
+            return [], []
+        return [""] * count, list(range(count))
+    return [], []
 
 
-def _parse_date_from_text(text: str) -> date | None:
-    """Try to find a date in text; return first plausible receipt-style date."""
-    if not text:
-        return None
-    # ISO
-    m = re.search(r"\b(20\d{2})-(\d{1,2})-(\d{1,2})\b", text)
-    if m:
-        try:
-            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
-        except ValueError:
-            pass
-    # US style MM/DD/YYYY or MM-DD-YYYY
-    m = re.search(r"\b(\d{1,2})[/-](\d{1,2})[/-](20\d{2})\b", text)
-    if m:
-        try:
-            return date(int(m.group(3)), int(m.group(1)), int(m.group(2)))
-        except ValueError:
-            pass
-    # DD.MM.YYYY or DD/MM/YYYY
-    m = re.search(r"\b(\d{1,2})[./](\d{1,2})[./](20\d{2})\b", text)
-    if m:
-        try:
-            return date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
-        except ValueError:
-            pass
-    return None
+def _extract_text_pdf(path: Path, options: dict, timings: dict) -> str:
+    """
+    Text layer where a page has one; Tesseract only for pages without. Pages are rasterized
+    one at a time, so peak memory is about OCR_PAGE_WORKERS pages rather than the whole PDF.
+    The page pool uses threads with tesserocr (libtesseract releases the GIL, and the
+    process's loaded engines are reused) and processes with pytesseract. With a pool,
+    rasterize/tesseract timings are summed over its workers.
+    """
+    with _timed(timings, "pdf_text"):
+        texts, scanned = _pdf_page_layers(path, options["max_pages"], options["min_page_text"])
+    can_render = PYMUPDF_AVAILABLE or PDF2IMAGE_AVAILABLE
+    engine = engine_name(options)
+    if scanned and engine and can_render:
+        if options["page_workers"] > 1 and len(scanned) > 1:
+            executor = ThreadPoolExecutor if engine == "tesserocr" else ProcessPoolExecutor
+            with executor(max_workers=min(options["page_workers"], len(scanned))) as pool:
+                futures = {i: pool.submit(_ocr_pdf_page, path, i, options) for i in scanned}
+                for i, future in futures.items():
+                    try:
+                        text, page_timings = future.result()
+                        texts[i] = text or texts[i]
+                        _merge_timings(timings, page_timings)
+                    except Exception as e:
+                        logger.warning("OCR failed for page %d of %s: %s", i + 1, path.name, e)
+        else:
+            for i in scanned:
+                try:
+                    text, page_timings = _ocr_pdf_page(path, i, options)
+                    texts[i] = text or texts[i]
+                    _merge_timings(timings, page_timings)
+                except Exception as e:
+                    logger.warning("OCR failed for page %d of %s: %s", i + 1, path.name, e)
+    return "\n".join(t.strip() for t in texts if t.strip())
 
 
-def _parse_merchant_from_text(text: str) -> str | None:
-    """Heuristic: first line that looks like a merchant name (not a date, not mostly digits)."""
-    if not text:
+def _cached_text(options: dict, key: str | None) -> str | None:
+    if not key:
         return None
-    date_pattern = re.compile(
-        r"^(20\d{2}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]20\d{2})$"
-    )
-    for line in text.splitlines():
-        line = line.strip()
-        if not line or len(line) < 2 or len(line) > 200:
-            continue
-        if date_pattern.match(line):
-            continue
-        if re.match(r"^[\d\s.,$€£]+$", line):
-            continue
-        return line[:256]
-    return None
+    try:
+        return ocr_cache.get(options["cache_path"], key)
+    except Exception:
+        return None
+
+
+def _store_text(options: dict, key: str | None, text: str) -> None:
+    # Empty results are not cached: OCR may simply be unavailable on this host
+    if not key or not text:
+        return
+    try:
+        ocr_cache.put(options["cache_path"], key, text, options["cache_max_bytes"])
+    except Exception:
+        pass
 
 
 def extract_text_and_meta(
     upload_folder: str,
     file_path: str,
+    content_hash: str | None = None,
+    options: dict | None = None,
 ) -> dict:
     """
-    Run OCR and optional parsing. Returns dict with keys:
-    extracted_text, receipt_date, merchant (all optional).
+    Run OCR (or reuse cached text for content_hash) and optional parsing. Returns dict with keys:
+    extracted_text, receipt_date, merchant, total_cents, tax_cents, currency (all optional)
+    and timings (seconds per pipeline stage that ran).
     """
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    timings = {}
     full = _full_path(upload_folder, file_path)
     if not full.is_file():
-        return {"extracted_text": None, "receipt_date": None, "merchant": None}
-    ext = full.suffix.lower()
-    text = ""
-    if ext == ".pdf":
-        text = _extract_text_pdf(full, upload_folder)
-    elif ext in (".jpg", ".jpeg", ".png"):
-        text = _extract_text_image(full)
-    text = text.strip() or None
-    receipt_date = _parse_date_from_text(text) if text else None
-    merchant = _parse_merchant_from_text(text) if text else None
+        return {
+            "extracted_text": None, "receipt_date": None, "merchant": None, **parse_amounts(""),
+            "timings": timings,
+        }
+    key = None
+    if content_hash and options["cache_path"]:
+        key = ocr_cache.cache_key(content_hash, _engine_settings(options))
+    with _timed(timings, "cache"):
+        text = _cached_text(options, key)
+    if text is None:
+        ext = full.suffix.lower()
+        text = ""
+        if ext == ".pdf":
+            text = _extract_text_pdf(full, options, timings)
+        elif ext in (".jpg", ".jpeg", ".png"):
+            text = _extract_text_image(full, options, timings)
+        text = text.strip()
+        with _timed(timings, "cache"):
+            _store_text(options, key, text)
+    text = text or None
+    with _timed(timings, "parse"):
+        receipt_date = parse_date(text) if text else None
+        merchant = parse_merchant(text) if text else None
+        amounts = parse_amounts(text or "")
     return {
         "extracted_text": text,
         "receipt_date": receipt_date,
         "merchant": merchant,
+        **amounts,
+        "timings": timings,
     }
@@ -0,0 +1,98 @@
+"""
+Persistent OCR result cache: an SQLite file mapping (file SHA-256, OCR settings) to the
+extracted text, with size-bounded LRU eviction and hit/miss counters. Plain sqlite3,
+no Flask, so it can be used from OCR worker child processes.
+"""
+import json
+import sqlite3
+import time
+from contextlib import closing
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ocr_cache_last_access ON ocr_cache (last_access);
+CREATE TABLE IF NOT EXISTS ocr_cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def cache_key(content_hash: str, settings: dict) -> str:
+    """Key for a file's OCR text under the given engine settings (engine, dpi, lang, ...)."""
+    return content_hash + ":" + json.dumps(settings, sort_keys=True, separators=(",", ":"))
+
+
+def _bump(conn: sqlite3.Connection, name: str) -> None:
+    conn.execute(
+        "INSERT INTO ocr_cache_stats (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+
+def get(path: str, key: str) -> str | None:
+    """Cached text for key, or None. Counts a hit or miss and refreshes LRU position."""
+    with closing(_connect(path)) as conn:
+        row = conn.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            _bump(conn, "misses")
+            return None
+        conn.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        _bump(conn, "hits")
+        return row[0]
+
+
+def put(path: str, key: str, text: str, max_bytes: int) -> None:
+    """Store text under key, then evict least recently used entries beyond max_bytes."""
+    size = len(text.encode("utf-8"))
+    now = time.time()
+    with closing(_connect(path)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT OR REPLACE INTO ocr_cache (key, text, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, text, size, now, now),
+        )
+        total = conn.execute("SELECT coalesce(sum(size), 0) FROM ocr_cache").fetchone()[0]
+        while total > max_bytes:
+            oldest = conn.execute(
+                "SELECT key, size FROM ocr_cache WHERE key <> ? ORDER BY last_access LIMIT 64", (key,)
+            ).fetchall()
+            if not oldest:
+                break
+            for old_key, old_size in oldest:
+                conn.execute("DELETE FROM ocr_cache WHERE key = ?", (old_key,))
+                total -= old_size
+                _bump(conn, "evictions")
+                if total <= max_bytes:
+                    break
+        conn.execute("COMMIT")
+
+
+def stats(path: str) -> dict:
+    """Counters (hits, misses, evictions) plus current entries and bytes."""
+    with closing(_connect(path)) as conn:
+        out = {"hits": 0, "misses": 0, "evictions": 0}
+        out.update(dict(conn.execute("SELECT name, value FROM ocr_cache_stats")))
+        entries, size = conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM ocr_cache").fetchone()
+        out["entries"] = entries
+        out["bytes"] = size
+        return out
+
+
+def clear(path: str) -> None:
+    with closing(_connect(path)) as conn:
+        conn.execute("DELETE FROM ocr_cache")
+        conn.execute("DELETE FROM ocr_cache_stats")
@@ -0,0 +1,90 @@
+"""
+Keyset (cursor) pagination: pages are fetched with WHERE (k1, k2) < (:v1, :v2) on an
+indexed sort key instead of OFFSET, so every page costs the same regardless of depth.
+Cursors are opaque URL-safe strings holding the sort-key values of the boundary row.
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import tuple_
+
+
+def _encode_value(v):
+    return {"dt": v.isoformat()} if isinstance(v, datetime) else v
+
+
+def _decode_value(v):
+    """Sort-key value from its JSON form; ValueError for anything a cursor never holds."""
+    if isinstance(v, dict):
+        if set(v) != {"dt"} or not isinstance(v["dt"], str):
+            raise ValueError("invalid datetime in cursor")
+        return datetime.fromisoformat(v["dt"])
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise ValueError("invalid value in cursor")
+    return v
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None, size: int) -> list | None:
+    """Decode a cursor; None if missing or malformed (treated as the first page)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list):
+            return None
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        return None
+    return values if len(values) == size else None
+
+
+def keyset_page(query, keys, descending: bool, page_size: int, after: str | None = None, before: str | None = None) -> dict:
+    """
+    Fetch one page of query ordered by keys (all ascending or all descending).
+    `after` continues forward from a next-cursor, `before` goes back from a prev-cursor.
+    Returns dict with items, next_cursor, prev_cursor (None when there is no such page).
+    """
+    after_values = decode_cursor(after, len(keys))
+    before_values = None if after_values else decode_cursor(before, len(keys))
+    backwards = before_values is not None
+    boundary = before_values if backwards else after_values
+
+    # Walking backwards flips both the comparison and the sort order
+    forward_desc = descending != backwards
+    query = query.add_columns(*keys)
+    if boundary is not None:
+        row, bound = tuple_(*keys), tuple_(*boundary)
+        query = query.filter(row < bound if forward_desc else row > bound)
+    query = query.order_by(*(k.desc() if forward_desc else k.asc() for k in keys))
+    rows = query.limit(page_size + 1).all()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else boundary is not None
+
+    n = len(keys)
+    return {
+        "items": [row[0] for row in rows],
+        "next_cursor": encode_cursor(rows[-1][-n:]) if rows and has_next else None,
+        "prev_cursor": encode_cursor(rows[0][-n:]) if rows and has_prev else None,
+    }
+
+
+def page_url(**cursor) -> str:
+    """URL of the current view with the same query args and a new after/before cursor."""
+    args = request.args.to_dict(flat=False)
+    args.pop("after", None)
+    args.pop("before", None)
+    args.update({k: v for k, v in cursor.items() if v})
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
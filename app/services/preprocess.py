@@ -0,0 +1,196 @@
+"""
+Image preprocessing before OCR (Pillow only). Phone photos are mostly table and 12 MP of
+pixels Tesseract doesn't need, so each image is: rotated per its EXIF orientation and decoded
+as grayscale; analyzed on a small copy (paper region, skew angle, text line height); cropped
+to the receipt; scaled so text lines are about OCR_LINE_HEIGHT pixels tall; deskewed; and
+binarized against a blurred background estimate, which copes with uneven lighting.
+Seconds per step go into timings as preprocess_<step>.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from statistics import median
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageChops, ImageFilter, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+ANALYSIS_SIZE = 800  # long edge of the copy used to find paper, skew and line height
+MIN_PAPER_FRACTION = 0.15  # smaller bright regions are not trusted as the receipt
+MAX_SKEW = 10  # degrees searched either way
+MIN_SKEW = 0.3  # smaller angles are not worth a rotation
+MIN_BINARIZE_CONTRAST = 12  # gray levels below the background that still count as paper
+FALLBACK_MAX_PIXELS = 4_000_000  # size cap when no text lines could be measured
+
+
+@contextmanager
+def _timed(timings: dict, step: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage = f"preprocess_{step}"
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def otsu_threshold(hist: list[int]) -> int:
+    """Gray level that best separates the two classes of a 256-bin histogram."""
+    total = sum(hist)
+    weighted = sum(i * n for i, n in enumerate(hist))
+    best, best_var = 0, -1.0
+    count_low = sum_low = 0
+    for t, n in enumerate(hist):
+        count_low += n
+        if count_low == 0:
+            continue
+        count_high = total - count_low
+        if count_high == 0:
+            break
+        sum_low += t * n
+        mean_low = sum_low / count_low
+        mean_high = (weighted - sum_low) / count_high
+        var = count_low * count_high * (mean_low - mean_high) ** 2
+        if var > best_var:
+            best, best_var = t, var
+    return best
+
+
+def _paper(small, threshold: int):
+    """
+    Mask of the paper (bright region with the text holes closed, pulled in from its edge)
+    and its bounding box; the box is None if the paper is the whole image or too small.
+    """
+    # Rank filters are slow; the paper outline only needs a quarter of the analysis size
+    tiny = small.resize((max(1, small.width // 4), max(1, small.height // 4)), Image.BOX)
+    bright = tiny.point(lambda v: 255 if v > threshold else 0)
+    paper = bright.filter(ImageFilter.MaxFilter(3)).filter(ImageFilter.MinFilter(5))
+    box = paper.getbbox()
+    paper = paper.resize(small.size, Image.BILINEAR).point(lambda v: 255 if v > 127 else 0)
+    if not box:
+        return paper, None
+    left, top, right, bottom = (v * 4 for v in box)
+    area = (right - left) * (bottom - top)
+    if area < MIN_PAPER_FRACTION * small.width * small.height or area > 0.95 * small.width * small.height:
+        return paper, None
+    return paper, (left, top, min(right, small.width), min(bottom, small.height))
+
+
+def _row_profile(ink, angle: float) -> list[int]:
+    """Mean ink per row of the ink mask rotated by angle."""
+    rotated = ink.rotate(angle, resample=Image.NEAREST) if angle else ink
+    return list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+
+
+def _profile_score(profile: list[int]) -> int:
+    # Text lines aligned with the rows give sharp steps between ink and gap rows
+    return sum((b - a) ** 2 for a, b in zip(profile, profile[1:]))
+
+
+def _skew_angle(ink) -> tuple[float, list[int]]:
+    """Angle (degrees, counter-clockwise) that makes text lines horizontal, and its row profile."""
+    best = (-1, 0.0, [])
+    # Whole degrees first, then fifths of a degree around the best one
+    for angles in (range(-MAX_SKEW, MAX_SKEW + 1), None):
+        if angles is None:
+            angles = [best[1] + d / 5 for d in range(-5, 6)]
+        for angle in angles:
+            profile = _row_profile(ink, angle)
+            score = _profile_score(profile)
+            if score > best[0]:
+                best = (score, angle, profile)
+    return best[1], best[2]
+
+
+def _line_height(profile: list[int]) -> float | None:
+    """Median height in rows of the runs of inked rows (text lines), or None if too few."""
+    level = max(3, max(profile, default=0) // 8)
+    runs, run = [], 0
+    for value in profile + [0]:
+        if value > level:
+            run += 1
+        elif run:
+            if run > 1:
+                runs.append(run)
+            run = 0
+    return median(runs) if len(runs) >= 3 else None
+
+
+def _analyze(gray) -> dict:
+    """Paper box, skew angle and text line height of gray, in its own pixel coordinates."""
+    factor = min(1.0, ANALYSIS_SIZE / max(gray.size))
+    small = gray.resize((max(1, round(gray.width * factor)), max(1, round(gray.height * factor))), Image.BILINEAR)
+    threshold = otsu_threshold(small.histogram())
+    paper, box = _paper(small, threshold)
+    if box:
+        small, paper = small.crop(box), paper.crop(box)
+    # Only dark pixels on the paper count as ink, not the table around it
+    ink = ImageChops.darker(ImageOps.invert(_binarize(small, None)), paper)
+    angle, profile = _skew_angle(ink)
+    line_height = _line_height(profile)
+    return {
+        "box": tuple(round(v / factor) for v in box) if box else None,
+        "paper": paper if box else None,
+        "angle": angle if abs(angle) >= MIN_SKEW else 0.0,
+        "line_height": line_height / factor if line_height else None,
+    }
+
+
+def _binarize(gray, line_height: float | None):
+    """Black text on white: pixels clearly darker than their blurred surroundings are ink."""
+    radius = max(8, round((line_height or 10) * 1.5))
+    background = gray.filter(ImageFilter.BoxBlur(radius))
+    darkness = ImageChops.subtract(background, gray)
+    level = max(MIN_BINARIZE_CONTRAST, otsu_threshold(darkness.histogram()))
+    return darkness.point(lambda v: 0 if v > level else 255)
+
+
+def load_image(path):
+    """Open an image upright (EXIF orientation); JPEGs are decoded straight to grayscale."""
+    img = Image.open(path)
+    if img.format == "JPEG":
+        img.draft("L", img.size)
+    return ImageOps.exif_transpose(img)
+
+
+def preprocess(img, options: dict, timings: dict, max_scale: float = 1.0):
+    """
+    Run the preprocessing steps on a PIL image; returns (image, info). info["scale"] is the
+    scale that would bring text lines to the target height, before clamping to max_scale, so
+    callers that can re-render (PDF pages) know when a higher resolution would help.
+    """
+    with _timed(timings, "grayscale"):
+        gray = img if img.mode == "L" else img.convert("L")
+    with _timed(timings, "analyze"):
+        info = _analyze(gray)
+    with _timed(timings, "crop"):
+        if info["box"]:
+            gray = gray.crop(info["box"])
+    if info["line_height"]:
+        info["scale"] = options["line_height"] / info["line_height"]
+    else:
+        info["scale"] = min(1.0, (FALLBACK_MAX_PIXELS / (gray.width * gray.height)) ** 0.5)
+    scale = min(info["scale"], max_scale)
+    with _timed(timings, "scale"):
+        # Small changes cost a resample without saving Tesseract any work
+        if scale < 0.9 or scale > 1.1:
+            size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+            gray = gray.resize(size, Image.LANCZOS, reducing_gap=2.0)
+            if info["line_height"]:
+                info["line_height"] *= scale
+    with _timed(timings, "crop"):
+        paper = info.pop("paper")
+        if paper is not None:
+            # Blank out the table inside the box, so its edges don't turn into black bars
+            outside = ImageOps.invert(paper.resize(gray.size, Image.BILINEAR))
+            gray = ImageChops.lighter(gray, outside)
+    with _timed(timings, "deskew"):
+        if info["angle"]:
+            gray = gray.rotate(info["angle"], resample=Image.BILINEAR, expand=True, fillcolor=255)
+    if options["binarize"]:
+        with _timed(timings, "binarize"):
+            gray = _binarize(gray, info["line_height"])
+    return gray, info
@@ -0,0 +1,178 @@
+"""
+Heuristics over OCR text: receipt date, merchant line, total/tax/currency, and merchant
+name normalization (the key used by the merchant dictionary in services/merchants.py).
+All patterns are compiled once at import; nothing here touches the database.
+"""
+import re
+import unicodedata
+from collections import Counter
+from datetime import date
+
+_ISO_DATE = re.compile(r"\b(20\d{2})-(\d{1,2})-(\d{1,2})\b")
+_US_DATE = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](20\d{2})\b")  # MM/DD/YYYY, MM-DD-YYYY
+_EU_DATE = re.compile(r"\b(\d{1,2})[./](\d{1,2})[./](20\d{2})\b")  # DD.MM.YYYY, DD/MM/YYYY
+_DATE_LINE = re.compile(r"^(20\d{2}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]20\d{2})$")
+_NUMERIC_LINE = re.compile(r"^[\d\s.,$€£]+$")
+_LETTER = re.compile(r"[^\W\d_]")
+
+# Order of the (year, month, day) groups in each date pattern
+_DATE_PATTERNS = (
+    (_ISO_DATE, (1, 2, 3)),
+    (_US_DATE, (3, 1, 2)),
+    (_EU_DATE, (3, 2, 1)),
+)
+
+_STORE_NUMBER = re.compile(r"(#|\bno\.?|\bnr\.?|\bstore|\bfiliale)\s*\d+", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+_SPACES = re.compile(r"\s+")
+# Legal-form and filler words that do not identify a merchant
+_STOP_WORDS = frozenset(
+    "the inc llc ltd limited gmbh mbh ag kg co corp corporation company plc sa sas sarl srl spa bv nv oy ab"
+    .split()
+)
+
+
+def parse_date(text: str) -> date | None:
+    """First plausible receipt-style date: ISO, then US (MM/DD/YYYY), then European (DD.MM.YYYY)."""
+    if not text:
+        return None
+    for pattern, (y, m, d) in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            try:
+                return date(int(match.group(y)), int(match.group(m)), int(match.group(d)))
+            except ValueError:
+                pass
+    return None
+
+
+def parse_merchant(text: str) -> str | None:
+    """Heuristic: first line that looks like a merchant name (not a date, not mostly digits)."""
+    if not text:
+        return None
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) < 2 or len(line) > 200:
+            continue
+        if _DATE_LINE.match(line) or _NUMERIC_LINE.match(line):
+            continue
+        if len(_LETTER.findall(line)) < 2:  # separators like "*****" or "--- 1 ---"
+            continue
+        return _SPACES.sub(" ", line)[:256]
+    return None
+
+
+# Amounts: one scanner over the whole text. Each match is a line break, a keyword, an amount
+# with two decimals (1,234.56 / 1.234,56 / 12,50; not dates, not percentages) or a currency.
+_AMOUNT_TOKENS = re.compile(
+    r"""
+    (?P<nl>\n)
+    | (?P<subtotal>\b(?:sub-?\s?total|zwischensumme|netto?|net\s+amount)\b)
+    | (?P<tax>\b(?:tax|vat|mwst|ust|tva|iva|gst|hst|btw|moms)\b)
+    | (?P<total>\b(?:total|amount\s+due|balance\s+due|to\s+pay|summe|gesamt|zu\s+zahlen|betrag|montant|totale|importe)\b)
+    | (?P<incl>\b(?:incl|inkl|including)\b)
+    | (?P<amount>(?<![\d.,])-?(?:\d{1,3}(?:[.,']\d{3})+|\d+)[.,]\d{2}(?![\d%]|[.,]\d))
+    | (?P<currency>[$€£¥]|\b(?:USD|EUR|GBP|CHF|CAD|AUD|JPY|SEK|NOK|DKK|PLN|CZK)\b)
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+_CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY"}
+_NON_DIGITS = re.compile(r"\D")  # thousands separators and sign in an amount's whole part
+
+
+def _cents(amount: str) -> int:
+    sign = -1 if amount.startswith("-") else 1
+    whole = _NON_DIGITS.sub("", amount[:-3])
+    return sign * (int(whole or 0) * 100 + int(amount[-2:]))
+
+
+def parse_amounts(text: str) -> dict:
+    """
+    Total, tax (in cents) and ISO currency code from receipt text, in one pass over the
+    tokens. A line's value is its last amount; a keyword line without an amount labels the
+    next line (OCR often splits label and amount columns). The total is the largest amount
+    on a total line (payment lines such as "cash 50.00" carry no keyword); tax is the sum of
+    tax lines ("total incl. VAT" counts as total). Values not found are None.
+    """
+    totals, taxes, currencies = [], [], Counter()
+    kinds, amounts, carried = set(), [], None
+
+    def end_line():
+        nonlocal carried
+        line_kinds = kinds or ({carried} if carried else set())
+        kind = None
+        if "subtotal" in line_kinds:
+            kind = "subtotal"
+        elif "total" in line_kinds and ("incl" in line_kinds or "tax" not in line_kinds):
+            kind = "total"
+        elif "tax" in line_kinds:
+            kind = "tax"
+        if amounts:
+            value = amounts[-1]
+            if value > 0 and kind == "total":
+                totals.append(value)
+            elif value > 0 and kind == "tax":
+                taxes.append(value)
+            carried = None
+        else:
+            carried = kind
+        kinds.clear()
+        amounts.clear()
+
+    for m in _AMOUNT_TOKENS.finditer(text or ""):
+        group = m.lastgroup
+        if group == "nl":
+            end_line()
+        elif group == "amount":
+            amounts.append(_cents(m.group()))
+        elif group == "currency":
+            token = m.group()
+            currencies[_CURRENCY_SYMBOLS.get(token, token.upper())] += 1
+        else:
+            kinds.add(group)
+    end_line()
+
+    total = max(totals) if totals else None
+    tax = sum(taxes) if taxes else None
+    if tax is not None and total is not None and tax >= total:
+        tax = max(taxes) if max(taxes) < total else None
+    return {
+        "total_cents": total,
+        "tax_cents": tax,
+        "currency": currencies.most_common(1)[0][0] if currencies else None,
+    }
+
+
+def format_amount(cents: int | None) -> str:
+    """Cents as a decimal string ("1234.50"); empty for None."""
+    if cents is None:
+        return ""
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+def normalize_merchant(name: str) -> str:
+    """
+    Matching key for a merchant spelling: accents stripped, case-folded, punctuation, store
+    numbers and legal forms removed ("ACME Coffee GmbH #12" -> "acme coffee").
+    """
+    if not name:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", name)
+    s = "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    s = _STORE_NUMBER.sub(" ", s)
+    words = [w for w in _WORD.findall(s) if not w.isdigit() and w not in _STOP_WORDS]
+    return " ".join(words)[:256]
+
+
+def display_name(name: str) -> str:
+    """Merchant name for display: the spelling as seen, without store number or extra spaces."""
+    return _SPACES.sub(" ", _STORE_NUMBER.sub(" ", name)).strip()[:256]
+
+
+def trigrams(key: str) -> set[str]:
+    """Character trigrams of a normalized key, padded like pg_trgm ("  a", " ab", ..., "yz ")."""
+    if not key:
+        return set()
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
@@ -1,41 +1,128 @@
 """
-Shared receipt filter logic for search and export.
+Shared receipt filter logic for search, list and export.
 """
 from datetime import datetime
 
-from sqlalchemy import func, or_
+from flask import current_app
+from sqlalchemy import column, false, func, or_, select
 
-from app.models import Receipt, Tag
+from app import db
+from app.models import Receipt, receipt_tags
+from app.services import tag_index
+from app.services.backfill import backfill_pending
+from app.services.pagination import keyset_page
+from app.services.search_index import fts_enabled, match_subquery, to_fts_query
 
+# Up to this many matching ids, SQLite fetches them by primary key and sorts them; beyond,
+# it walks the sort index and checks each row against the id list (stops at the page size)
+_ID_LOOKUP_MAX = 2000
 
-def build_receipt_query(tag_ids: list[int], date_from_s: str, date_to_s: str, merchant_q: str):
-    """Apply filters; returns SQLAlchemy query (not executed)."""
+
+def effective_date_expr():
+    """
+    Receipt date from OCR, else the upload date. The indexed effective_date column, or the
+    equivalent expression (full scan) while its backfill has not finished.
+    """
+    if backfill_pending("receipts_effective_date"):
+        return func.coalesce(Receipt.receipt_date, func.date(Receipt.created_at))
+    return Receipt.effective_date
+
+
+def parse_date(s: str):
+    """Parse YYYY-MM-DD; None if empty or invalid."""
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date() if s else None
+    except ValueError:
+        return None
+
+
+def date_filter_clauses(date_from_s: str, date_to_s: str) -> list:
+    """WHERE clauses for an inclusive date range on the effective date; invalid dates are ignored."""
+    clauses = []
+    date_from = parse_date(date_from_s)
+    date_to = parse_date(date_to_s)
+    if date_from:
+        clauses.append(effective_date_expr() >= date_from)
+    if date_to:
+        clauses.append(effective_date_expr() <= date_to)
+    return clauses
+
+
+def _tagged(tag_ids):
+    # IN over the (tag_id, receipt_id) index instead of a correlated EXISTS per receipt
+    return select(receipt_tags.c.receipt_id).where(receipt_tags.c.tag_id.in_(tag_ids))
+
+
+def tag_filter_clauses(tag_any: list[int], tag_all: list[int] = (), tag_none: list[int] = ()) -> list:
+    """
+    WHERE clauses for receipts with at least one tag of tag_any, every tag of tag_all and no
+    tag of tag_none. Evaluated on the in-memory tag bitmap index (services/tag_index.py) and
+    passed to SQL as a receipt id list (json_each) of the matching or the excluded receipts,
+    whichever is shorter, when it has at most TAG_INDEX_MAX_IDS ids; otherwise IN / NOT IN
+    subqueries over receipt_tags.
+    """
+    if not (tag_any or tag_all or tag_none):
+        return []
+    cfg = current_app.config
+    if cfg["TAG_INDEX"]:
+        found = tag_index.id_filter(db.session.connection(), tag_any, tag_all, tag_none, cfg["TAG_INDEX_MAX_IDS"])
+        if found:
+            op, ids = found
+            if not ids:
+                return [false()] if op == "in" else []
+            id_list = select(column("value")).select_from(func.json_each("[" + ",".join(map(str, ids)) + "]"))
+            if op == "not_in":
+                return [Receipt.id.not_in(id_list)]
+            # "+ 0" keeps SQLite from looking up every id when the list is long
+            return [(Receipt.id if len(ids) <= _ID_LOOKUP_MAX else Receipt.id + 0).in_(id_list)]
+    clauses = [Receipt.id.in_(_tagged([tag_id])) for tag_id in tag_all]
+    if tag_any:
+        clauses.append(Receipt.id.in_(_tagged(tag_any)))
+    if tag_none:
+        clauses.append(Receipt.id.not_in(_tagged(tag_none)))
+    return clauses
+
+
+def filters_from_args(args) -> dict:
+    """filter_receipts keyword arguments from search parameters (request.args or a form)."""
+    return {
+        "tag_ids": args.getlist("tag_id", type=int),
+        "date_from_s": args.get("date_from", "").strip(),
+        "date_to_s": args.get("date_to", "").strip(),
+        "merchant_q": args.get("merchant", "").strip(),
+        "merchant_id": args.get("merchant_id", type=int),
+        "tag_all": args.getlist("tag_all", type=int),
+        "tag_none": args.getlist("tag_none", type=int),
+    }
+
+
+def filter_receipts(
+    tag_ids: list[int],
+    date_from_s: str,
+    date_to_s: str,
+    merchant_q: str,
+    merchant_id: int | None = None,
+    tag_all: list[int] = (),
+    tag_none: list[int] = (),
+):
+    """
+    Apply filters without ordering. tag_ids matches any of the tags, tag_all every one and
+    tag_none none of them; merchant_id filters on the merchant dictionary entry. Returns
+    (query, sort_keys, descending): newest first on (created_at, id), or best bm25 rank first
+    on (rank, id) for full-text searches.
+    """
     query = Receipt.query
-    if tag_ids:
-        query = query.filter(Receipt.tags.any(Tag.id.in_(tag_ids)))
-    if date_from_s:
-        try:
-            date_from = datetime.strptime(date_from_s, "%Y-%m-%d").date()
-            query = query.filter(
-                or_(
-                    Receipt.receipt_date >= date_from,
-                    (Receipt.receipt_date.is_(None)) & (func.date(Receipt.created_at) >= date_from),
-                )
-            )
-        except ValueError:
-            pass
-    if date_to_s:
-        try:
-            date_to = datetime.strptime(date_to_s, "%Y-%m-%d").date()
-            query = query.filter(
-                or_(
-                    Receipt.receipt_date <= date_to,
-                    (Receipt.receipt_date.is_(None)) & (func.date(Receipt.created_at) <= date_to),
-                )
-            )
-        except ValueError:
-            pass
+    query = query.filter(*tag_filter_clauses(tag_ids, tag_all, tag_none))
+    query = query.filter(*date_filter_clauses(date_from_s, date_to_s))
+    if merchant_id:
+        query = query.filter(Receipt.merchant_id == merchant_id)
     if merchant_q:
+        fts_query = to_fts_query(merchant_q) if fts_enabled() else None
+        if fts_query:
+            # Full-text index lookup, best bm25 matches first
+            fts = match_subquery(fts_query)
+            query = query.join(fts, fts.c.receipt_id == Receipt.id)
+            return query, (fts.c.rank, Receipt.id), False
         safe = merchant_q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
         pattern = f"%{safe}%"
         query = query.filter(
@@ -44,4 +131,39 @@ def build_receipt_query(tag_ids: list[int], date_from_s: str, date_to_s: str, me
                 Receipt.extracted_text.ilike(pattern, escape="\\"),
             )
         )
-    return query.order_by(Receipt.created_at.desc())
+    return query, (Receipt.created_at, Receipt.id), True
+
+
+def build_receipt_query(
+    tag_ids: list[int],
+    date_from_s: str,
+    date_to_s: str,
+    merchant_q: str,
+    merchant_id: int | None = None,
+    tag_all: list[int] = (),
+    tag_none: list[int] = (),
+):
+    """Apply filters; returns ordered SQLAlchemy query (not executed)."""
+    query, keys, descending = filter_receipts(
+        tag_ids, date_from_s, date_to_s, merchant_q, merchant_id, tag_all, tag_none
+    )
+    return query.order_by(*(k.desc() if descending else k for k in keys))
+
+
+def receipt_page(
+    tag_ids: list[int],
+    date_from_s: str,
+    date_to_s: str,
+    merchant_q: str,
+    page_size: int,
+    after: str | None = None,
+    before: str | None = None,
+    merchant_id: int | None = None,
+    tag_all: list[int] = (),
+    tag_none: list[int] = (),
+) -> dict:
+    """One keyset page of filtered receipts; see pagination.keyset_page."""
+    query, keys, descending = filter_receipts(
+        tag_ids, date_from_s, date_to_s, merchant_q, merchant_id, tag_all, tag_none
+    )
+    return keyset_page(query, keys, descending, page_size, after=after, before=before)
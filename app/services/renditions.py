@@ -0,0 +1,119 @@
+"""
+Thumbnail/preview renditions of receipt files (first page for PDFs), cached on disk under
+UPLOAD_FOLDER/.renditions and keyed by file identity (content hash) and size. Renditions
+are immutable for a given key, so they are served with strong ETags and long cache lifetimes.
+Plain functions without Flask, so the OCR worker can pre-generate them in its child processes.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps, features
+    PIL_AVAILABLE = True
+    WEBP_AVAILABLE = features.check("webp")
+except ImportError:
+    PIL_AVAILABLE = False
+    WEBP_AVAILABLE = False
+
+try:
+    import pymupdf
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+try:
+    from pdf2image import convert_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+RENDITIONS_DIR = ".renditions"
+VERSION = 1  # bump to invalidate every cached rendition after changing how they are made
+SIZES = {"sm": 160, "md": 480, "lg": 1280}  # longest edge in pixels
+FORMAT = "webp" if WEBP_AVAILABLE else "jpeg"
+MIMETYPE = f"image/{FORMAT}"
+
+
+def identity(file_path: str, content_hash: str | None) -> str:
+    """Stable identity of a stored file: its SHA-256, or a path hash for legacy rows."""
+    if content_hash:
+        return content_hash
+    return "p" + hashlib.sha256(file_path.encode("utf-8")).hexdigest()[:40]
+
+
+def etag(ident: str, size: str) -> str:
+    return f"{ident[:16]}-{size}-v{VERSION}"
+
+
+def rendition_path(upload_folder: str, ident: str, size: str) -> Path:
+    ext = "webp" if FORMAT == "webp" else "jpg"
+    return Path(upload_folder) / RENDITIONS_DIR / ident[:2] / f"{ident}-{size}-v{VERSION}.{ext}"
+
+
+def _load_image(source: Path, box: int):
+    """First page / image, decoded at roughly the target size where the format allows it."""
+    if source.suffix.lower() == ".pdf":
+        if PYMUPDF_AVAILABLE:
+            with pymupdf.open(source) as doc:
+                page = doc[0]
+                zoom = box / max(page.rect.width, page.rect.height)
+                pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+                return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        if PDF2IMAGE_AVAILABLE:
+            pages = convert_from_path(source, first_page=1, last_page=1, size=(box, None))
+            return pages[0] if pages else None
+        return None
+    img = Image.open(source)
+    img.draft("RGB", (box, box))  # JPEG: let the decoder downscale (phone photos)
+    return ImageOps.exif_transpose(img)
+
+
+def _render(source: Path, dest: Path, box: int) -> bool:
+    img = _load_image(source, box)
+    if img is None:
+        return False
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.thumbnail((box, box))
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=dest.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if FORMAT == "webp":
+                img.save(out, "WEBP", quality=75, method=4)
+            else:
+                img.save(out, "JPEG", quality=80, optimize=True, progressive=True)
+        os.replace(tmp_name, dest)  # atomic: concurrent requests never see partial files
+    finally:
+        Path(tmp_name).unlink(missing_ok=True)
+    return True
+
+
+def get_rendition(upload_folder: str, source: Path, ident: str, size: str) -> Path | None:
+    """Path of the cached rendition, generating it first if needed. None if it cannot be made."""
+    if size not in SIZES or not PIL_AVAILABLE:
+        return None
+    dest = rendition_path(upload_folder, ident, size)
+    if dest.is_file():
+        return dest
+    try:
+        if _render(source, dest, SIZES[size]):
+            return dest
+    except Exception as e:
+        logger.warning("Rendition %s failed for %s: %s", size, source.name, type(e).__name__)
+    return None
+
+
+def ensure_renditions(upload_folder: str, file_path: str, content_hash: str | None, sizes) -> None:
+    """Pre-generate renditions for a stored file (OCR worker); errors are only logged."""
+    source = Path(upload_folder) / file_path
+    if not source.is_file():
+        return
+    ident = identity(file_path, content_hash)
+    for size in sizes:
+        get_rendition(upload_folder, source, ident, size)
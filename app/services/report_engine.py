@@ -0,0 +1,311 @@
+"""
+Report engine: receipt counts by month, tag, merchant and tag × month, and spend (sum,
+average, percentiles of total_cents per currency) by month, tag and merchant, computed with
+GROUP BY and window functions in SQLite. Only aggregate rows leave the database.
+When the date range covers whole months, reports read the trigger-maintained rollup
+tables (services/rollup.py) in O(buckets) instead of scanning receipts.
+Each report returns a dict with title, columns and rows (lists), used for both the
+HTML table and the CSV download.
+"""
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, select
+
+from app import db
+from app.models import Merchant, Receipt, Tag, receipt_tags, rollup_month_merchant, rollup_month_tag
+from app.services.backfill import backfill_pending
+from app.services.receipt_parser import format_amount
+from app.services.receipt_query import date_filter_clauses, effective_date_expr, parse_date
+
+UNKNOWN_MERCHANT = "(unknown)"
+
+
+def _month_expr():
+    return func.strftime("%Y-%m", effective_date_expr())
+
+
+def _rollup_months(date_from_s: str, date_to_s: str):
+    """
+    (first_month, last_month) bounds if the range can be answered from the monthly
+    rollups (no range, or whole months); None otherwise. Bounds may be None (open).
+    """
+    if not current_app.extensions.get("rollups") or not current_app.config.get("REPORTS_USE_ROLLUP", True):
+        return None
+    date_from = parse_date(date_from_s)
+    date_to = parse_date(date_to_s)
+    if date_from_s and (date_from is None or date_from.day != 1):
+        return None
+    if date_to_s and (date_to is None or (date_to + timedelta(days=1)).day != 1):
+        return None
+    return (
+        date_from.strftime("%Y-%m") if date_from else None,
+        date_to.strftime("%Y-%m") if date_to else None,
+    )
+
+
+def _month_range(table, months):
+    first, last = months
+    clauses = []
+    if first:
+        clauses.append(table.c.month >= first)
+    if last:
+        clauses.append(table.c.month <= last)
+    return clauses
+
+
+def by_month(date_from_s: str, date_to_s: str) -> dict:
+    months = _rollup_months(date_from_s, date_to_s)
+    if months:
+        r = rollup_month_merchant
+        total = func.sum(r.c.count)
+        stmt = (
+            select(r.c.month, total)
+            .where(*_month_range(r, months))
+            .group_by(r.c.month)
+            .having(total > 0)
+            .order_by(r.c.month)
+        )
+    else:
+        month = _month_expr().label("month")
+        stmt = (
+            select(month, func.count(Receipt.id))
+            .where(*date_filter_clauses(date_from_s, date_to_s))
+            .group_by(month)
+            .order_by(month)
+        )
+    return {
+        "title": "Receipts by month",
+        "columns": ["month", "count"],
+        "rows": [list(r) for r in db.session.execute(stmt)],
+    }
+
+
+def _tagged(stmt, date_from_s: str, date_to_s: str):
+    """Join receipt_tags -> tags, and receipts only when a date range needs it."""
+    stmt = stmt.select_from(receipt_tags).join(Tag, Tag.id == receipt_tags.c.tag_id)
+    clauses = date_filter_clauses(date_from_s, date_to_s)
+    if clauses:
+        stmt = stmt.join(Receipt, Receipt.id == receipt_tags.c.receipt_id).where(*clauses)
+    return stmt
+
+
+def by_tag(date_from_s: str, date_to_s: str) -> dict:
+    months = _rollup_months(date_from_s, date_to_s)
+    if months:
+        r = rollup_month_tag
+        count = func.sum(r.c.count).label("n")
+        stmt = (
+            select(Tag.name, count)
+            .select_from(r)
+            .join(Tag, Tag.id == r.c.tag_id)
+            .where(*_month_range(r, months))
+            .group_by(Tag.id)
+            .having(count > 0)
+        )
+    else:
+        count = func.count(receipt_tags.c.receipt_id).label("n")
+        stmt = _tagged(select(Tag.name, count), date_from_s, date_to_s).group_by(Tag.id)
+    stmt = stmt.order_by(count.desc(), Tag.name)
+    return {
+        "title": "Receipts by tag",
+        "columns": ["tag", "count"],
+        "rows": [list(r) for r in db.session.execute(stmt)],
+    }
+
+
+def by_merchant(date_from_s: str, date_to_s: str) -> dict:
+    """Counts per dictionary merchant (services/merchants.py), grouped on merchant_id."""
+    months = _rollup_months(date_from_s, date_to_s)
+    if backfill_pending("receipts_merchant_id"):
+        # merchant_id is incomplete until its backfill finishes: group on the raw text
+        count = func.count(Receipt.id).label("n")
+        stmt = (
+            select(Receipt.merchant, count)
+            .where(*date_filter_clauses(date_from_s, date_to_s))
+            .group_by(Receipt.merchant)
+            .order_by(count.desc(), Receipt.merchant)
+        )
+    elif months:
+        r = rollup_month_merchant
+        count = func.sum(r.c.count).label("n")
+        stmt = (
+            select(Merchant.name, count)
+            .select_from(r)
+            .outerjoin(Merchant, Merchant.id == r.c.merchant_id)
+            .where(*_month_range(r, months))
+            .group_by(r.c.merchant_id)
+            .having(count > 0)
+            .order_by(count.desc(), Merchant.name)
+        )
+    else:
+        count = func.count(Receipt.id).label("n")
+        stmt = (
+            select(Merchant.name, count)
+            .select_from(Receipt)
+            .outerjoin(Merchant, Merchant.id == Receipt.merchant_id)
+            .where(*date_filter_clauses(date_from_s, date_to_s))
+            .group_by(Receipt.merchant_id)
+            .order_by(count.desc(), Merchant.name)
+        )
+    return {
+        "title": "Receipts by merchant",
+        "columns": ["merchant", "count"],
+        "rows": [[m or UNKNOWN_MERCHANT, n] for m, n in db.session.execute(stmt)],
+    }
+
+
+def tag_month_pivot(date_from_s: str, date_to_s: str) -> dict:
+    """Tag × month counts: one row per tag, one column per month, plus a total."""
+    rollup_range = _rollup_months(date_from_s, date_to_s)
+    if rollup_range:
+        r = rollup_month_tag
+        stmt = (
+            select(Tag.name, r.c.month, r.c.count)
+            .select_from(r)
+            .join(Tag, Tag.id == r.c.tag_id)
+            .where(r.c.count > 0, *_month_range(r, rollup_range))
+        )
+    else:
+        month = _month_expr().label("month")
+        stmt = select(Tag.name, month, func.count(receipt_tags.c.receipt_id))
+        stmt = stmt.select_from(receipt_tags).join(Tag, Tag.id == receipt_tags.c.tag_id)
+        stmt = stmt.join(Receipt, Receipt.id == receipt_tags.c.receipt_id)
+        stmt = stmt.where(*date_filter_clauses(date_from_s, date_to_s)).group_by(Tag.id, month)
+    cells = {}
+    months = set()
+    for name, m, n in db.session.execute(stmt):
+        cells[(name, m)] = n
+        months.add(m)
+    months = sorted(months)
+    rows = []
+    for name in sorted({name for name, _ in cells}):
+        counts = [cells.get((name, m), 0) for m in months]
+        rows.append([name, *counts, sum(counts)])
+    return {
+        "title": "Receipts by tag and month",
+        "columns": ["tag", *months, "total"],
+        "rows": rows,
+    }
+
+
+SPEND_PERCENTILES = (("median", 0.5), ("p90", 0.9))
+
+
+def _spend(stmt, key, label, date_from_s: str, date_to_s: str, order_by_total: bool) -> list[list]:
+    """
+    Spend per (key, currency) over receipts with a total. stmt selects from receipts (plus
+    joins); label is the displayed bucket. Percentiles are nearest-rank, picked from
+    row_number() within each bucket, so everything stays one SQL statement.
+    """
+    currency = func.coalesce(Receipt.currency, "")
+    amount = Receipt.total_cents
+    partition = (key, currency)
+    ranked = stmt.add_columns(
+        key.label("key"),
+        label.label("label"),
+        currency.label("currency"),
+        amount.label("amount"),
+        func.row_number().over(partition_by=partition, order_by=amount).label("rn"),
+        func.count().over(partition_by=partition).label("n"),
+    ).where(amount.isnot(None), *date_filter_clauses(date_from_s, date_to_s)).subquery()
+    total = func.sum(ranked.c.amount)
+    stmt = select(
+        func.min(ranked.c.label),
+        ranked.c.currency,
+        func.count(),
+        total,
+        func.round(func.avg(ranked.c.amount)),
+        *(func.min(case((ranked.c.rn >= p * ranked.c.n, ranked.c.amount))) for _, p in SPEND_PERCENTILES),
+    ).group_by(ranked.c.key, ranked.c.currency)
+    if order_by_total:
+        stmt = stmt.order_by(total.desc(), ranked.c.currency)
+    else:
+        stmt = stmt.order_by(func.min(ranked.c.label), ranked.c.currency)
+    return [
+        [bucket, cur, n, *(format_amount(int(v)) if v is not None else "" for v in values)]
+        for bucket, cur, n, *values in db.session.execute(stmt)
+    ]
+
+
+def _spend_columns(bucket: str) -> list[str]:
+    return [bucket, "currency", "receipts", "total", "average", *(name for name, _ in SPEND_PERCENTILES)]
+
+
+def spend_by_month(date_from_s: str, date_to_s: str) -> dict:
+    month = _month_expr()
+    return {
+        "title": "Spend by month",
+        "columns": _spend_columns("month"),
+        "rows": _spend(select().select_from(Receipt), month, month, date_from_s, date_to_s, False),
+    }
+
+
+def spend_by_tag(date_from_s: str, date_to_s: str) -> dict:
+    stmt = (
+        select()
+        .select_from(receipt_tags)
+        .join(Tag, Tag.id == receipt_tags.c.tag_id)
+        .join(Receipt, Receipt.id == receipt_tags.c.receipt_id)
+    )
+    return {
+        "title": "Spend by tag",
+        "columns": _spend_columns("tag"),
+        "rows": _spend(stmt, Tag.id, Tag.name, date_from_s, date_to_s, True),
+    }
+
+
+def spend_by_merchant(date_from_s: str, date_to_s: str) -> dict:
+    if backfill_pending("receipts_merchant_id"):
+        merchant = func.coalesce(Receipt.merchant, UNKNOWN_MERCHANT)
+        rows = _spend(select().select_from(Receipt), merchant, merchant, date_from_s, date_to_s, True)
+    else:
+        stmt = select().select_from(Receipt).outerjoin(Merchant, Merchant.id == Receipt.merchant_id)
+        label = func.coalesce(Merchant.name, UNKNOWN_MERCHANT)
+        rows = _spend(stmt, func.coalesce(Receipt.merchant_id, 0), label, date_from_s, date_to_s, True)
+    return {
+        "title": "Spend by merchant",
+        "columns": _spend_columns("merchant"),
+        "rows": rows,
+    }
+
+
+REPORTS = {
+    "by_month": by_month,
+    "by_tag": by_tag,
+    "by_merchant": by_merchant,
+    "tag_month": tag_month_pivot,
+    "spend_month": spend_by_month,
+    "spend_tag": spend_by_tag,
+    "spend_merchant": spend_by_merchant,
+}
+
+
+def run_report(report_type: str, date_from_s: str, date_to_s: str) -> dict:
+    """Run a report by name (see REPORTS). Raises KeyError for unknown types."""
+    return REPORTS[report_type](date_from_s, date_to_s)
+
+
+def dashboard(months: int = 6, top_tags: int = 5) -> dict:
+    """Home page summary: total receipts, recent months and top tags (from the rollups)."""
+    today = date.today()
+    first = today.replace(day=1)
+    for _ in range(months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+    recent = by_month(first.isoformat(), "")["rows"]
+    counts = dict(recent)
+    month_keys = []
+    d = first
+    while d <= today:
+        month_keys.append(d.strftime("%Y-%m"))
+        d = (d + timedelta(days=32)).replace(day=1)
+    if _rollup_months("", ""):
+        total = db.session.execute(select(func.coalesce(func.sum(rollup_month_merchant.c.count), 0))).scalar()
+    else:
+        total = db.session.execute(select(func.count(Receipt.id))).scalar()
+    return {
+        "total": total,
+        "this_month": counts.get(today.strftime("%Y-%m"), 0),
+        "months": [(m, counts.get(m, 0)) for m in month_keys],
+        "top_tags": by_tag("", "")["rows"][:top_tags],
+    }
@@ -0,0 +1,63 @@
+"""
+Materialized report rollups: receipt counts per (month, tag) and per (month, merchant id).
+SQLite triggers keep them current on every receipt insert/update/delete (upload, OCR
+completion, edits) and every receipt_tags change (tag assignment, tag deletion), so
+reports and the dashboard read O(buckets) rows instead of scanning receipts.
+Tag and merchant renames need no maintenance: buckets are keyed by id. Tables and
+triggers are created by migrations v0005 and v0009; this module checks and rebuilds them.
+"""
+from sqlalchemy import text
+
+from app import db
+
+# Must match the triggers in the latest rollup migration. Same month as report_engine's
+# strftime('%Y-%m', effective_date): effective_date = coalesce(receipt_date, date(created_at))
+_MONTH = "strftime('%Y-%m', coalesce({r}.receipt_date, {r}.created_at))"
+_MERCHANT = "coalesce({r}.merchant_id, 0)"
+
+
+def _m(r):
+    return _MONTH.format(r=r)
+
+
+def _mer(r):
+    return _MERCHANT.format(r=r)
+
+
+# Source-of-truth aggregates, used to rebuild and to check for drift: table -> (bucket column, query)
+_EXPECTED = {
+    "rollup_month_tag": ("tag_id", f"""
+        SELECT {_m('r')} AS month, rt.tag_id, count(*) AS count
+        FROM receipt_tags rt JOIN receipts r ON r.id = rt.receipt_id
+        GROUP BY 1, 2"""),
+    "rollup_month_merchant": ("merchant_id", f"""
+        SELECT {_m('r')} AS month, {_mer('r')} AS merchant_id, count(*) AS count
+        FROM receipts r
+        GROUP BY 1, 2"""),
+}
+
+
+def _rebuild(conn) -> None:
+    for table, (key, select_sql) in _EXPECTED.items():
+        conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(text(f"INSERT INTO {table} (month, {key}, count) {select_sql}"))
+
+
+def check_rollups() -> dict[str, int]:
+    """Number of drifted buckets per rollup table (missing, extra or wrong count)."""
+    drift = {}
+    with db.engine.connect() as conn:
+        for table, (key, select_sql) in _EXPECTED.items():
+            current = {
+                (m, k): n
+                for m, k, n in conn.execute(text(f"SELECT month, {key}, count FROM {table} WHERE count <> 0"))
+            }
+            expected = {(m, k): n for m, k, n in conn.execute(text(select_sql))}
+            drift[table] = sum(1 for b in current.keys() | expected.keys() if current.get(b) != expected.get(b))
+    return drift
+
+
+def rebuild_rollups() -> None:
+    """Recompute both rollups from receipts in one transaction."""
+    with db.engine.begin() as conn:
+        _rebuild(conn)
@@ -0,0 +1,91 @@
+"""
+SQLite FTS5 full-text index over receipts.merchant and receipts.extracted_text.
+External-content table (no second copy of the OCR text) kept in sync by triggers
+(created by migration v0004);
+results are ranked with bm25, merchant hits weighted above body text.
+"""
+import re
+
+from flask import current_app
+from markupsafe import Markup, escape
+from sqlalchemy import column, func, literal_column, select, table, text
+
+from app import db
+
+FTS_TABLE = "receipts_fts"
+
+# bm25 column weights: (merchant, extracted_text)
+MERCHANT_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+receipts_fts = table(FTS_TABLE, column("rowid"), column("merchant"), column("extracted_text"))
+
+# Highlight markers for snippet(); control chars never appear in escaped HTML
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+_WORD_RE = re.compile(r"\w+")
+
+
+def fts_enabled() -> bool:
+    """Whether the FTS table exists (migration v0004) and SEARCH_FTS is on; set at startup."""
+    return current_app.extensions.get("receipts_fts", False)
+
+
+def rebuild_search_index() -> int:
+    """Rebuild the whole index from receipts (repair after manual edits or a corrupted index)."""
+    with db.engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+        return conn.execute(text("SELECT count(*) FROM receipts")).scalar()
+
+
+def to_fts_query(q: str) -> str | None:
+    """
+    Turn user input into an FTS5 query. "Quoted text" is a phrase; other words
+    match as prefixes (so "acm" finds "ACME"). All terms must match.
+    Returns None if the input has no searchable words.
+    """
+    terms = []
+    for m in _TOKEN_RE.finditer(q or ""):
+        phrase, word = m.group(1), m.group(2)
+        if phrase is not None:
+            words = _WORD_RE.findall(phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+        else:
+            for w in _WORD_RE.findall(word):
+                terms.append(f'"{w}"*')
+    return " ".join(terms) or None
+
+
+def match_subquery(fts_query: str):
+    """Subquery of (receipt_id, rank) for an FTS query; lower rank = better match."""
+    fts = literal_column(FTS_TABLE)
+    return (
+        select(
+            receipts_fts.c.rowid.label("receipt_id"),
+            func.bm25(fts, MERCHANT_WEIGHT, TEXT_WEIGHT).label("rank"),
+        )
+        .where(fts.op("MATCH")(fts_query))
+        .subquery("fts")
+    )
+
+
+def snippets_for(receipt_ids: list[int], q: str, tokens: int = 12) -> dict[int, Markup]:
+    """Highlighted text snippets for the given receipts; safe HTML with <mark> tags."""
+    fts_query = to_fts_query(q)
+    if not receipt_ids or not fts_query or not fts_enabled():
+        return {}
+    fts = literal_column(FTS_TABLE)
+    stmt = select(
+        receipts_fts.c.rowid,
+        func.snippet(fts, -1, _MARK_START, _MARK_END, "…", tokens),
+    ).where(fts.op("MATCH")(fts_query), receipts_fts.c.rowid.in_(receipt_ids))
+    out = {}
+    for rowid, snippet in db.session.execute(stmt):
+        if snippet:
+            html = str(escape(snippet)).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+            out[rowid] = Markup(html)
+    return out
@@ -0,0 +1,66 @@
+"""
+SQLite connection setup and index maintenance. Every new DB-API connection gets the
+pragmas from SQLITE_PRAGMAS (WAL so readers never block the writer, synchronous=NORMAL,
+mmap/cache sizes, busy_timeout so concurrent writers wait instead of failing with
+"database is locked"). Also a BEGIN IMMEDIATE helper for migrations and backfills.
+"""
+import logging
+from contextlib import contextmanager
+
+from flask import Flask
+from sqlalchemy import event
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite(app: Flask) -> None:
+    """Install the connect hook on the app's engine (no-op for other databases)."""
+    engine = db.engine
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = dict(app.config["SQLITE_PRAGMAS"])
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for name, value in pragmas.items():
+                if value is not None:
+                    cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+    # Connections opened before the hook existed (none normally) would keep SQLite defaults
+    engine.dispose()
+
+
+@contextmanager
+def immediate_transaction():
+    """
+    Connection inside BEGIN IMMEDIATE: takes the write lock up front (waiting up to
+    busy_timeout) instead of failing when a read transaction is upgraded under WAL.
+    """
+    with db.engine.connect() as conn:
+        # AUTOCOMMIT hands transaction control to us; pysqlite would not BEGIN before DDL
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+
+
+def missing_indexes() -> list[str]:
+    """Indexes declared on the models but absent from the database (schema drift check)."""
+    with db.engine.connect() as conn:
+        # sqlite_master rather than reflection: SQLAlchemy skips expression indexes when reflecting
+        present = {
+            name for (name,) in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")
+        }
+    return sorted(
+        index.name for table in db.metadata.sorted_tables for index in table.indexes if index.name not in present
+    )
@@ -1,13 +1,21 @@
 """
-Secure receipt file storage: allowlist extensions, size limits, UUID-based filenames.
-Files stored outside web root; serve via app controller.
+Secure receipt file storage: allowlist extensions, size limits, content-addressed filenames.
+Uploads are hashed (SHA-256) while streaming to disk and stored as ab/cd/<sha256>.<ext>,
+so identical files are stored once. Files stored outside web root; serve via app controller.
 """
+import hashlib
 import os
-import uuid
+import tempfile
 from pathlib import Path
+from typing import BinaryIO
 
 from werkzeug.datastructures import FileStorage
 
+CHUNK_SIZE = 64 * 1024
+INCOMING_DIR = ".incoming"  # temp files; same filesystem as the store so moves are atomic
+# One stored extension per format, so the same bytes uploaded as .jpg and .jpeg are stored once
+EXTENSION_ALIASES = {"jpeg": "jpg"}
+
 
 def allowed_extension(filename: str, allowed: set[str]) -> bool:
     """Check extension (lowercase) against allowlist after splitting once."""
@@ -17,33 +25,92 @@ def allowed_extension(filename: str, allowed: set[str]) -> bool:
     return ext in allowed
 
 
-def safe_save_upload(
-    file: FileStorage,
+def content_path(content_hash: str, ext: str) -> str:
+    """Relative, sharded storage path for a file hash: ab/cd/abcd….ext"""
+    ext = ext.lower()
+    ext = EXTENSION_ALIASES.get(ext, ext)
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{ext}"
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def store_file(tmp_path: Path, content_hash: str, ext: str, upload_folder: str) -> str:
+    """Move a fully written temp file into the content-addressed store; return its relative path."""
+    rel = content_path(content_hash, ext)
+    dest = Path(upload_folder) / rel
+    if dest.is_file():
+        # Same bytes already stored: keep the existing copy
+        tmp_path.unlink(missing_ok=True)
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, dest)
+    return rel
+
+
+def incoming_dir(upload_folder: str) -> Path:
+    path = Path(upload_folder) / INCOMING_DIR
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_stream(
+    stream: BinaryIO,
+    original: str,
     upload_folder: str,
     allowed_extensions: set[str],
-) -> tuple[str, str]:
+) -> tuple[str, str, str]:
     """
-    Save uploaded file with a safe UUID-based name. Return (stored_path, original_filename).
+    Stream a file into storage, hashing as it is written. Return (stored_path, original_filename, sha256).
     Raises ValueError if extension not allowed or filename invalid.
     """
-    if not file or not file.filename:
+    if not original:
         raise ValueError("No file or filename")
-    original = file.filename
     if not allowed_extension(original, allowed_extensions):
         raise ValueError("File type not allowed")
     ext = original.rsplit(".", 1)[-1].lower()
-    safe_name = f"{uuid.uuid4().hex}.{ext}"
-    base = Path(upload_folder)
-    base.mkdir(parents=True, exist_ok=True)
-    dest = base / safe_name
-    file.save(str(dest))
-    # Return relative path (safe_name) for DB so UPLOAD_FOLDER is portable
-    return safe_name, original
+    h = hashlib.sha256()
+    fd, tmp_name = tempfile.mkstemp(dir=incoming_dir(upload_folder))
+    tmp_path = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := stream.read(CHUNK_SIZE):
+                h.update(chunk)
+                out.write(chunk)
+        content_hash = h.hexdigest()
+        # Return relative path for DB so UPLOAD_FOLDER is portable
+        return store_file(tmp_path, content_hash, ext, upload_folder), original, content_hash
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def safe_save_upload(
+    file: FileStorage,
+    upload_folder: str,
+    allowed_extensions: set[str],
+) -> tuple[str, str, str]:
+    """
+    Save uploaded file under its content hash. Return (stored_path, original_filename, sha256).
+    Raises ValueError if extension not allowed or filename invalid.
+    """
+    if not file or not file.filename:
+        raise ValueError("No file or filename")
+    return save_stream(file.stream, file.filename, upload_folder, allowed_extensions)
+
+
+def is_safe_relative_path(file_path: str) -> bool:
+    """Lexical check (no filesystem access): relative and without '..' components."""
+    return bool(file_path) and not os.path.isabs(file_path) and ".." not in Path(file_path).parts
 
 
 def path_for_receipt(upload_folder: str, file_path: str) -> Path | None:
     """Resolve path for serving; return None if outside upload_folder or missing."""
-    if not file_path or ".." in file_path or os.path.sep in file_path:
+    if not is_safe_relative_path(file_path):
         return None
     base = Path(upload_folder).resolve()
     try:
@@ -57,3 +124,16 @@ def path_for_receipt(upload_folder: str, file_path: str) -> Path | None:
     except ValueError:
         return None
     return full
+
+
+def remove_stored_file(upload_folder: str, file_path: str) -> None:
+    """Delete a stored file and prune its now-empty shard directories."""
+    full = path_for_receipt(upload_folder, file_path)
+    if full is None:
+        return
+    full.unlink(missing_ok=True)
+    base = Path(upload_folder).resolve()
+    parent = full.parent
+    while parent != base and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
@@ -0,0 +1,195 @@
+"""
+In-memory tag bitmap index: tag id -> bitmap of receipt ids, plus the bitmap of all receipt
+ids (for NOT). Tag filters (any of / all of / none of) are evaluated on the bitmaps, and
+receipt_query hands the resulting ids to SQL, where they are intersected with the date and
+text filters by primary key. Bitmaps are pyroaring BitMaps when installed, else Python ints
+used as bitsets.
+
+Each process keeps its own copy. Triggers append every receipts / receipt_tags insert and
+delete to tag_index_log, whoever made it (assign_tag, tag delete, dedupe, another process);
+before each use the index replays the entries after the last seq it has seen, and rebuilds
+from receipt_tags when the log was pruned past that point. That seq is the index version.
+Renaming a tag does not change the index, which is keyed by tag id.
+"""
+import logging
+import re
+import threading
+from itertools import groupby
+
+from sqlalchemy import text
+
+try:
+    from pyroaring import BitMap
+    PYROARING_AVAILABLE = True
+except ImportError:
+    PYROARING_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ALL_RECEIPTS = 0  # tag_id of tag_index_log entries for the receipt row itself
+
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+class IntBitmap:
+    """Set of non-negative ints stored as the bits of one Python int (no pyroaring)."""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, values=(), bits: int = 0):
+        values = list(values)
+        if values:
+            buf = bytearray(max(values) // 8 + 1)
+            for v in values:
+                buf[v >> 3] |= 1 << (v & 7)
+            bits |= int.from_bytes(buf, "little")
+        self.bits = bits
+
+    def add(self, value: int) -> None:
+        self.bits |= 1 << value
+
+    def discard(self, value: int) -> None:
+        if self.bits >> value & 1:
+            self.bits ^= 1 << value
+
+    def __and__(self, other):
+        return IntBitmap(bits=self.bits & other.bits)
+
+    def __or__(self, other):
+        return IntBitmap(bits=self.bits | other.bits)
+
+    def __sub__(self, other):
+        return IntBitmap(bits=self.bits & ~other.bits)
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __iter__(self):
+        data = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+        for m in _NONZERO_BYTE.finditer(data):
+            base = m.start() * 8
+            for bit in _BYTE_BITS[data[m.start()]]:
+                yield base + bit
+
+
+def _bitmap(values=()):
+    return BitMap(values) if PYROARING_AVAILABLE else IntBitmap(values)
+
+
+_lock = threading.Lock()
+# tags: tag id -> bitmap; all: every receipt id; seq: last tag_index_log entry applied
+_index = {"tags": {}, "all": None, "seq": None}
+
+
+def build(conn) -> None:
+    """Load the index from receipt_tags and receipts (caller holds _lock)."""
+    # Read the log position first: changes made while loading are replayed, which is idempotent
+    seq = conn.execute(text("SELECT coalesce(max(seq), 0) FROM tag_index_log")).scalar()
+    rows = conn.execute(text("SELECT tag_id, receipt_id FROM receipt_tags ORDER BY tag_id"))
+    tags = {tag_id: _bitmap(rid for _, rid in group) for tag_id, group in groupby(rows, key=lambda r: r[0])}
+    all_ids = _bitmap(rid for (rid,) in conn.execute(text("SELECT id FROM receipts")))
+    _index.update(tags=tags, all=all_ids, seq=seq)
+    logger.info("Tag index built: %d tags, %d receipts (log seq %d)", len(tags), len(all_ids), seq)
+
+
+def refresh(conn) -> None:
+    """Apply log entries written since the last refresh; rebuild if they were pruned (caller holds _lock)."""
+    if _index["seq"] is None:
+        build(conn)
+        return
+    entries = conn.execute(
+        text("SELECT seq, receipt_id, tag_id, added FROM tag_index_log WHERE seq > :seq ORDER BY seq"),
+        {"seq": _index["seq"]},
+    ).all()
+    if entries and entries[0][0] > _index["seq"] + 1:
+        # A gap: rolled back inserts, or entries pruned before this process read them
+        first = conn.execute(text("SELECT min(seq) FROM tag_index_log")).scalar()
+        if first > _index["seq"] + 1:
+            build(conn)
+            return
+    for seq, receipt_id, tag_id, added in entries:
+        if tag_id == ALL_RECEIPTS:
+            bitmap = _index["all"]
+        else:
+            bitmap = _index["tags"].get(tag_id)
+            if bitmap is None:
+                bitmap = _index["tags"][tag_id] = _bitmap()
+        if added:
+            bitmap.add(receipt_id)
+        else:
+            bitmap.discard(receipt_id)
+        _index["seq"] = seq
+
+
+def invalidate() -> None:
+    """Drop the in-memory index; the next use rebuilds it."""
+    with _lock:
+        _index.update(tags={}, all=None, seq=None)
+
+
+def version(conn) -> int:
+    """Current index version (last applied tag_index_log seq), after catching up."""
+    with _lock:
+        refresh(conn)
+        return _index["seq"]
+
+
+def _union(bitmaps):
+    out = _bitmap()
+    for b in bitmaps:
+        out = out | b
+    return out
+
+
+def _evaluate(tag_any, tag_all, tag_none):
+    empty = _bitmap()
+    tags = _index["tags"]
+    result = None
+    for tag_id in tag_all:
+        bitmap = tags.get(tag_id, empty)
+        result = bitmap | empty if result is None else result & bitmap
+    if tag_any:
+        matches = _union(tags.get(t, empty) for t in tag_any)
+        result = matches if result is None else result & matches
+    if tag_none:
+        base = _index["all"] if result is None else result
+        result = base - _union(tags.get(t, empty) for t in tag_none)
+    return result
+
+
+def evaluate(conn, tag_any=(), tag_all=(), tag_none=()):
+    """
+    Receipt ids having at least one tag of tag_any, every tag of tag_all and no tag of
+    tag_none (empty lists are ignored); None when no tag filter is given. Returns a new
+    bitmap the caller may keep.
+    """
+    if not (tag_any or tag_all or tag_none):
+        return None
+    with _lock:
+        refresh(conn)
+        return _evaluate(tag_any, tag_all, tag_none)
+
+
+def id_filter(conn, tag_any, tag_all, tag_none, max_ids: int):
+    """
+    ("in", ids) with the sorted receipt ids matching the tag filter, or ("not_in", ids) with
+    those not matching, whichever list is shorter (e.g. "none of" a rare tag). None when there
+    is no tag filter or both lists are longer than max_ids.
+    """
+    if not (tag_any or tag_all or tag_none):
+        return None
+    with _lock:
+        refresh(conn)
+        result = _evaluate(tag_any, tag_all, tag_none)
+        excluded = _index["all"] - result
+    op, ids = ("in", result) if len(result) <= len(excluded) else ("not_in", excluded)
+    return (op, list(ids)) if len(ids) <= max_ids else None
+
+
+def prune_log(conn, keep: int) -> int:
+    """Delete all but the last keep log entries; returns rows deleted. Caller commits."""
+    first, last = conn.execute(text("SELECT min(seq), max(seq) FROM tag_index_log")).one()
+    if last is None or last - first < 2 * keep:
+        return 0
+    return conn.execute(text("DELETE FROM tag_index_log WHERE seq <= :cutoff"), {"cutoff": last - keep}).rowcount
@@ -0,0 +1,112 @@
+(function () {
+  "use strict";
+
+  // Sends the upload form's file through the resumable chunk API (routes/uploads.py).
+  // A session id is remembered per file, so re-selecting the same file after a dropped
+  // connection or a reload continues from the first missing chunk.
+  var form = document.querySelector("form[data-chunked-upload]");
+  if (!form || !window.fetch || !window.localStorage) return;
+
+  var input = form.querySelector("input[type=file]");
+  var progress = form.querySelector("progress");
+  var message = form.querySelector("[data-upload-status]");
+  var baseUrl = form.getAttribute("data-chunked-upload");
+  var maxBytes = parseInt(form.getAttribute("data-max-bytes"), 10);
+  var csrfToken = form.querySelector("input[name=csrf_token]").value;
+  var MAX_RETRIES = 5;
+
+  function storageKey(file) {
+    return "chunked-upload:" + file.name + ":" + file.size + ":" + file.lastModified;
+  }
+
+  function showStatus(text) {
+    message.textContent = text;
+  }
+
+  function request(method, url, body, contentType) {
+    var headers = { "X-CSRFToken": csrfToken };
+    if (contentType) headers["Content-Type"] = contentType;
+    return fetch(url, { method: method, headers: headers, body: body, credentials: "same-origin" })
+      .then(function (response) {
+        return response.json().catch(function () { return {}; }).then(function (data) {
+          if (!response.ok) {
+            var error = new Error(data.error || "Upload failed (HTTP " + response.status + ")");
+            error.status = response.status;
+            throw error;
+          }
+          return data;
+        });
+      });
+  }
+
+  function openSession(file) {
+    var key = storageKey(file);
+    var saved = localStorage.getItem(key);
+    var start = function () {
+      return request("POST", baseUrl, JSON.stringify({ filename: file.name, size: file.size }), "application/json")
+        .then(function (state) {
+          localStorage.setItem(key, state.id);
+          return state;
+        });
+    };
+    if (!saved) return start();
+    return request("GET", baseUrl + "/" + saved).catch(function (error) {
+      if (error.status === 404) return start();
+      throw error;
+    });
+  }
+
+  function sendChunk(file, state, index, attempt) {
+    var begin = index * state.chunk_size;
+    var blob = file.slice(begin, Math.min(begin + state.chunk_size, file.size));
+    return request("PUT", baseUrl + "/" + state.id + "/chunks/" + index, blob, "application/octet-stream")
+      .catch(function (error) {
+        if (error.status === 409) {
+          // Out of step with the server (e.g. another tab); ask where to continue
+          return request("GET", baseUrl + "/" + state.id);
+        }
+        var retriable = !error.status || error.status >= 500;
+        if (!retriable || attempt >= MAX_RETRIES) throw error;
+        showStatus("Connection problem, retrying chunk " + (index + 1) + "…");
+        return new Promise(function (resolve) {
+          setTimeout(resolve, 1000 * Math.pow(2, attempt));
+        }).then(function () {
+          return sendChunk(file, state, index, attempt + 1);
+        });
+      });
+  }
+
+  function sendFrom(file, state) {
+    progress.value = state.received / state.size;
+    if (state.received >= state.size) return Promise.resolve(state);
+    showStatus("Uploading " + file.name + ": chunk " + (state.next_chunk + 1) + " of " + state.chunks);
+    return sendChunk(file, state, state.next_chunk, 0).then(function (next) {
+      return sendFrom(file, next);
+    });
+  }
+
+  form.addEventListener("submit", function (event) {
+    var file = input.files && input.files[0];
+    if (!file) return;
+    event.preventDefault();
+    if (file.size > maxBytes) {
+      showStatus("File too large (limit " + Math.floor(maxBytes / (1024 * 1024)) + " MB).");
+      return;
+    }
+    form.classList.add("is-uploading");
+    progress.hidden = false;
+    openSession(file)
+      .then(function (state) { return sendFrom(file, state); })
+      .then(function (state) { return request("POST", baseUrl + "/" + state.id + "/finalize"); })
+      .then(function (result) {
+        localStorage.removeItem(storageKey(file));
+        showStatus(result.message);
+        window.location.assign(result.url);
+      })
+      .catch(function (error) {
+        form.classList.remove("is-uploading");
+        if (error.status === 422) localStorage.removeItem(storageKey(file));
+        showStatus(error.message + " Submit again to resume.");
+      });
+  });
+})();
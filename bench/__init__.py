@@ -0,0 +1,6 @@
+"""
+Performance benchmarks: a synthetic receipt corpus (bench/corpus.py), sample files for OCR
+(bench/samples.py) and timed cases for search, export, reports, page rendering and OCR
+(bench/cases.py). Run with `python -m bench --help`; results are printed as JSON and can be
+compared against a saved baseline.
+"""
@@ -0,0 +1,161 @@
+"""
+python -m bench [--receipts N] [--cases search,export,...] [--output results.json] [--compare baseline.json]
+
+Builds (or reuses) a corpus database of N receipts under --workdir, runs the benchmark
+cases and prints JSON results. With --compare, each case's median is compared with the
+baseline file and the exit code is 1 if any case got slower than --tolerance allows.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Receipt manager benchmarks.")
+    parser.add_argument("--receipts", type=int, default=10_000, help="Corpus size (default: 10000).")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=None,
+                        help="Where corpus databases are kept between runs (default: instance/bench).")
+    parser.add_argument("--regenerate", action="store_true", help="Rebuild the corpus even if it exists.")
+    parser.add_argument("--cases", default=None, help="Comma-separated cases to run (default: all).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (default: 5).")
+    parser.add_argument("--samples", type=int, default=5, help="Sample files per kind for the OCR cases.")
+    parser.add_argument("--ocr-samples", default=None,
+                        help="Directory of your own receipt images/PDFs to add to the OCR cases "
+                             "(optional <file>.txt next to each with the expected text).")
+    parser.add_argument("--output", default=None, help="Also write the JSON results to this file.")
+    parser.add_argument("--compare", default=None, help="Baseline results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown of a case's median vs the baseline (default: 0.25 = 25%%).")
+    return parser.parse_args(argv)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent.parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """Per case present in both: baseline and current median, ratio, and whether it regressed."""
+    base = {r["name"]: r for r in baseline}
+    rows = []
+    for r in results:
+        b = base.get(r["name"])
+        if not b or not b.get("median_ms"):
+            continue
+        ratio = r["median_ms"] / b["median_ms"]
+        rows.append({
+            "name": r["name"],
+            "baseline_ms": b["median_ms"],
+            "median_ms": r["median_ms"],
+            "ratio": round(ratio, 3),
+            "regressed": ratio > 1 + tolerance,
+        })
+    return rows
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    root = Path(__file__).resolve().parent.parent
+    workdir = Path(args.workdir or root / "instance" / "bench").resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    from bench.corpus import CORPUS_VERSION
+
+    db_path = workdir / f"corpus-{args.receipts}-s{args.seed}-v{CORPUS_VERSION}.db"
+    if args.regenerate:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    fresh = not db_path.exists()
+    # The app reads its settings from the environment at import time
+    os.environ["DATABASE_URI"] = f"sqlite:///{db_path}"
+    os.environ["UPLOAD_FOLDER"] = str(workdir / "uploads")
+    os.environ["OCR_CACHE_PATH"] = ""
+    os.environ["CACHE_PATH"] = ""
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ["FLASK_ENV"] = "production"
+
+    from app import create_app
+    from bench.cases import CASES
+    from bench.samples import local_samples, write_samples
+
+    selected = args.cases.split(",") if args.cases else list(CASES)
+    unknown = [c for c in selected if c not in CASES]
+    if unknown:
+        print(f"Unknown case(s): {', '.join(unknown)}; available: {', '.join(CASES)}", file=sys.stderr)
+        return 2
+
+    app = create_app()
+    with app.app_context():
+        corpus_seconds = None
+        if fresh:
+            from bench.corpus import generate_corpus
+
+            def progress(done, total):
+                print(f"corpus: {done}/{total} receipts", file=sys.stderr)
+
+            start = time.perf_counter()
+            generate_corpus(args.receipts, args.seed, progress)
+            corpus_seconds = round(time.perf_counter() - start, 2)
+        samples = {}
+        if any(name.startswith("ocr") for name in selected):
+            samples = write_samples(app.config["UPLOAD_FOLDER"], args.samples, args.seed)
+            if args.ocr_samples:
+                samples["local"] = local_samples(args.ocr_samples)
+        ctx = {
+            "app": app,
+            "client": app.test_client(),
+            "repeat": args.repeat,
+            "receipts": args.receipts,
+            "samples": samples,
+        }
+        results = []
+        for name in selected:
+            print(f"case: {name}", file=sys.stderr)
+            results.extend(CASES[name](ctx))
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "receipts": args.receipts,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "corpus_build_s": corpus_seconds,
+        },
+        "results": results,
+    }
+    status = 0
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get("meta", {}).get("receipts") != args.receipts:
+            print("warning: baseline was measured on a different corpus size", file=sys.stderr)
+        output["comparison"] = compare(results, baseline["results"], args.tolerance)
+        regressed = [c["name"] for c in output["comparison"] if c["regressed"]]
+        if regressed:
+            print(f"regressions (> {args.tolerance:.0%} slower): {', '.join(regressed)}", file=sys.stderr)
+            status = 1
+    text = json.dumps(output, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Benchmark cases. Each case function takes the run context and returns result dicts with a
+name, timing statistics in milliseconds and case-specific counts. Cases run inside the app
+context against the corpus database; the ORM session is cleared between runs so every run
+loads its rows again.
+"""
+import math
+import re
+import shutil
+import statistics
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+from app import db
+from app.models import Tag
+
+CASES = {}
+
+
+def case(name: str):
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    """Time fn() repeat times after warmup runs; returns min/median/p95/mean in ms."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+        db.session.remove()
+    times.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(times[0], 3),
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[max(0, math.ceil(0.95 * len(times)) - 1)], 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+    }
+
+
+def _result(name: str, timing: dict, **extra) -> dict:
+    return {"name": name, **timing, **extra}
+
+
+@case("search")
+def search_cases(ctx) -> list[dict]:
+    """build_receipt_query: one page of results for typical filter combinations."""
+    from app.services.receipt_query import build_receipt_query
+
+    page_size = ctx["app"].config["RECEIPTS_PAGE_SIZE"]
+    tags = [t.id for t in Tag.query.order_by(Tag.id).limit(10)]
+    queries = {
+        "search.all": ([], "", "", ""),
+        "search.tag": ([tags[4]], "", "", ""),
+        "search.tags_any": (tags[5:8], "", "", ""),
+        "search.tags_all": ([], "", "", "", None, tags[0:2]),
+        "search.tags_none": ([], "", "", "", None, [], tags[0:1]),
+        "search.tags_all_none_date": ([], "2024-01-01", "2024-12-31", "", None, tags[1:3], tags[0:1]),
+        "search.date_month": ([], "2025-03-01", "2025-03-31", ""),
+        "search.text": ([], "", "", "coffee"),
+        "search.text_rare": ([], "", "", "riverside pharmacy"),
+        "search.combined": ([tags[1]], "2024-01-01", "2024-12-31", "market"),
+    }
+    results = []
+    for name, args in queries.items():
+        rows = {}
+
+        def run(args=args):
+            rows["n"] = len(build_receipt_query(*args).limit(page_size).all())
+
+        results.append(_result(name, measure(run, ctx["repeat"]), rows=rows["n"]))
+    return results
+
+
+@case("export")
+def export_cases(ctx) -> list[dict]:
+    """Streaming CSV export of every receipt, through the Flask route."""
+    client = ctx["client"]
+    out = {}
+
+    def run():
+        response = client.get("/export/receipts.csv")
+        out["bytes"] = len(response.get_data())
+        out["status"] = response.status_code
+
+    timing = measure(run, max(1, min(ctx["repeat"], 3)), warmup=0)
+    rows = ctx["receipts"]
+    return [_result(
+        "export.csv", timing, rows=rows, bytes=out["bytes"],
+        rows_per_s=round(rows / (timing["median_ms"] / 1000)) if timing["median_ms"] else None,
+    )]
+
+
+@case("reports")
+def report_cases(ctx) -> list[dict]:
+    """Count and spend reports, for the whole range (rollups) and a partial-month range (scan)."""
+    from app.services.report_engine import REPORTS, run_report
+
+    results = []
+    ranges = {"all": ("", ""), "range": ("2024-01-15", "2025-06-15")}
+    for report_type in REPORTS:
+        for label, (date_from, date_to) in ranges.items():
+            out = {}
+
+            def run(report_type=report_type, date_from=date_from, date_to=date_to):
+                out["rows"] = len(run_report(report_type, date_from, date_to)["rows"])
+
+            timing = measure(run, ctx["repeat"])
+            kind = "spend" if report_type.startswith("spend") else "count"
+            results.append(_result(f"report.{report_type}.{label}", timing, kind=kind, rows=out["rows"]))
+    return results
+
+
+@case("pages")
+def page_cases(ctx) -> list[dict]:
+    """Rendered HTML pages: receipts.index (first and a later page), search and the dashboard."""
+    from app.services.receipt_query import receipt_page
+
+    client = ctx["client"]
+    page_size = ctx["app"].config["RECEIPTS_PAGE_SIZE"]
+    cursor = None
+    for _ in range(10):
+        cursor = receipt_page([], "", "", "", page_size, after=cursor)["next_cursor"] or cursor
+    db.session.remove()
+    urls = {
+        "page.receipts_index": "/receipts/",
+        "page.receipts_index_p10": f"/receipts/?after={cursor}" if cursor else "/receipts/",
+        "page.search_text": "/search/?merchant=coffee",
+        "page.home": "/",
+    }
+    results = []
+    for name, url in urls.items():
+        out = {}
+
+        def run(url=url):
+            response = client.get(url)
+            out["status"] = response.status_code
+            out["bytes"] = len(response.get_data())
+
+        results.append(_result(name, measure(run, ctx["repeat"]), status=out["status"], bytes=out["bytes"]))
+    return results
+
+
+@case("ocr")
+def ocr_cases(ctx) -> list[dict]:
+    """extract_text_and_meta throughput per sample file kind (OCR cache off)."""
+    from app.services.ocr import engine_name, extract_text_and_meta, ocr_options
+
+    options = {**ocr_options(ctx["app"].config), "cache_path": None}
+    engine = engine_name(options)
+    tesseract = engine == "tesserocr" or (engine == "pytesseract" and shutil.which("tesseract") is not None)
+    upload_folder = ctx["app"].config["UPLOAD_FOLDER"]
+    results = []
+    for kind, paths in ctx["samples"].items():
+        if not paths:
+            continue
+        out = {}
+
+        def run(paths=paths):
+            out["with_total"] = sum(
+                1 for p in paths if extract_text_and_meta(upload_folder, p, options=options)["total_cents"]
+            )
+
+        timing = measure(run, max(1, min(ctx["repeat"], 3)), warmup=0)
+        results.append(_result(
+            f"ocr.{kind}", timing, files=len(paths), with_total=out["with_total"],
+            files_per_s=round(len(paths) / (timing["median_ms"] / 1000), 2) if timing["median_ms"] else None,
+            tesseract=tesseract, engine=engine,
+        ))
+    return results
+
+
+def _text_accuracy(expected: str, text: str | None) -> float:
+    """Similarity (0..1) of OCR text to the expected text, ignoring whitespace differences."""
+    expected, text = (re.sub(r"\s+", " ", t or "").strip() for t in (expected, text))
+    return SequenceMatcher(None, expected, text, autojunk=False).ratio()
+
+
+@case("ocr_preprocess")
+def ocr_preprocess_cases(ctx) -> list[dict]:
+    """
+    OCR time and text quality with preprocessing off vs on, per sample kind that goes
+    through Tesseract. Accuracy is measured against <file>.txt where one exists.
+    """
+    from app.services.ocr import engine_name, extract_text_and_meta, ocr_options
+
+    base = {**ocr_options(ctx["app"].config), "cache_path": None}
+    upload_folder = ctx["app"].config["UPLOAD_FOLDER"]
+    results = []
+    for kind, paths in ctx["samples"].items():
+        if not paths or kind == "pdf_text":
+            continue
+        expected = {}
+        for p in paths:
+            truth = Path(upload_folder) / f"{p}.txt"
+            if truth.is_file():
+                expected[p] = truth.read_text()
+        for preprocess in (False, True):
+            options = {**base, "preprocess": preprocess}
+            out = {}
+
+            def run(paths=paths, options=options, out=out):
+                out["texts"] = {p: extract_text_and_meta(upload_folder, p, options=options) for p in paths}
+
+            timing = measure(run, max(1, min(ctx["repeat"], 3)), warmup=0)
+            metas = out["texts"].values()
+            stages = {}
+            for meta in metas:
+                for stage, seconds in meta["timings"].items():
+                    stages[stage] = stages.get(stage, 0.0) + seconds * 1000 / len(paths)
+            accuracy = [_text_accuracy(expected[p], out["texts"][p]["extracted_text"]) for p in expected]
+            results.append(_result(
+                f"ocr_preprocess.{kind}.{'on' if preprocess else 'off'}", timing, files=len(paths),
+                with_total=sum(1 for meta in metas if meta["total_cents"]),
+                accuracy=round(statistics.fmean(accuracy), 4) if accuracy else None,
+                stage_ms={stage: round(ms, 2) for stage, ms in sorted(stages.items())},
+                engine=engine_name(options),
+            ))
+    return results
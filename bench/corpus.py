@@ -0,0 +1,183 @@
+"""
+Synthetic receipt corpus: receipts with realistic OCR text (merchant line, address, date in
+one of the formats the parser knows, item lines, subtotal/VAT/total, payment lines), tags and
+dates spread over three years. Deterministic for a given size and seed. Rows are inserted in
+bulk with the maintenance triggers dropped; the search index, rollups and merchant dictionary
+are then rebuilt once, which is what the migrations and backfills would have produced.
+"""
+import hashlib
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+CORPUS_VERSION = 1  # bump when the generated data changes, so cached corpora are rebuilt
+INSERT_CHUNK = 10_000
+
+_PREFIXES = [
+    "ACME", "Blue Sky", "Green Leaf", "City", "Corner", "Golden", "Metro", "Sunny", "Urban", "Royal",
+    "Harbor", "Maple", "Silver", "North Star", "Riverside", "Oak", "Pioneer", "Summit", "Lakeside", "Union",
+]
+_KINDS = [
+    "Coffee", "Market", "Bakery", "Pharmacy", "Fuel", "Books", "Hardware", "Diner", "Grocery", "Electronics",
+    "Pizza", "Office Supply", "Taxi", "Hotel", "Parking",
+]
+_LEGAL = ["", "", "", " GmbH", " Inc.", " LLC", " Ltd"]
+_ITEMS = [
+    "Latte", "Croissant", "Sandwich", "Water 0.5l", "Paper A4", "Toner", "Diesel", "Unleaded 95", "Bread",
+    "Milk", "Apples", "Notebook", "Batteries", "Charger", "Room night", "City tax", "Ride", "Parking 2h",
+    "Salad", "Soup", "Cable", "Stapler", "Pens", "Aspirin", "Vitamins",
+]
+_TAGS = [
+    "travel", "food", "office", "fuel", "hotel", "client-a", "client-b", "client-c", "conference", "taxi",
+    "parking", "software", "hardware", "books", "training", "marketing", "meals", "team-event", "q1", "q2",
+    "q3", "q4", "reimbursable", "personal", "tax-deductible", "project-x", "project-y", "project-z",
+    "equipment", "misc",
+]
+_CURRENCIES = [("EUR", "€", 0.6), ("USD", "$", 0.3), ("GBP", "£", 0.1)]
+_CITIES = ["Berlin", "Munich", "Hamburg", "Austin", "Boston", "London", "Leeds", "Vienna"]
+_OCR_NOISE = str.maketrans({"O": "0", "o": "0", "l": "1", "I": "1", "S": "5"})
+
+
+def merchant_names(rng: random.Random) -> list[str]:
+    names = [f"{p} {k}" for p in _PREFIXES for k in _KINDS]
+    rng.shuffle(names)
+    return names[:200]
+
+
+def _spelling(rng: random.Random, name: str) -> str:
+    """How the merchant line comes out of OCR: legal form, store number, case, misreads."""
+    s = name + rng.choice(_LEGAL)
+    r = rng.random()
+    if r < 0.15:
+        s += f" #{rng.randint(1, 999)}"
+    elif r < 0.35:
+        s = s.upper()
+    elif r < 0.40:
+        s = s.translate(_OCR_NOISE)
+    return s
+
+
+def _format_date(rng: random.Random, d: date) -> str:
+    return rng.choice([d.isoformat(), d.strftime("%m/%d/%Y"), d.strftime("%d.%m.%Y")])
+
+
+def _money(cents: int) -> str:
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def receipt_text(rng: random.Random, merchant: str, d: date | None, currency: tuple) -> tuple[str, int, int]:
+    """(OCR text, total_cents, tax_cents) of one synthetic receipt."""
+    code, symbol, _ = currency
+    lines = [merchant, f"{rng.randint(1, 250)} Main Street", f"{rng.randint(10000, 99999)} {rng.choice(_CITIES)}"]
+    if d:
+        lines.append(f"{_format_date(rng, d)} {rng.randint(7, 22):02d}:{rng.randint(0, 59):02d}")
+    subtotal = 0
+    for _ in range(rng.randint(1, 8)):
+        qty = rng.choice([1, 1, 1, 2, 3])
+        price = rng.randint(99, 4999)
+        subtotal += qty * price
+        lines.append(f"{qty} x {rng.choice(_ITEMS)} {_money(qty * price)}")
+    tax = round(subtotal * 0.19)
+    total = subtotal + tax
+    lines += [
+        f"SUBTOTAL {_money(subtotal)}",
+        f"VAT 19% {_money(tax)}",
+        f"TOTAL {code} {symbol}{_money(total)}" if rng.random() < 0.5 else f"TOTAL {_money(total)} {code}",
+        rng.choice(["VISA ****", "MASTERCARD ****", "CASH"]) + (str(rng.randint(1000, 9999))),
+        "Thank you for your visit!",
+    ]
+    return "\n".join(lines), total, tax
+
+
+def _drop_triggers(conn) -> list[str]:
+    rows = conn.exec_driver_sql(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('receipts', 'receipt_tags')"
+    ).all()
+    for name, _ in rows:
+        conn.exec_driver_sql(f"DROP TRIGGER {name}")
+    return [sql for _, sql in rows]
+
+
+def generate_corpus(n: int, seed: int = 1, progress=None) -> dict:
+    """Fill the (empty, migrated) database of the current app with n receipts."""
+    from app import db
+    from app.services import cache, tag_index
+    from app.services.backfill import BACKFILLS, mark_finished
+    from app.services.merchants import build_dictionary
+    from app.services.rollup import rebuild_rollups
+    from app.services.search_index import fts_enabled, rebuild_search_index
+
+    rng = random.Random(seed)
+    merchants = merchant_names(rng)
+    # Few merchants get most receipts, like real spending
+    weights = [1 / (i + 1) for i in range(len(merchants))]
+    currency_weights = [w for _, _, w in _CURRENCIES]
+    end = date(2025, 12, 31)
+    start = end - timedelta(days=3 * 365)
+    span = (end - start).days
+
+    with db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO tags (name) VALUES (:name)"), [{"name": t} for t in _TAGS])
+        tag_ids = [tid for (tid,) in conn.execute(text("SELECT id FROM tags ORDER BY id"))]
+        triggers = _drop_triggers(conn)
+
+    tag_weights = [1 / (i + 1) ** 0.7 for i in range(len(tag_ids))]
+    for offset in range(0, n, INSERT_CHUNK):
+        receipts, links = [], []
+        for i in range(offset + 1, min(n, offset + INSERT_CHUNK) + 1):
+            d = start + timedelta(days=rng.randrange(span))
+            receipt_date = d if rng.random() < 0.9 else None
+            created_at = datetime.combine(d, datetime.min.time()) + timedelta(
+                days=rng.randint(0, 10), seconds=rng.randrange(86400)
+            )
+            spelling = _spelling(rng, rng.choices(merchants, weights)[0])
+            currency = rng.choices(_CURRENCIES, currency_weights)[0]
+            body, total, tax = receipt_text(rng, spelling, receipt_date, currency)
+            ext = "pdf" if rng.random() < 0.4 else "jpg"
+            receipts.append({
+                "id": i,
+                "file_path": f"bench/{i:07d}.{ext}",
+                "content_hash": hashlib.sha256(f"{seed}:{i}".encode()).hexdigest(),
+                "original_filename": f"receipt-{i}.{ext}",
+                # Same text format SQLAlchemy writes, so keyset cursors compare correctly
+                "created_at": created_at.isoformat(" ", timespec="microseconds"),
+                "receipt_date": receipt_date.isoformat() if receipt_date else None,
+                "effective_date": (receipt_date or created_at.date()).isoformat(),
+                "merchant": spelling,
+                "extracted_text": body,
+                "total_cents": total,
+                "tax_cents": tax,
+                "currency": currency[0],
+            })
+            for tag_id in set(rng.choices(tag_ids, tag_weights, k=rng.choice([0, 1, 1, 2, 2, 3]))):
+                links.append({"receipt_id": i, "tag_id": tag_id})
+        with db.engine.begin() as conn:
+            conn.execute(
+                text(
+                    "INSERT INTO receipts (id, file_path, content_hash, original_filename, created_at, receipt_date, "
+                    "effective_date, merchant, extracted_text, ocr_status, total_cents, tax_cents, currency) "
+                    "VALUES (:id, :file_path, :content_hash, :original_filename, :created_at, :receipt_date, "
+                    ":effective_date, :merchant, :extracted_text, 'done', :total_cents, :tax_cents, :currency)"
+                ),
+                receipts,
+            )
+            if links:
+                conn.execute(text("INSERT INTO receipt_tags (receipt_id, tag_id) VALUES (:receipt_id, :tag_id)"), links)
+        if progress:
+            progress(min(n, offset + INSERT_CHUNK), n)
+
+    build_dictionary()  # before the triggers return, so merchant_id updates skip rollup upkeep
+    with db.engine.begin() as conn:
+        for sql in triggers:
+            conn.exec_driver_sql(sql)
+    rebuild_rollups()
+    tag_index.invalidate()  # rows went in without the change log triggers
+    cache.clear()  # ...and without the cache version triggers
+    if fts_enabled():
+        rebuild_search_index()
+    for name in BACKFILLS:
+        mark_finished(name)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    return {"receipts": n, "merchants": len(merchants), "tags": len(tag_ids)}
@@ -0,0 +1,102 @@
+"""
+Sample receipt files for OCR throughput: PNG images (Tesseract), phone-style photos (large
+JPEG of a tilted receipt on a table, stored sideways with an EXIF orientation), PDFs with a
+text layer (no OCR needed) and image-only PDFs (rasterize + Tesseract). Each sample's text is
+written next to it as <file>.txt for accuracy checks. Needs Pillow; PDFs need PyMuPDF.
+"""
+import random
+from pathlib import Path
+
+from bench.corpus import merchant_names, receipt_text
+
+try:
+    from PIL import Image, ImageChops, ImageDraw, ImageFont
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    import pymupdf
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+SAMPLES_DIR = "bench-samples"
+KINDS = ("png", "photo", "pdf_text", "pdf_scanned")
+EXIF_ORIENTATION = 0x0112
+
+
+def _render_png(body: str, dest: Path) -> None:
+    font = ImageFont.load_default()
+    lines = body.splitlines()
+    img = Image.new("L", (900, 60 + 36 * len(lines)), 255)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((40, 30 + 36 * i), line, fill=0, font=font)
+    # Scanner-like resolution: upscale the bitmap font to ~300 DPI glyph sizes
+    img.resize((img.width * 2, img.height * 2)).save(dest, "PNG")
+
+
+def _render_photo(png: Path, dest: Path, rng: random.Random) -> None:
+    """12 MP photo of the receipt: tilted, on a darker table, light falling off to one side."""
+    with Image.open(png) as receipt:
+        receipt = receipt.resize((receipt.width * 3 // 2, receipt.height * 3 // 2)).convert("L")
+    receipt = receipt.rotate(rng.uniform(-6, 6), resample=Image.BICUBIC, expand=True, fillcolor=90)
+    photo = Image.linear_gradient("L").resize((4000, 3000)).point(lambda v: 70 + v // 6)
+    shade = Image.linear_gradient("L").rotate(90).resize(receipt.size).point(lambda v: 255 - v // 5)
+    photo.paste(
+        ImageChops.multiply(receipt, shade).crop((0, 0, receipt.width, min(receipt.height, 3000))),
+        ((4000 - receipt.width) // 2, max(0, (3000 - receipt.height) // 2)),
+    )
+    # Stored as the camera wrote it (sideways) with an EXIF tag telling viewers to rotate
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    photo.rotate(90, expand=True).convert("RGB").save(dest, "JPEG", quality=88, exif=exif)
+
+
+def _render_pdf_text(body: str, dest: Path) -> None:
+    with pymupdf.open() as doc:
+        page = doc.new_page(width=300, height=40 + 14 * len(body.splitlines()))
+        page.insert_text((20, 30), body, fontsize=10)
+        doc.save(dest)
+
+
+def _render_pdf_scanned(png: Path, dest: Path) -> None:
+    with pymupdf.open() as doc:
+        page = doc.new_page(width=300, height=400)
+        page.insert_image(page.rect, filename=str(png))
+        doc.save(dest)
+
+
+def local_samples(directory: str) -> list[str]:
+    """Absolute paths of the receipt files in directory (joined onto UPLOAD_FOLDER they stay as-is)."""
+    return sorted(
+        str(p.resolve()) for p in Path(directory).iterdir()
+        if p.suffix.lower() in (".pdf", ".jpg", ".jpeg", ".png")
+    )
+
+
+def write_samples(upload_folder: str, per_kind: int = 5, seed: int = 1) -> dict[str, list[str]]:
+    """Create sample files under UPLOAD_FOLDER; returns kind -> file paths relative to it."""
+    rng = random.Random(seed)
+    merchants = merchant_names(rng)
+    root = Path(upload_folder) / SAMPLES_DIR
+    root.mkdir(parents=True, exist_ok=True)
+    files = {kind: [] for kind in KINDS}
+    if not PIL_AVAILABLE:
+        return files
+    for i in range(per_kind):
+        body, _, _ = receipt_text(rng, rng.choice(merchants), None, ("EUR", "€", 1))
+        png = root / f"sample-{i}.png"
+        _render_png(body, png)
+        written = {"png": png, "photo": root / f"sample-{i}-photo.jpg"}
+        _render_photo(png, written["photo"], rng)
+        if PYMUPDF_AVAILABLE:
+            written["pdf_text"] = root / f"sample-{i}-text.pdf"
+            written["pdf_scanned"] = root / f"sample-{i}-scan.pdf"
+            _render_pdf_text(body, written["pdf_text"])
+            _render_pdf_scanned(png, written["pdf_scanned"])
+        for kind, path in written.items():
+            Path(f"{path}.txt").write_text(body)
+            files[kind].append(f"{SAMPLES_DIR}/{path.name}")
+    return files
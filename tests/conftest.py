@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test")  # config refuses to load without one
+
+from app import create_app  # noqa: E402
+from app.config import Config  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """create_app() against a database and upload folder in tmp_path; call again to restart."""
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'receipts.db'}")
+    monkeypatch.setattr(Config, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setattr(Config, "OCR_CACHE_PATH", "")
+    monkeypatch.setattr(Config, "CACHE_PATH", "")
+    monkeypatch.setattr(Config, "METRICS_TEXTFILE_DIR", str(tmp_path / "metrics"))
+    return create_app
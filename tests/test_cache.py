@@ -0,0 +1,84 @@
+import sqlite3
+
+from app import db
+from app.config import Config
+from app.models import Receipt, Tag
+from app.services import cache
+from app.services.jobs import claim_next, complete_job, enqueue_ocr
+
+
+def _receipt(name, **fields):
+    receipt = Receipt(file_path=name, original_filename=name, **fields)
+    db.session.add(receipt)
+    db.session.flush()
+    return receipt
+
+
+def _card_misses(app, receipt_id):
+    """Render the card in a fresh request, as the receipt list would; card cache misses so far."""
+    with app.app_context(), app.test_request_context("/"):  # own g, so versions are read again
+        cache.receipt_card(db.session.get(Receipt, receipt_id))
+    return cache.stats()["caches"]["receipt_card"]["miss"]
+
+
+def test_cards_survive_unrelated_writes_and_follow_their_receipt(make_app):
+    app = make_app()
+    cache.clear()
+    with app.app_context():
+        card = _receipt("card.png", merchant="Bakery", total_cents=450, currency="EUR")
+        card.tags.append(Tag(name="food"))
+        other = _receipt("other.png")
+        enqueue_ocr(other)
+        db.session.commit()
+        card_id, other_id = card.id, other.id
+        misses = _card_misses(app, card_id)
+
+        # Upload, tag assignment and OCR completion on other receipts
+        _receipt("upload.png")
+        other = db.session.get(Receipt, other_id)
+        other.tags.append(Tag(name="travel"))
+        db.session.commit()
+        job = claim_next("w1")
+        complete_job(job.id, {"extracted_text": "COFFEE SHOP\ntotal 3.20", "merchant": "Coffee Shop"}, "w1")
+        assert _card_misses(app, card_id) == misses
+
+        db.session.get(Receipt, card_id).merchant = "Bakery & Co"
+        db.session.commit()
+        assert _card_misses(app, card_id) == misses + 1
+
+        card = db.session.get(Receipt, card_id)
+        card.tags.append(Tag.query.filter_by(name="travel").one())
+        db.session.commit()
+        assert _card_misses(app, card_id) == misses + 2
+
+        Tag.query.filter_by(name="food").one().name = "groceries"
+        db.session.commit()
+        assert _card_misses(app, card_id) == misses + 3
+        assert _card_misses(app, card_id) == misses + 3
+
+
+def test_shared_file_serves_other_processes_and_keeps_its_totals(make_app, tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    monkeypatch.setattr(Config, "CACHE_PATH", path)
+    app = make_app()
+    app.config["CACHE_MAX_BYTES"] = 2000
+    cache.clear()
+    with app.app_context():
+        for i in range(50):
+            cache.get_or_compute("test", str(i), lambda i=i: "x" * 100 + str(i))
+            with sqlite3.connect(path) as conn:
+                entries, size = conn.execute("SELECT count(*), sum(size) FROM app_cache").fetchone()
+            assert cache.stats(path)["shared"] == {"entries": entries, "bytes": size}
+            assert size <= 2000
+
+        cache.clear()  # as if another worker asks: only the shared file has the entry
+        with sqlite3.connect(path) as conn:
+            (touched,) = conn.execute("SELECT last_access FROM app_cache WHERE key = 'test:49'").fetchone()
+        assert cache.get_or_compute("test", "49", lambda: None) == "x" * 100 + "49"
+        assert cache.stats()["caches"]["test"]["shared_hit"] == 1
+        with sqlite3.connect(path) as conn:  # a fresh hit is not written back
+            row = conn.execute("SELECT last_access FROM app_cache WHERE key = 'test:49'").fetchone()
+        assert row == (touched,)
+
+        cache.clear_shared(path)
+        assert cache.stats(path)["shared"] == {"entries": 0, "bytes": 0}
@@ -0,0 +1,129 @@
+import hashlib
+import io
+import threading
+from pathlib import Path
+
+import pytest
+
+from app import db
+from app.models import UploadSession
+from app.services.chunked_upload import UploadError, create_session, finalize, part_path, write_chunk
+
+CHUNK = 100
+DATA = bytes(range(256)) * 2  # 512 bytes: five full chunks and one of 12
+ALLOWED = {"png"}
+
+
+def _open(upload_folder, data=DATA):
+    return create_session("a.png", len(data), upload_folder, ALLOWED, 10**6, CHUNK)
+
+
+def _put(session, index, upload_folder, data=DATA):
+    chunk = data[index * CHUNK:(index + 1) * CHUNK]
+    return write_chunk(session, index, io.BytesIO(chunk), len(chunk), upload_folder)
+
+
+def test_repeated_and_cut_off_chunks_leave_a_correct_staging_file(make_app):
+    app = make_app()
+    upload_folder = app.config["UPLOAD_FOLDER"]
+    with app.app_context():
+        session = _open(upload_folder)
+        _put(session, 0, upload_folder)
+        assert _put(session, 0, upload_folder)["received"] == CHUNK  # lost response, retried
+        with pytest.raises(UploadError):  # connection dropped halfway through chunk 1
+            write_chunk(session, 1, io.BytesIO(DATA[CHUNK:CHUNK + 40]), CHUNK, upload_folder)
+        assert part_path(upload_folder, session.id).stat().st_size == CHUNK
+        for index in range(1, 6):
+            state = _put(session, index, upload_folder)
+        assert state["received"] == len(DATA)
+        assert part_path(upload_folder, session.id).read_bytes() == DATA
+
+        file_path, _, content_hash = finalize(session, upload_folder)
+        assert content_hash == hashlib.sha256(DATA).hexdigest()
+        assert (Path(upload_folder) / file_path).read_bytes() == DATA
+
+
+def test_finalize_rejects_a_truncated_staging_file(make_app):
+    app = make_app()
+    upload_folder = app.config["UPLOAD_FOLDER"]
+    with app.app_context():
+        session = _open(upload_folder)
+        for index in range(6):
+            _put(session, index, upload_folder)
+        with open(part_path(upload_folder, session.id), "r+b") as f:
+            f.truncate(CHUNK)  # e.g. a cut-off retry in another process
+        with pytest.raises(UploadError) as e:
+            finalize(session, upload_folder)
+        assert e.value.status == 409
+
+
+class _StalledStream:
+    """Request body whose client stops sending after the first bytes until released."""
+
+    def __init__(self, data):
+        self.data, self.pos = data, 0
+        self.started, self.release = threading.Event(), threading.Event()
+
+    def read(self, n):
+        if self.pos:
+            self.started.set()
+            self.release.wait(5)
+        out = self.data[self.pos:self.pos + min(n, 10)]
+        self.pos += len(out)
+        return out
+
+
+def test_slow_chunk_blocks_only_its_own_session(make_app):
+    app = make_app()
+    upload_folder = app.config["UPLOAD_FOLDER"]
+    with app.app_context():
+        slow_id, fast_id = _open(upload_folder).id, _open(upload_folder).id
+    stream = _StalledStream(DATA[:CHUNK])
+    errors = []
+
+    def slow_put():
+        with app.app_context():
+            try:
+                write_chunk(db.session.get(UploadSession, slow_id), 0, stream, CHUNK, upload_folder)
+            except Exception as e:
+                errors.append(e)
+
+    fast_done = threading.Event()
+
+    def fast_put():
+        with app.app_context():
+            _put(db.session.get(UploadSession, fast_id), 0, upload_folder)
+            fast_done.set()
+
+    slow = threading.Thread(target=slow_put)
+    slow.start()
+    try:
+        assert stream.started.wait(5)
+        fast = threading.Thread(target=fast_put)
+        fast.start()
+        # Another session proceeds while the slow request holds its own session's lock
+        assert fast_done.wait(2)
+    finally:
+        stream.release.set()
+        slow.join(5)
+        fast.join(5)
+    assert not errors
+    with app.app_context():
+        assert db.session.get(UploadSession, slow_id).received_bytes == CHUNK
+        assert db.session.get(UploadSession, fast_id).received_bytes == CHUNK
+
+
+def test_finalize_api_answers_with_the_notice_instead_of_flashing(make_app):
+    app = make_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    client = app.test_client()
+    state = client.post("/receipts/uploads", json={"filename": "a.png", "size": 12}).get_json()
+    client.put(f"/receipts/uploads/{state['id']}/chunks/0", data=b"\x89PNG receipt")
+    result = client.post(f"/receipts/uploads/{state['id']}/finalize").get_json()
+
+    assert result["created"] and result["message"].startswith("Uploaded a.png")
+    with client.session_transaction() as session:
+        assert "_flashes" not in session
+    page = client.get(result["url"]).get_data(as_text=True)
+    assert "Uploaded a.png" in page
+    assert "Uploaded a.png" not in client.get(f"/receipts/{result['receipt_id']}").get_data(as_text=True)
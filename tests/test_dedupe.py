@@ -0,0 +1,41 @@
+import hashlib
+from pathlib import Path
+
+from app import db
+from app.models import Receipt, Tag
+from app.services.dedupe import rehash_and_dedupe
+from app.services.storage import content_path
+
+CONTENT = b"same receipt scanned twice"
+
+
+def test_older_legacy_receipt_is_kept_over_newer_hashed_duplicate(make_app):
+    app = make_app()
+    upload_folder = Path(app.config["UPLOAD_FOLDER"])
+    content_hash = hashlib.sha256(CONTENT).hexdigest()
+    hashed_path = content_path(content_hash, "png")
+    (upload_folder / "legacy.png").write_bytes(CONTENT)
+    (upload_folder / hashed_path).parent.mkdir(parents=True)
+    (upload_folder / hashed_path).write_bytes(CONTENT)
+
+    with app.app_context():
+        legacy = Receipt(file_path="legacy.png", original_filename="a.png", extracted_text="OCR text")
+        legacy.tags.append(Tag(name="travel"))
+        db.session.add(legacy)
+        db.session.flush()
+        newer = Receipt(file_path=hashed_path, original_filename="a.png", content_hash=content_hash)
+        newer.tags.append(Tag(name="food"))
+        db.session.add(newer)
+        db.session.commit()
+        legacy_id = legacy.id
+
+        stats = rehash_and_dedupe(str(upload_folder))
+
+        assert stats["merged"] == 1 and stats["moved"] == 1
+        (kept,) = Receipt.query.all()
+        assert kept.id == legacy_id
+        assert kept.extracted_text == "OCR text"
+        assert kept.content_hash == content_hash and kept.file_path == hashed_path
+        assert sorted(t.name for t in kept.tags) == ["food", "travel"]
+    assert (upload_folder / hashed_path).read_bytes() == CONTENT
+    assert not (upload_folder / "legacy.png").exists()
@@ -0,0 +1,39 @@
+import io
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage
+
+from app.models import Receipt
+from app.services.ingest import create_receipt, ingest_files
+from app.services.storage import save_stream
+
+CONTENT = b"\x89PNG same bytes"
+ALLOWED = {"pdf", "png", "jpg", "jpeg"}
+
+
+def _stored_files(upload_folder: Path) -> list[Path]:
+    return [p for p in upload_folder.rglob("*") if p.is_file() and ".incoming" not in p.parts]
+
+
+def test_same_bytes_with_another_extension_leave_one_file(make_app):
+    app = make_app()
+    upload_folder = app.config["UPLOAD_FOLDER"]
+    with app.app_context():
+        for name in ("a.jpg", "a.JPEG", "a.png"):
+            file_path, original, content_hash = save_stream(io.BytesIO(CONTENT), name, upload_folder, ALLOWED)
+            receipt, _ = create_receipt(file_path, original, content_hash, upload_folder)
+        assert Receipt.query.count() == 1
+        assert [p.name for p in _stored_files(Path(upload_folder))] == [Path(receipt.file_path).name]
+
+
+def test_batch_with_same_bytes_under_other_names_leaves_one_file(make_app):
+    app = make_app()
+    upload_folder = app.config["UPLOAD_FOLDER"]
+    with app.app_context():
+        files = [FileStorage(io.BytesIO(CONTENT), filename=name) for name in ("a.png", "b.jpeg", "c.jpg")]
+        results = ingest_files(files, upload_folder, ALLOWED, 1024 * 1024, 10)
+        assert [r["status"] for r in results] == ["added", "duplicate", "duplicate"]
+        results = ingest_files([FileStorage(io.BytesIO(CONTENT), filename="d.pdf")], upload_folder, ALLOWED, 1024 * 1024, 10)
+        assert results[0]["status"] == "duplicate"
+        (receipt,) = Receipt.query.all()
+        assert [p.name for p in _stored_files(Path(upload_folder))] == [Path(receipt.file_path).name]
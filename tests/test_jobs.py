@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import OCR_DONE, OCR_PENDING, OCR_RUNNING, OcrJob, Receipt
+from app.services.jobs import claim_next, complete_job, enqueue_ocr, renew_leases, requeue_stale
+
+LEASE = 60
+
+
+def _queue_receipt():
+    receipt = Receipt(file_path="a.png", original_filename="a.png")
+    db.session.add(receipt)
+    db.session.flush()
+    enqueue_ocr(receipt)
+    db.session.commit()
+    return receipt
+
+
+def _age_lease(job_id, seconds):
+    OcrJob.query.filter_by(id=job_id).update({OcrJob.locked_at: datetime.utcnow() - timedelta(seconds=seconds)})
+    db.session.commit()
+
+
+def test_long_running_job_keeps_its_lease_while_renewed(make_app):
+    with make_app().app_context():
+        _queue_receipt()
+        job = claim_next("w1")
+        for _ in range(3):  # runs three leases long, renewed in between
+            _age_lease(job.id, LEASE - 1)
+            renew_leases("w1", [job.id])
+            assert requeue_stale(LEASE) == 0
+        assert db.session.get(OcrJob, job.id).status == OCR_RUNNING
+        assert claim_next("w2") is None
+
+        complete_job(job.id, {"extracted_text": "total 1.00"}, "w1")
+        job = db.session.get(OcrJob, job.id)
+        assert job.status == OCR_DONE and job.attempts == 1
+
+
+def test_outcome_of_a_requeued_and_reclaimed_job_is_discarded(make_app):
+    with make_app().app_context():
+        receipt = _queue_receipt()
+        job = claim_next("w1")
+        _age_lease(job.id, LEASE + 1)  # w1 stopped renewing (crashed or hung)
+        assert requeue_stale(LEASE) == 1
+        assert db.session.get(OcrJob, job.id).status == OCR_PENDING
+        assert claim_next("w2").id == job.id
+
+        complete_job(job.id, {"extracted_text": "stale run"}, "w1")
+        job = db.session.get(OcrJob, job.id)
+        assert job.status == OCR_RUNNING and job.locked_by == "w2"
+        assert db.session.get(Receipt, receipt.id).extracted_text is None
+
+
+def test_worker_survives_failing_housekeeping(make_app, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+
+    from app.services import jobs
+
+    def locked(*args):
+        raise OperationalError("UPDATE", {}, Exception("database is locked"))
+
+    def unlink_failed(*args):
+        raise OSError("Permission denied")
+
+    app = make_app()
+    monkeypatch.setattr(jobs, "pending_backfills", lambda: ["receipts_amounts"])
+    monkeypatch.setattr(jobs, "run_batch", locked)
+    monkeypatch.setattr(jobs.tag_index, "prune_log", locked)
+    monkeypatch.setattr(jobs, "cleanup_sessions", unlink_failed)
+    with app.app_context():
+        jobs.run_worker(app, workers=1, once=True)  # returns once idle instead of raising
+
+
+def test_requeue_ocr_in_batches(make_app):
+    from app.services.jobs import fail_job, requeue_ocr
+
+    with make_app().app_context():
+        receipts = [_queue_receipt() for _ in range(5)]
+        db.session.add(Receipt(file_path="b.png", original_filename="b.png"))  # no job yet
+        db.session.commit()
+        job = claim_next("w1")
+        fail_job(job.id, "w1", "TesseractError", max_attempts=1, retry_delay=1)
+
+        assert requeue_ocr(failed_only=True, batch_size=2) == 1
+        assert db.session.get(Receipt, receipts[0].id).ocr_status == OCR_PENDING
+
+        assert requeue_ocr(failed_only=False, batch_size=2) == 6
+        assert OcrJob.query.count() == 6
+        assert {j.status for j in OcrJob.query} == {OCR_PENDING}
+        assert {r.ocr_status for r in Receipt.query} == {OCR_PENDING}
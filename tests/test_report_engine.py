@@ -0,0 +1,41 @@
+from sqlalchemy import text
+
+from app.services.backfill import backfill_pending, reset, run_backfill
+from app.services.report_engine import by_merchant, spend_by_merchant
+from app.services.sqlite_tuning import immediate_transaction
+
+SPELLINGS = ["ACME Coffee GmbH #12", "Acme Coffee", "ACME COFFEE"]
+
+
+def _insert_legacy_receipts():
+    """Receipts from before the merchant dictionary: merchant text, no merchant_id."""
+    with immediate_transaction() as conn:
+        for i, merchant in enumerate(SPELLINGS):
+            conn.execute(
+                text(
+                    "INSERT INTO receipts (file_path, original_filename, created_at, effective_date, "
+                    "merchant, total_cents, currency) "
+                    "VALUES (:path, :path, '2025-03-0' || :day, '2025-03-0' || :day, :merchant, 1000, 'EUR')"
+                ),
+                {"path": f"r{i}.png", "day": i + 1, "merchant": merchant},
+            )
+    reset("receipts_merchant_id")
+
+
+def test_merchant_reports_regroup_when_backfill_finishes_after_start(make_app):
+    app = make_app()
+    with app.app_context():
+        _insert_legacy_receipts()
+
+    app = make_app()  # restart with the backfill pending
+    with app.app_context():
+        assert backfill_pending("receipts_merchant_id")
+        assert len(by_merchant("", "")["rows"]) == len(SPELLINGS)
+        assert len(spend_by_merchant("", "")["rows"]) == len(SPELLINGS)
+
+        run_backfill("receipts_merchant_id")  # e.g. by the OCR worker, in another process
+        app.config["BACKFILL_RECHECK_SECONDS"] = 0
+
+        rows = by_merchant("", "")["rows"]
+        assert [count for _, count in rows] == [len(SPELLINGS)]
+        assert len(spend_by_merchant("", "")["rows"]) == 1
@@ -1,6 +1,13 @@
 """
 WSGI entry point for Gunicorn (production) or other WSGI servers.
 """
-from app import create_app
+from app import create_app, db
+from app.services import tag_index
 
 app = create_app()
+
+if app.config["TAG_INDEX"]:
+    # Build the tag bitmap index now rather than on the first tag search
+    with app.app_context():
+        tag_index.version(db.session.connection())
+        db.session.remove()